@@ -1,209 +1,1383 @@
 #include <Python.h>
+#include <pythread.h>
+#include <structmember.h>
+#include <errno.h>
+#include <fcntl.h>
+#include <stdarg.h>
+#include <stdio.h>
+#include <string.h>
+#include <time.h>
+#ifdef _WIN32
+#include <io.h>
+#include <windows.h>
+#else
+#include <unistd.h>
+#endif
 #include <sass/context.h>
 
+#ifndef O_BINARY
+#define O_BINARY 0
+#endif
+
 #if PY_MAJOR_VERSION >= 3
 #define PySass_IF_PY3(three, two) (three)
-#define PySass_Object_Bytes(o) PyUnicode_AsUTF8String(PyObject_Str(o))
 #define COLLECTIONS_ABC_MOD "collections.abc"
 #else
 #define PySass_IF_PY3(three, two) (two)
-#define PySass_Object_Bytes(o) PyObject_Str(o)
 #define COLLECTIONS_ABC_MOD "collections"
 #endif
 
-static PyObject* _to_py_value(const union Sass_Value* value);
-static union Sass_Value* _to_sass_value(PyObject* value);
+/* Not part of the limited API */
+#ifndef PYTHREAD_INVALID_THREAD_ID
+#define PYTHREAD_INVALID_THREAD_ID ((unsigned long)-1)
+#endif
+
+#ifdef _MSC_VER
+#define PySass_THREAD_LOCAL __declspec(thread)
+#else
+#define PySass_THREAD_LOCAL __thread
+#endif
+
+/* The thread state of the compile running on this thread, which custom
+ * functions and importers take the GIL back with.  PyGILState_Ensure()
+ * can't do that, as it only knows about the main interpreter. */
+static PySass_THREAD_LOCAL PyThreadState* PySass_thread_state = NULL;
+
+/* Like Py_BEGIN_ALLOW_THREADS and Py_END_ALLOW_THREADS, but the thread
+ * state is kept for callbacks.  They can nest, as a callback may compile
+ * another source. */
+#define PySass_BEGIN_COMPILE { \
+    PyThreadState* _outer_thread_state = PySass_thread_state; \
+    PySass_thread_state = PyEval_SaveThread();
+#define PySass_END_COMPILE \
+    PyEval_RestoreThread(PySass_thread_state); \
+    PySass_thread_state = _outer_thread_state; \
+}
+
+/* The free-threaded build runs callbacks of different compiles at the same
+ * time, and compile_many() shares the callbacks between its workers, so
+ * what the GIL used to guard needs a lock or an atomic operation there.
+ * The build doesn't support the limited API, so PyMutex is always there. */
+#ifdef Py_GIL_DISABLED
+#define PySass_LOCK(obj) PyMutex_Lock(&(obj)->mutex)
+#define PySass_UNLOCK(obj) PyMutex_Unlock(&(obj)->mutex)
+#ifdef _MSC_VER
+#include <intrin.h>
+#define PySass_COUNT_CALL(callback) \
+    _InterlockedIncrement64((volatile __int64*)&(callback)->calls)
+#else
+#define PySass_COUNT_CALL(callback) \
+    __atomic_add_fetch(&(callback)->calls, 1, __ATOMIC_RELAXED)
+#endif
+#else
+#define PySass_LOCK(obj)
+#define PySass_UNLOCK(obj)
+#define PySass_COUNT_CALL(callback) ((callback)->calls += 1)
+#endif
+
+/* The Python objects that value conversions and failed compiles need.
+ * The value types are made when the module is initialized, but SassMap
+ * and the exceptions live in sass, which imports _sass, so the rest is
+ * looked up the first time they're needed; see _load_state(). */
+struct PySass_State {
+    PyObject* number_type;
+    PyObject* color_type;
+    PyObject* list_type;
+    PyObject* warning_type;
+    PyObject* error_type;
+    PyObject* separator_comma;
+    PyObject* separator_space;
+    PyObject* map_type;
+    PyObject* map_proxy_type;
+    PyObject* map_ref_type;
+    PyObject* mapping_type;
+    PyObject* cancelled_type;
+    PyObject* timeout_type;
+    PyObject* limit_type;
+    PyObject* kinds;  /* type -> enum PySass_Kind, see _value_kind() */
+#ifdef Py_GIL_DISABLED
+    PyMutex mutex;  /* guards loading the rest; see _load_state() */
+#endif
+};
+
+#if PY_MAJOR_VERSION >= 3
+#define PySass_GetState(module) \
+    ((struct PySass_State*)PyModule_GetState(module))
+#else
+static struct PySass_State PySass_state;
+#define PySass_GetState(module) (&PySass_state)
+#endif
+
+struct PySass_Options;
+
+/* What custom functions and importers get as their libsass cookie */
+struct PySass_Callback {
+    PyObject* callable;
+    struct PySass_State* state;
+    struct PySass_Options* opts;  /* to tell if the compile should stop */
+    /* An importer is only called for the paths which start with prefix,
+     * and in which pattern.search() finds something; see
+     * _call_py_importer_f() */
+    const char* prefix;  /* or NULL */
+    size_t prefix_size;
+    PyObject* pattern;  /* or Py_None */
+    int lazy;  /* whether a function gets SassMapProxy instead of SassMap */
+    PyObject* cache;  /* the FunctionCache of a pure function, or Py_None */
+    Py_ssize_t calls;  /* counted by PySass_COUNT_CALL() */
+    /* Seconds a function took, measured only if profile is set; see
+     * _profile_call() */
+    int profile;
+    double total_time;
+    double max_time;
+    double arguments_time;
+    double call_time;
+    double result_time;
+#ifdef Py_GIL_DISABLED
+    PyMutex mutex;  /* guards the times */
+#endif
+};
+
+struct PySass_Options {
+    enum Sass_Output_Style output_style;
+    int source_comments;
+    char* include_paths;
+    int precision;
+    PyObject* custom_functions;
+    int indented;
+    PyObject* custom_importers;
+    int source_map_contents;
+    int source_map_embed;
+    int omit_source_map_url;
+    PyObject* source_map_root;
+    char* plugin_paths;
+    Py_ssize_t max_output_bytes;  /* or negative for no limit */
+    PyObject* variables;  /* a capsule of struct PySass_Variables, or None */
+    PyObject* cancel;  /* None, or what has is_set() e.g. threading.Event */
+    double deadline;   /* by _monotonic(), or negative for none */
+    /* The enum PySass_Stop a callback made a compile fail with, if any;
+     * only ever set from PYSASS_RUNNING to a reason, so racing callbacks
+     * of a batch agree */
+    int stopped;
+    PyObject* profiler;  /* what the profiles are reported to, or Py_None */
+    /* The cookies of the custom functions followed by those of the custom
+     * importers; they are shared by every context compiled with these
+     * options.  See _init_callbacks(). */
+    struct PySass_Callback* callbacks;
+};
+
+/* Why a compile stops before it finishes; see _should_stop() */
+enum PySass_Stop {
+    PYSASS_RUNNING,
+    PYSASS_CANCELLED,
+    PYSASS_TIMED_OUT
+};
+
+static const char* PySass_stop_messages[] = {
+    NULL, "Compile cancelled", "Compile timed out"
+};
+
+/* Seconds on a monotonic clock, which are only compared to each other */
+static double _monotonic(void) {
+#ifdef _WIN32
+    return GetTickCount64() / 1000.0;
+#else
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return ts.tv_sec + ts.tv_nsec / 1e9;
+#endif
+}
+
+/* Returns the enum PySass_Stop of the compile.  libsass can't be
+ * interrupted, so this is only asked when it calls back into us, between
+ * its phases, and between the jobs of compile_many().  Needs the GIL
+ * unless there's no cancel; see _should_stop_nogil(). */
+static int _should_stop(struct PySass_Options* opts) {
+    if (opts->deadline >= 0 && _monotonic() >= opts->deadline) {
+        return PYSASS_TIMED_OUT;
+    }
+    if (opts->cancel != Py_None) {
+        PyObject* is_set = PyObject_CallMethod(opts->cancel, "is_set", NULL);
+        int cancelled = is_set == NULL ? -1 : PyObject_IsTrue(is_set);
+        Py_XDECREF(is_set);
+        if (cancelled < 0) {
+            /* There's nobody to raise it to */
+            PyErr_WriteUnraisable(opts->cancel);
+        } else if (cancelled) {
+            return PYSASS_CANCELLED;
+        }
+    }
+    return PYSASS_RUNNING;
+}
+
+static int _should_stop_nogil(struct PySass_Options* opts) {
+    int stop;
+    if (opts->cancel == Py_None) return _should_stop(opts);
+    PyEval_RestoreThread(PySass_thread_state);
+    stop = _should_stop(opts);
+    PyEval_SaveThread();
+    return stop;
+}
+
+/* How a Python value is converted to a Sass value */
+enum PySass_Kind {
+    PYSASS_UNKNOWN,
+    PYSASS_NULL,
+    PYSASS_BOOLEAN,
+    PYSASS_UNICODE,
+    PYSASS_BYTES,
+    PYSASS_MAPPING,
+    PYSASS_MAP_PROXY,
+    PYSASS_NUMBER,
+    PYSASS_COLOR,
+    PYSASS_LIST,
+    PYSASS_WARNING,
+    PYSASS_ERROR
+};
 
 static union Sass_Value* _color_to_sass_value(PyObject* value);
 static union Sass_Value* _number_to_sass_value(PyObject* value);
-static union Sass_Value* _list_to_sass_value(PyObject* value);
-static union Sass_Value* _mapping_to_sass_value(PyObject* value);
 static union Sass_Value* _unicode_to_sass_value(PyObject* value);
 static union Sass_Value* _warning_to_sass_value(PyObject* value);
 static union Sass_Value* _error_to_sass_value(PyObject* value);
 static union Sass_Value* _unknown_type_to_sass_error(PyObject* value);
 static union Sass_Value* _exception_to_sass_error();
 
+/* The Sass value types are namedtuple-like tuple subclasses implemented
+ * here so that passing values to custom functions runs no Python code.
+ * They make instances with tuple's own __new__, which the limited API only
+ * lets us look up on a heap type; see PySass_init_types().  It's the only
+ * global, and is the same function whichever interpreter looks it up. */
+static newfunc PySass_tuple_new;
+
+/* type(*items) where items are built from format by Py_BuildValue(), but
+ * without the coercions of type.__new__, for items known to be right */
+static PyObject* _make_value(PyObject* type, const char* format, ...) {
+    va_list va;
+    PyObject* items;
+    PyObject* args = NULL;
+    PyObject* retv = NULL;
+
+    va_start(va, format);
+    items = Py_VaBuildValue(format, va);
+    va_end(va);
+    if (items != NULL) args = PyTuple_Pack(1, items);
+    if (args != NULL) {
+        retv = PySass_tuple_new((PyTypeObject*)type, args, NULL);
+    }
+    Py_XDECREF(items);
+    Py_XDECREF(args);
+    return retv;
+}
+
+static PyObject* _unicode_or_decode(PyObject* value) {
+    if (value == NULL || PyUnicode_Check(value)) {
+        Py_XINCREF(value);
+        return value;
+    }
+    return PyObject_CallMethod(value, "decode", "s", "UTF-8");
+}
+
+static PyObject* _assertion_error(PyObject* value) {
+    PyObject* args = PyTuple_Pack(1, value);
+    if (args != NULL) {
+        PyErr_SetObject(PyExc_AssertionError, args);
+        Py_DECREF(args);
+    }
+    return NULL;
+}
+
+static PyObject* PySass_number_new(
+        PyTypeObject* type, PyObject* args, PyObject* kwargs
+) {
+    static char* kwlist[] = {"value", "unit", NULL};
+    PyObject *value, *unit;
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "OO:SassNumber", kwlist,
+                                     &value, &unit)) {
+        return NULL;
+    }
+    return _make_value(
+        (PyObject*)type, "(NN)",
+        PyNumber_Float(value), _unicode_or_decode(unit)
+    );
+}
 
-static PyObject* _to_py_value(const union Sass_Value* value) {
+static PyObject* PySass_color_new(
+        PyTypeObject* type, PyObject* args, PyObject* kwargs
+) {
+    static char* kwlist[] = {"r", "g", "b", "a", NULL};
+    PyObject *r, *g, *b, *a;
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "OOOO:SassColor", kwlist,
+                                     &r, &g, &b, &a)) {
+        return NULL;
+    }
+    return _make_value(
+        (PyObject*)type, "(NNNN)",
+        PyNumber_Float(r), PyNumber_Float(g),
+        PyNumber_Float(b), PyNumber_Float(a)
+    );
+}
+
+static PyObject* PySass_list_new(
+        PyTypeObject* type, PyObject* args, PyObject* kwargs
+) {
+    static char* kwlist[] = {"items", "separator", "bracketed", NULL};
+    PyObject *items, *separator, *bracketed = Py_False;
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "OO|O:SassList", kwlist,
+                                     &items, &separator, &bracketed)) {
+        return NULL;
+    }
+    if (!(items = PySequence_Tuple(items))) return NULL;
+    /* Both separators are empty tuples */
+    if (!PyTuple_Check(separator) || PyTuple_Size(separator)) {
+        Py_DECREF(items);
+        return _assertion_error(separator);
+    }
+    if (!PyBool_Check(bracketed)) {
+        Py_DECREF(items);
+        return _assertion_error(bracketed);
+    }
+    return _make_value(
+        (PyObject*)type, "(NOO)", items, separator, bracketed
+    );
+}
+
+static PyObject* PySass_message_new(
+        PyTypeObject* type, PyObject* args, PyObject* kwargs
+) {
+    static char* kwlist[] = {"msg", NULL};
+    PyObject* msg;
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O", kwlist, &msg)) {
+        return NULL;
+    }
+    return _make_value((PyObject*)type, "(N)", _unicode_or_decode(msg));
+}
+
+static PyObject* PySass_value_get(PyObject* self, void* closure) {
+    PyObject* retv = PyTuple_GetItem(self, (Py_ssize_t)closure);
+    Py_XINCREF(retv);
+    return retv;
+}
+
+static PyObject* _value_fields(PyObject* type) {
+    PyObject* fields = PyObject_GetAttrString(type, "_fields");
+    if (fields != NULL && !PyTuple_Check(fields)) {
+        PyErr_SetString(PyExc_TypeError, "_fields must be a tuple");
+        Py_CLEAR(fields);
+    }
+    return fields;
+}
+
+static PyObject* PySass_value_make(PyObject* cls, PyObject* iterable) {
+    PyObject* fields;
+    PyObject* retv = NULL;
+    PyObject* args = PyTuple_Pack(1, iterable);
+
+    if (args == NULL) return NULL;
+    if ((fields = _value_fields(cls))) {
+        retv = PySass_tuple_new((PyTypeObject*)cls, args, NULL);
+        if (retv != NULL && PyTuple_Size(retv) != PyTuple_Size(fields)) {
+            PyErr_Format(
+                PyExc_TypeError, "Expected %zd arguments, got %zd",
+                PyTuple_Size(fields), PyTuple_Size(retv)
+            );
+            Py_CLEAR(retv);
+        }
+        Py_DECREF(fields);
+    }
+    Py_DECREF(args);
+    return retv;
+}
+
+static PyObject* PySass_value_replace(
+        PyObject* self, PyObject* args, PyObject* kwargs
+) {
+    PyObject* fields;
+    PyObject* changes = NULL;
+    PyObject* items = NULL;
     PyObject* retv = NULL;
-    PyObject* types_mod = PyImport_ImportModule("sass");
-    PyObject* sass_comma = PyObject_GetAttrString(types_mod, "SASS_SEPARATOR_COMMA");
-    PyObject* sass_space = PyObject_GetAttrString(types_mod, "SASS_SEPARATOR_SPACE");
+    Py_ssize_t i;
+
+    if (PyTuple_Size(args)) {
+        PyErr_SetString(
+            PyExc_TypeError, "_replace() takes only keyword arguments"
+        );
+        return NULL;
+    }
+    if (!(fields = _value_fields((PyObject*)Py_TYPE(self)))) return NULL;
+    if (!(changes = kwargs ? PyDict_Copy(kwargs) : PyDict_New())) goto done;
+    if (!(items = PyTuple_New(PyTuple_Size(fields)))) goto done;
+    for (i = 0; i < PyTuple_Size(fields); i += 1) {
+        PyObject* field = PyTuple_GetItem(fields, i);
+        PyObject* item = PyDict_GetItemWithError(changes, field);
+        if (item != NULL) {
+            Py_INCREF(item);
+            if (PyDict_DelItem(changes, field) < 0) {
+                Py_DECREF(item);
+                goto done;
+            }
+        } else if (PyErr_Occurred()) {
+            goto done;
+        } else if ((item = PyTuple_GetItem(self, i))) {
+            Py_INCREF(item);
+        } else {
+            goto done;
+        }
+        PyTuple_SetItem(items, i, item);
+    }
+    if (PyDict_Size(changes)) {
+        PyObject* names = PyDict_Keys(changes);
+        if (names != NULL) {
+            PyErr_Format(
+                PyExc_ValueError, "Got unexpected field names: %R", names
+            );
+            Py_DECREF(names);
+        }
+        goto done;
+    }
+    retv = PySass_value_make((PyObject*)Py_TYPE(self), items);
+
+done:
+    Py_DECREF(fields);
+    Py_XDECREF(changes);
+    Py_XDECREF(items);
+    return retv;
+}
 
+static PyObject* PySass_value_asdict(PyObject* self, PyObject* unused) {
+    PyObject* fields;
+    PyObject* retv;
+    Py_ssize_t i;
+
+    if (!(fields = _value_fields((PyObject*)Py_TYPE(self)))) return NULL;
+    retv = PyDict_New();
+    for (i = 0; retv != NULL && i < PyTuple_Size(fields); i += 1) {
+        PyObject* item = PyTuple_GetItem(self, i);
+        if (
+                item == NULL ||
+                PyDict_SetItem(retv, PyTuple_GetItem(fields, i), item) < 0
+        ) {
+            Py_CLEAR(retv);
+        }
+    }
+    Py_DECREF(fields);
+    return retv;
+}
+
+static PyObject* PySass_value_getnewargs(PyObject* self, PyObject* unused) {
+    return PySequence_Tuple(self);
+}
+
+static PyObject* PySass_value_reduce(PyObject* self, PyObject* unused) {
+    return Py_BuildValue("(ON)", Py_TYPE(self), PySequence_Tuple(self));
+}
+
+/* Separators are pickled by name, so they stay singletons */
+static PyObject* PySass_separator_reduce(PyObject* self, PyObject* unused) {
+    return PyObject_GetAttrString((PyObject*)Py_TYPE(self), "__name__");
+}
+
+static PyObject* PySass_value_repr(PyObject* self) {
+    PyObject* name;
+    PyObject* fields = NULL;
+    PyObject* parts = NULL;
+    PyObject* separator = NULL;
+    PyObject* joined = NULL;
+    PyObject* retv = NULL;
+    Py_ssize_t i;
+
+    name = PyObject_GetAttrString((PyObject*)Py_TYPE(self), "__name__");
+    if (name == NULL) return NULL;
+    if (!(fields = _value_fields((PyObject*)Py_TYPE(self)))) goto done;
+    if (!(parts = PyList_New(0))) goto done;
+    for (i = 0; i < PyTuple_Size(fields) && i < PyTuple_Size(self); i += 1) {
+        PyObject* part = PyUnicode_FromFormat(
+            "%U=%R", PyTuple_GetItem(fields, i), PyTuple_GetItem(self, i)
+        );
+        if (part == NULL || PyList_Append(parts, part) < 0) {
+            Py_XDECREF(part);
+            goto done;
+        }
+        Py_DECREF(part);
+    }
+    if (!(separator = PyUnicode_FromString(", "))) goto done;
+    if (!(joined = PyUnicode_Join(separator, parts))) goto done;
+    retv = PyUnicode_FromFormat("%U(%U)", name, joined);
+
+done:
+    Py_DECREF(name);
+    Py_XDECREF(fields);
+    Py_XDECREF(parts);
+    Py_XDECREF(separator);
+    Py_XDECREF(joined);
+    return retv;
+}
+
+#define PySass_VALUE_METHODS \
+    {"_make", PySass_value_make, METH_O | METH_CLASS, \
+     "Make a new object from a sequence or iterable."}, \
+    {"_replace", (PyCFunction)(void(*)(void))PySass_value_replace, \
+     METH_VARARGS | METH_KEYWORDS, \
+     "Return a new object replacing specified fields with new values."}, \
+    {"_asdict", PySass_value_asdict, METH_NOARGS, \
+     "Return a new dict which maps field names to their values."}, \
+    {"__getnewargs__", PySass_value_getnewargs, METH_NOARGS, \
+     "Return self as a plain tuple.  Used by copy and pickle."}
+
+static PyMethodDef PySass_value_methods[] = {
+    PySass_VALUE_METHODS,
+    {"__reduce__", PySass_value_reduce, METH_NOARGS, NULL},
+    {NULL, NULL, 0, NULL}
+};
+
+static PyMethodDef PySass_separator_methods[] = {
+    PySass_VALUE_METHODS,
+    {"__reduce__", PySass_separator_reduce, METH_NOARGS, NULL},
+    {NULL, NULL, 0, NULL}
+};
+
+#define PySass_FIELD(name, index) \
+    {name, PySass_value_get, NULL, \
+     "Alias for field number " #index, (void*)(Py_ssize_t)index}
+
+#define PySass_VALUE_SLOTS \
+    {Py_tp_repr, PySass_value_repr}, \
+    {Py_tp_methods, PySass_value_methods}
+
+#define PySass_VALUE_SPEC(name, slots) \
+    {"sass." name, 0, 0, \
+     Py_TPFLAGS_DEFAULT | Py_TPFLAGS_BASETYPE, slots}
+
+static PyGetSetDef PySass_number_getset[] = {
+    PySass_FIELD("value", 0),
+    PySass_FIELD("unit", 1),
+    {NULL}
+};
+
+static PyType_Slot PySass_number_slots[] = {
+    {Py_tp_doc, "SassNumber(value, unit)"},
+    {Py_tp_new, PySass_number_new},
+    {Py_tp_getset, PySass_number_getset},
+    PySass_VALUE_SLOTS,
+    {0, NULL}
+};
+
+static PyType_Spec PySass_number_spec =
+    PySass_VALUE_SPEC("SassNumber", PySass_number_slots);
+
+static PyGetSetDef PySass_color_getset[] = {
+    PySass_FIELD("r", 0),
+    PySass_FIELD("g", 1),
+    PySass_FIELD("b", 2),
+    PySass_FIELD("a", 3),
+    {NULL}
+};
+
+static PyType_Slot PySass_color_slots[] = {
+    {Py_tp_doc, "SassColor(r, g, b, a)"},
+    {Py_tp_new, PySass_color_new},
+    {Py_tp_getset, PySass_color_getset},
+    PySass_VALUE_SLOTS,
+    {0, NULL}
+};
+
+static PyType_Spec PySass_color_spec =
+    PySass_VALUE_SPEC("SassColor", PySass_color_slots);
+
+static PyGetSetDef PySass_list_getset[] = {
+    PySass_FIELD("items", 0),
+    PySass_FIELD("separator", 1),
+    PySass_FIELD("bracketed", 2),
+    {NULL}
+};
+
+static PyType_Slot PySass_list_slots[] = {
+    {Py_tp_doc, "SassList(items, separator, bracketed=False)"},
+    {Py_tp_new, PySass_list_new},
+    {Py_tp_getset, PySass_list_getset},
+    PySass_VALUE_SLOTS,
+    {0, NULL}
+};
+
+static PyType_Spec PySass_list_spec =
+    PySass_VALUE_SPEC("SassList", PySass_list_slots);
+
+static PyGetSetDef PySass_message_getset[] = {
+    PySass_FIELD("msg", 0),
+    {NULL}
+};
+
+static PyType_Slot PySass_error_slots[] = {
+    {Py_tp_doc, "SassError(msg)"},
+    {Py_tp_new, PySass_message_new},
+    {Py_tp_getset, PySass_message_getset},
+    PySass_VALUE_SLOTS,
+    {0, NULL}
+};
+
+static PyType_Spec PySass_error_spec =
+    PySass_VALUE_SPEC("SassError", PySass_error_slots);
+
+static PyType_Slot PySass_warning_slots[] = {
+    {Py_tp_doc, "SassWarning(msg)"},
+    {Py_tp_new, PySass_message_new},
+    {Py_tp_getset, PySass_message_getset},
+    PySass_VALUE_SLOTS,
+    {0, NULL}
+};
+
+static PyType_Spec PySass_warning_spec =
+    PySass_VALUE_SPEC("SassWarning", PySass_warning_slots);
+
+/* The separators are the only instances of field-less types of their own */
+static PyType_Slot PySass_separator_slots[] = {
+    {Py_tp_repr, PySass_value_repr},
+    {Py_tp_methods, PySass_separator_methods},
+    {0, NULL}
+};
+
+static PyType_Spec PySass_comma_spec =
+    PySass_VALUE_SPEC("SASS_SEPARATOR_COMMA", PySass_separator_slots);
+
+static PyType_Spec PySass_space_spec =
+    PySass_VALUE_SPEC("SASS_SEPARATOR_SPACE", PySass_separator_slots);
+
+/* A tuple subclass which overrides nothing, to look tuple's slots up on */
+static PyType_Slot PySass_tuple_slots[] = {
+    {0, NULL}
+};
+
+static PyType_Spec PySass_tuple_spec = {
+    "_sass._tuple", 0, 0, Py_TPFLAGS_DEFAULT, PySass_tuple_slots
+};
+
+static PyObject* _make_value_type(
+        PyType_Spec* spec, const char* fields_format, ...
+) {
+    va_list va;
+    PyObject* fields;
+    PyObject* defaults;
+    PyObject* type = NULL;
+
+    va_start(va, fields_format);
+    fields = Py_VaBuildValue(fields_format, va);
+    va_end(va);
+    if (fields == NULL) return NULL;
+    if ((defaults = PyDict_New())) {
+        type = PyType_FromSpecWithBases(spec, (PyObject*)&PyTuple_Type);
+        if (type != NULL && (
+                PyObject_SetAttrString(type, "_fields", fields) < 0 ||
+                PyObject_SetAttrString(type, "_field_defaults", defaults) < 0 ||
+                PyObject_SetAttrString(type, "__match_args__", fields) < 0
+        )) {
+            Py_CLEAR(type);
+        }
+        Py_DECREF(defaults);
+    }
+    Py_DECREF(fields);
+    return type;
+}
+
+static PyObject* _make_separator(PyType_Spec* spec) {
+    PyObject* retv = NULL;
+    PyObject* type = _make_value_type(spec, "()");
+    if (type != NULL) {
+        retv = PyObject_CallObject(type, NULL);
+        Py_DECREF(type);
+    }
+    return retv;
+}
+
+static PyType_Spec PySass_map_ref_spec;
+
+static int PySass_init_types(struct PySass_State* state) {
+    PyObject* tuple_type = PyType_FromSpecWithBases(
+        &PySass_tuple_spec, (PyObject*)&PyTuple_Type
+    );
+    if (tuple_type == NULL) return -1;
+    PySass_tuple_new = (newfunc)PyType_GetSlot(
+        (PyTypeObject*)tuple_type, Py_tp_new
+    );
+    Py_DECREF(tuple_type);
+
+    if (
+            !(state->number_type = _make_value_type(
+                &PySass_number_spec, "(ss)", "value", "unit")) ||
+            !(state->color_type = _make_value_type(
+                &PySass_color_spec, "(ssss)", "r", "g", "b", "a")) ||
+            !(state->list_type = _make_value_type(
+                &PySass_list_spec, "(sss)", "items", "separator", "bracketed"
+            )) ||
+            !(state->error_type = _make_value_type(
+                &PySass_error_spec, "(s)", "msg")) ||
+            !(state->warning_type = _make_value_type(
+                &PySass_warning_spec, "(s)", "msg")) ||
+            !(state->separator_comma = _make_separator(&PySass_comma_spec)) ||
+            !(state->separator_space = _make_separator(&PySass_space_spec)) ||
+            !(state->map_ref_type = PyType_FromSpec(&PySass_map_ref_spec))
+    ) {
+        return -1;
+    }
+    return 0;
+}
+
+static int _traverse_state(struct PySass_State* state, visitproc visit,
+                           void* arg) {
+    Py_VISIT(state->number_type);
+    Py_VISIT(state->color_type);
+    Py_VISIT(state->list_type);
+    Py_VISIT(state->map_type);
+    Py_VISIT(state->map_proxy_type);
+    Py_VISIT(state->map_ref_type);
+    Py_VISIT(state->warning_type);
+    Py_VISIT(state->error_type);
+    Py_VISIT(state->mapping_type);
+    Py_VISIT(state->cancelled_type);
+    Py_VISIT(state->timeout_type);
+    Py_VISIT(state->limit_type);
+    Py_VISIT(state->separator_comma);
+    Py_VISIT(state->separator_space);
+    Py_VISIT(state->kinds);
+    return 0;
+}
+
+static void _clear_state(struct PySass_State* state) {
+    Py_CLEAR(state->number_type);
+    Py_CLEAR(state->color_type);
+    Py_CLEAR(state->list_type);
+    Py_CLEAR(state->map_type);
+    Py_CLEAR(state->map_proxy_type);
+    Py_CLEAR(state->map_ref_type);
+    Py_CLEAR(state->warning_type);
+    Py_CLEAR(state->error_type);
+    Py_CLEAR(state->mapping_type);
+    Py_CLEAR(state->cancelled_type);
+    Py_CLEAR(state->timeout_type);
+    Py_CLEAR(state->limit_type);
+    Py_CLEAR(state->separator_comma);
+    Py_CLEAR(state->separator_space);
+    Py_CLEAR(state->kinds);
+}
+
+static int _load_state(struct PySass_State* state) {
+    PyObject* types_mod;
+    PyObject* collections_mod;
+    PyObject* map_type = NULL;
+    PyObject* map_proxy_type = NULL;
+    PyObject* mapping_type = NULL;
+    PyObject* cancelled_type = NULL;
+    PyObject* timeout_type = NULL;
+    PyObject* limit_type = NULL;
+    PyObject* kinds = NULL;
+    int loaded;
+
+    /* The lock also makes what another thread loaded visible as a whole */
+    PySass_LOCK(state);
+    loaded = state->kinds != NULL;
+    PySass_UNLOCK(state);
+    if (loaded) return 0;
+    if (!(types_mod = PyImport_ImportModule("sass"))) return -1;
+    if (!(collections_mod = PyImport_ImportModule(COLLECTIONS_ABC_MOD))) {
+        Py_DECREF(types_mod);
+        return -1;
+    }
+    if (
+            (map_type = PyObject_GetAttrString(types_mod, "SassMap")) &&
+            (map_proxy_type = PyObject_GetAttrString(
+                types_mod, "SassMapProxy"
+            )) &&
+            (cancelled_type = PyObject_GetAttrString(
+                types_mod, "CompileCancelled"
+            )) &&
+            (timeout_type = PyObject_GetAttrString(
+                types_mod, "CompileTimeout"
+            )) &&
+            (limit_type = PyObject_GetAttrString(
+                types_mod, "CompileLimitExceeded"
+            )) &&
+            (mapping_type = PyObject_GetAttrString(collections_mod, "Mapping"))
+    ) {
+        kinds = PyDict_New();
+    }
+    Py_DECREF(types_mod);
+    Py_DECREF(collections_mod);
+    /* Importing may have let another thread load them meanwhile */
+    PySass_LOCK(state);
+    loaded = kinds == NULL || state->kinds != NULL;
+    if (!loaded) {
+        state->map_type = map_type;
+        state->map_proxy_type = map_proxy_type;
+        state->mapping_type = mapping_type;
+        state->cancelled_type = cancelled_type;
+        state->timeout_type = timeout_type;
+        state->limit_type = limit_type;
+        state->kinds = kinds;
+    }
+    PySass_UNLOCK(state);
+    if (loaded) {
+        Py_XDECREF(map_type);
+        Py_XDECREF(map_proxy_type);
+        Py_XDECREF(mapping_type);
+        Py_XDECREF(cancelled_type);
+        Py_XDECREF(timeout_type);
+        Py_XDECREF(limit_type);
+        Py_XDECREF(kinds);
+        return kinds == NULL ? -1 : 0;
+    }
+    return 0;
+}
+
+/* Returns the enum PySass_Kind of value, or -1 with an exception set.
+ * The isinstance() checks, which are slow for abstract classes such as
+ * Mapping, are done once per type. */
+static int _value_kind(struct PySass_State* state, PyObject* value) {
+    PyObject* type = (PyObject*)Py_TYPE(value);
+    PyObject* cached;
+    long kind = PYSASS_UNKNOWN;
+
+    if (value == Py_None) return PYSASS_NULL;
+#ifdef Py_GIL_DISABLED
+    /* Another thread may put the same type meanwhile */
+    if (PyDict_GetItemRef(state->kinds, type, &cached) < 0) return -1;
+    if (cached) {
+        kind = PyLong_AsLong(cached);
+        Py_DECREF(cached);
+        return (int)kind;
+    }
+#else
+    if ((cached = PyDict_GetItem(state->kinds, type))) {
+        return (int)PyLong_AsLong(cached);
+    }
+#endif
+
+    if (PyBool_Check(value)) {
+        kind = PYSASS_BOOLEAN;
+    } else if (PyUnicode_Check(value)) {
+        kind = PYSASS_UNICODE;
+    } else if (PyBytes_Check(value)) {
+        kind = PYSASS_BYTES;
+    /* XXX: PyMapping_Check returns true for lists and tuples in python3 :( */
+    /* XXX: pypy derps on dicts: https://bitbucket.org/pypy/pypy/issue/1970 */
+    } else if (PyDict_Check(value)) {
+        kind = PYSASS_MAPPING;
+    } else {
+        PyObject* types[] = {
+            state->map_proxy_type, state->mapping_type, state->number_type,
+            state->color_type, state->list_type, state->warning_type,
+            state->error_type
+        };
+        long kinds[] = {
+            PYSASS_MAP_PROXY, PYSASS_MAPPING, PYSASS_NUMBER,
+            PYSASS_COLOR, PYSASS_LIST, PYSASS_WARNING, PYSASS_ERROR
+        };
+        size_t i;
+        for (i = 0; i < sizeof(kinds) / sizeof(kinds[0]); i += 1) {
+            int is_instance = PyObject_IsInstance(value, types[i]);
+            if (is_instance < 0) return -1;
+            if (is_instance) {
+                kind = kinds[i];
+                break;
+            }
+        }
+    }
+
+    if (!(cached = PyLong_FromLong(kind))) return -1;
+    if (PyDict_SetItem(state->kinds, type, cached) < 0) kind = -1;
+    Py_DECREF(cached);
+    return (int)kind;
+}
+
+/* Grows the explicit stack of a non-recursive conversion.  Returns NULL
+ * with an exception set if it can't, in which case stack is untouched. */
+static void* _grow_stack(void* stack, size_t* capacity, size_t item_size) {
+    size_t new_capacity = *capacity ? *capacity * 2 : 16;
+    void* grown = PyMem_Realloc(stack, new_capacity * item_size);
+    if (grown == NULL) {
+        PyErr_NoMemory();
+        return NULL;
+    }
+    *capacity = new_capacity;
+    return grown;
+}
+
+/* A list or map whose children _to_py_value() is still converting */
+struct PySass_PyFrame {
+    const union Sass_Value* value;
+    PyObject* items;  /* a tuple for lists, a dict for maps */
+    PyObject* key;    /* a converted map key waiting for its value */
+    size_t size;      /* number of children; maps have two per entry */
+    size_t next;      /* index of the next child to convert */
+};
+
+static PyObject* _scalar_to_py_value(
+        struct PySass_State* state, const union Sass_Value* value
+) {
     switch (sass_value_get_tag(value)) {
         case SASS_NULL:
-            retv = Py_None;
-            Py_INCREF(retv);
-            break;
+            Py_INCREF(Py_None);
+            return Py_None;
         case SASS_BOOLEAN:
-            retv = PyBool_FromLong(sass_boolean_get_value(value));
-            break;
+            return PyBool_FromLong(sass_boolean_get_value(value));
         case SASS_STRING:
-            retv = PyUnicode_FromString(sass_string_get_value(value));
-            break;
+            return PyUnicode_FromString(sass_string_get_value(value));
         case SASS_NUMBER:
-            retv = PyObject_CallMethod(
-                types_mod,
-                "SassNumber",
-                PySass_IF_PY3("dy", "ds"),
+            return _make_value(
+                state->number_type,
+                "(ds)",
                 sass_number_get_value(value),
                 sass_number_get_unit(value)
             );
-            break;
         case SASS_COLOR:
-            retv = PyObject_CallMethod(
-                types_mod,
-                "SassColor",
-                "dddd",
+            return _make_value(
+                state->color_type,
+                "(dddd)",
                 sass_color_get_r(value),
                 sass_color_get_g(value),
                 sass_color_get_b(value),
                 sass_color_get_a(value)
             );
-            break;
-        case SASS_LIST: {
-            size_t i = 0;
-            PyObject* items = PyTuple_New(sass_list_get_length(value));
-            PyObject* separator = sass_comma;
-            int is_bracketed = sass_list_get_is_bracketed(value);
-            PyObject* bracketed = PyBool_FromLong(is_bracketed);
-            switch (sass_list_get_separator(value)) {
-                case SASS_COMMA:
-                    separator = sass_comma;
-                    break;
-                case SASS_SPACE:
-                    separator = sass_space;
-                    break;
-                case SASS_HASH:
-                    assert(0);
-                    break;
+        default:
+            /* @warning and @error cannot be passed */
+            PyErr_SetString(PyExc_TypeError, "Unexpected sass type");
+            return NULL;
+    }
+}
+
+static const union Sass_Value* _py_frame_next_child(
+        struct PySass_PyFrame* frame
+) {
+    size_t i = frame->next++;
+    if (sass_value_is_list(frame->value)) {
+        return sass_list_get_value(frame->value, i);
+    } else if (i % 2 == 0) {
+        return sass_map_get_key(frame->value, i / 2);
+    }
+    return sass_map_get_value(frame->value, i / 2);
+}
+
+/* Stores the last child handed out by _py_frame_next_child(), stealing
+ * the reference to it */
+static int _py_frame_set_child(struct PySass_PyFrame* frame, PyObject* item) {
+    size_t i = frame->next - 1;
+    int retv;
+    if (sass_value_is_list(frame->value)) {
+        return PyTuple_SetItem(frame->items, i, item);
+    } else if (i % 2 == 0) {
+        frame->key = item;
+        return 0;
+    }
+    retv = PyDict_SetItem(frame->items, frame->key, item);
+    Py_CLEAR(frame->key);
+    Py_DECREF(item);
+    return retv;
+}
+
+static PyObject* _py_frame_finish(
+        struct PySass_State* state, struct PySass_PyFrame* frame
+) {
+    PyObject* retv;
+    if (sass_value_is_list(frame->value)) {
+        PyObject* separator = state->separator_comma;
+        switch (sass_list_get_separator(frame->value)) {
+            case SASS_COMMA:
+                separator = state->separator_comma;
+                break;
+            case SASS_SPACE:
+                separator = state->separator_space;
+                break;
+            case SASS_HASH:
+                assert(0);
+                break;
+        }
+        retv = _make_value(
+            state->list_type,
+            "(OOO)",
+            frame->items,
+            separator,
+            sass_list_get_is_bracketed(frame->value) ? Py_True : Py_False
+        );
+    } else {
+        retv = PyObject_CallFunctionObjArgs(
+            state->map_type, frame->items, NULL
+        );
+    }
+    Py_CLEAR(frame->items);
+    return retv;
+}
+
+static PyObject* _make_map_proxy(
+        struct PySass_State* state, const union Sass_Value* value,
+        PyObject* refs
+);
+
+/* Lists and maps are converted with an explicit stack instead of by
+ * recursion, so arbitrarily deep values can't overflow the C stack.
+ * Unless refs is NULL, maps are converted to SassMapProxy instead, and
+ * the weak references to their refs are appended to refs. */
+static PyObject* _to_py_value(
+        struct PySass_State* state, const union Sass_Value* value,
+        PyObject* refs
+) {
+    struct PySass_PyFrame* stack = NULL;
+    struct PySass_PyFrame* frame;
+    size_t depth = 0, capacity = 0;
+    PyObject* converted = NULL;
+
+    for (;;) {
+        if (sass_value_is_map(value) && refs != NULL) {
+            if (!(converted = _make_map_proxy(state, value, refs))) {
+                goto error;
             }
-            for (i = 0; i < sass_list_get_length(value); i += 1) {
-                PyTuple_SetItem(
-                    items,
-                    i,
-                    _to_py_value(sass_list_get_value(value, i))
-                );
+        } else if (sass_value_is_list(value) || sass_value_is_map(value)) {
+            if (depth == capacity) {
+                frame = _grow_stack(stack, &capacity, sizeof(*stack));
+                if (frame == NULL) goto error;
+                stack = frame;
             }
-            retv = PyObject_CallMethod(
-                types_mod, "SassList", "OOO", items, separator, bracketed
-            );
-            break;
+            frame = &stack[depth];
+            frame->value = value;
+            frame->key = NULL;
+            frame->next = 0;
+            if (sass_value_is_list(value)) {
+                frame->size = sass_list_get_length(value);
+                frame->items = PyTuple_New(frame->size);
+            } else {
+                frame->size = 2 * sass_map_get_length(value);
+                frame->items = PyDict_New();
+            }
+            if (frame->items == NULL) goto error;
+            depth += 1;
+        } else if (!(converted = _scalar_to_py_value(state, value))) {
+            goto error;
         }
-        case SASS_MAP: {
-            size_t i = 0;
-            PyObject* items = PyTuple_New(sass_map_get_length(value));
-            for (i = 0; i < sass_map_get_length(value); i += 1) {
-                PyObject* kvp = PyTuple_New(2);
-                PyTuple_SetItem(
-                    kvp, 0, _to_py_value(sass_map_get_key(value, i))
-                );
-                PyTuple_SetItem(
-                    kvp, 1, _to_py_value(sass_map_get_value(value, i))
-                );
-                PyTuple_SetItem(items, i, kvp);
+
+        /* Hand the converted value to its parent, finishing every parent
+         * that is complete, until one of them has a child left */
+        for (;;) {
+            if (depth == 0) {
+                PyMem_Free(stack);
+                return converted;
             }
-            retv = PyObject_CallMethod(types_mod, "SassMap", "(O)", items);
-            Py_DECREF(items);
-            break;
+            frame = &stack[depth - 1];
+            if (converted != NULL) {
+                int set = _py_frame_set_child(frame, converted);
+                converted = NULL;
+                if (set < 0) goto error;
+            }
+            if (frame->next < frame->size) {
+                value = _py_frame_next_child(frame);
+                break;
+            }
+            depth -= 1;
+            if (!(converted = _py_frame_finish(state, frame))) goto error;
         }
-        case SASS_ERROR:
-        case SASS_WARNING:
-            /* @warning and @error cannot be passed */
-            break;
     }
 
-    if (retv == NULL) {
-        PyErr_SetString(PyExc_TypeError, "Unexpected sass type");
+error:
+    while (depth > 0) {
+        depth -= 1;
+        Py_XDECREF(stack[depth].items);
+        Py_XDECREF(stack[depth].key);
     }
+    PyMem_Free(stack);
+    return NULL;
+}
 
-    Py_DECREF(types_mod);
-    Py_DECREF(sass_comma);
-    Py_DECREF(sass_space);
-    return retv;
+/* The libsass map behind a SassMapProxy, which lazy custom functions get
+ * instead of SassMap.  Its keys and values are converted only when they're
+ * looked up.  The map belongs to libsass only until the function returns,
+ * so the refs which outlive the call are converted as a whole by then;
+ * see _detach_map_refs(). */
+struct PySass_MapRef {
+    PyObject_HEAD
+    struct PySass_State* state;
+    const union Sass_Value* value;  /* or NULL once detached */
+    PyObject* refs;      /* where the refs of its values are tracked */
+    PyObject* keys;      /* the tuple of the converted keys, or NULL */
+    PyObject* index;     /* converted key -> its index, or NULL */
+    PyObject* detached;  /* the SassMap it was converted to, or NULL */
+    PyObject* weakrefs;
+};
+
+static PyObject* _make_map_proxy(
+        struct PySass_State* state, const union Sass_Value* value,
+        PyObject* refs
+) {
+    struct PySass_MapRef* ref;
+    PyObject* weakref;
+    PyObject* proxy;
+    int appended;
+
+    ref = (struct PySass_MapRef*)PyType_GenericAlloc(
+        (PyTypeObject*)state->map_ref_type, 0
+    );
+    if (ref == NULL) return NULL;
+    ref->state = state;
+    ref->value = value;
+    ref->refs = refs;
+    Py_INCREF(refs);
+    if (!(weakref = PyWeakref_NewRef((PyObject*)ref, NULL))) {
+        Py_DECREF(ref);
+        return NULL;
+    }
+    appended = PyList_Append(refs, weakref);
+    Py_DECREF(weakref);
+    proxy = appended < 0 ? NULL : PyObject_CallFunctionObjArgs(
+        state->map_proxy_type, (PyObject*)ref, NULL
+    );
+    Py_DECREF(ref);
+    return proxy;
 }
 
-static union Sass_Value* _color_to_sass_value(PyObject* value) {
-    union Sass_Value* retv = NULL;
-    PyObject* r_value = PyObject_GetAttrString(value, "r");
-    PyObject* g_value = PyObject_GetAttrString(value, "g");
-    PyObject* b_value = PyObject_GetAttrString(value, "b");
-    PyObject* a_value = PyObject_GetAttrString(value, "a");
-    retv = sass_make_color(
-        PyFloat_AsDouble(r_value),
-        PyFloat_AsDouble(g_value),
-        PyFloat_AsDouble(b_value),
-        PyFloat_AsDouble(a_value)
+static int _map_ref_check(struct PySass_MapRef* ref) {
+    if (ref->value == NULL && ref->detached == NULL) {
+        PyErr_SetString(
+            PyExc_RuntimeError, "the map is gone with its function call"
+        );
+        return -1;
+    }
+    return 0;
+}
+
+static PyObject* _map_ref_keys(struct PySass_MapRef* ref) {
+    size_t i, size = sass_map_get_length(ref->value);
+    PyObject* keys;
+
+    if (ref->keys != NULL) return ref->keys;
+    if (!(keys = PyTuple_New(size))) return NULL;
+    for (i = 0; i < size; i += 1) {
+        PyObject* key = _to_py_value(
+            ref->state, sass_map_get_key(ref->value, i), NULL
+        );
+        if (key == NULL) {
+            Py_DECREF(keys);
+            return NULL;
+        }
+        PyTuple_SetItem(keys, i, key);
+    }
+    ref->keys = keys;
+    return keys;
+}
+
+/* Returns the index of key, or -1 with an exception set */
+static Py_ssize_t _map_ref_find(struct PySass_MapRef* ref, PyObject* key) {
+    PyObject* found;
+    size_t i, size = sass_map_get_length(ref->value);
+
+    /* Strings, which most keys are, are compared without converting every
+     * key until a lookup needs the index anyway */
+    if (PyUnicode_Check(key) && ref->index == NULL) {
+        PyObject* bytes = PyUnicode_AsUTF8String(key);
+        if (bytes == NULL) return -1;
+        for (i = 0; i < size; i += 1) {
+            const union Sass_Value* k = sass_map_get_key(ref->value, i);
+            if (sass_value_is_string(k) &&
+                    strcmp(sass_string_get_value(k),
+                           PyBytes_AsString(bytes)) == 0) {
+                Py_DECREF(bytes);
+                return (Py_ssize_t)i;
+            }
+        }
+        Py_DECREF(bytes);
+        PyErr_SetObject(PyExc_KeyError, key);
+        return -1;
+    }
+    if (ref->index == NULL) {
+        PyObject* keys = _map_ref_keys(ref);
+        PyObject* index;
+        if (keys == NULL || !(index = PyDict_New())) return -1;
+        for (i = 0; i < size; i += 1) {
+            PyObject* position = PyLong_FromSize_t(i);
+            if (position == NULL ||
+                    PyDict_SetItem(index, PyTuple_GetItem(keys, i),
+                                   position) < 0) {
+                Py_XDECREF(position);
+                Py_DECREF(index);
+                return -1;
+            }
+            Py_DECREF(position);
+        }
+        ref->index = index;
+    }
+    if (!(found = PyDict_GetItemWithError(ref->index, key))) {
+        if (!PyErr_Occurred()) PyErr_SetObject(PyExc_KeyError, key);
+        return -1;
+    }
+    return PyLong_AsSsize_t(found);
+}
+
+static PyObject* PySass_map_ref_subscript(PyObject* self, PyObject* key) {
+    struct PySass_MapRef* ref = (struct PySass_MapRef*)self;
+    Py_ssize_t i;
+
+    if (_map_ref_check(ref) < 0) return NULL;
+    if (ref->detached) return PyObject_GetItem(ref->detached, key);
+    if ((i = _map_ref_find(ref, key)) < 0) return NULL;
+    return _to_py_value(
+        ref->state, sass_map_get_value(ref->value, i), ref->refs
     );
-    Py_DECREF(r_value);
-    Py_DECREF(g_value);
-    Py_DECREF(b_value);
-    Py_DECREF(a_value);
+}
+
+static Py_ssize_t PySass_map_ref_length(PyObject* self) {
+    struct PySass_MapRef* ref = (struct PySass_MapRef*)self;
+    if (_map_ref_check(ref) < 0) return -1;
+    if (ref->detached) return PyObject_Length(ref->detached);
+    return (Py_ssize_t)sass_map_get_length(ref->value);
+}
+
+static PyObject* PySass_map_ref_iter(PyObject* self) {
+    struct PySass_MapRef* ref = (struct PySass_MapRef*)self;
+    PyObject* keys;
+    if (_map_ref_check(ref) < 0) return NULL;
+    if (ref->detached) return PyObject_GetIter(ref->detached);
+    if (!(keys = _map_ref_keys(ref))) return NULL;
+    return PyObject_GetIter(keys);
+}
+
+static void PySass_map_ref_dealloc(PyObject* self) {
+    struct PySass_MapRef* ref = (struct PySass_MapRef*)self;
+    PyTypeObject* type = Py_TYPE(self);
+    freefunc tp_free = (freefunc)PyType_GetSlot(type, Py_tp_free);
+    if (ref->weakrefs != NULL) PyObject_ClearWeakRefs(self);
+    Py_XDECREF(ref->refs);
+    Py_XDECREF(ref->keys);
+    Py_XDECREF(ref->index);
+    Py_XDECREF(ref->detached);
+    tp_free(self);
+    Py_DECREF(type);
+}
+
+static PyMemberDef PySass_map_ref_members[] = {
+    {"__weaklistoffset__", T_PYSSIZET,
+     offsetof(struct PySass_MapRef, weakrefs), READONLY, NULL},
+    {NULL}
+};
+
+static PyType_Slot PySass_map_ref_slots[] = {
+    {Py_mp_subscript, PySass_map_ref_subscript},
+    {Py_mp_length, PySass_map_ref_length},
+    {Py_tp_iter, PySass_map_ref_iter},
+    {Py_tp_dealloc, PySass_map_ref_dealloc},
+    {Py_tp_members, PySass_map_ref_members},
+    {0, NULL}
+};
+
+static PyType_Spec PySass_map_ref_spec = {
+    "_sass._MapRef", sizeof(struct PySass_MapRef), 0, Py_TPFLAGS_DEFAULT,
+    PySass_map_ref_slots
+};
+
+/* Converts the refs in refs which are still alive, i.e. which outlive the
+ * function call, to SassMap as a whole, since the libsass values they
+ * refer to are going to be freed */
+static int _detach_map_refs(PyObject* refs) {
+    Py_ssize_t i;
+    int retv = 0;
+
+    for (i = 0; i < PyList_Size(refs); i += 1) {
+        /* A strong reference, as the list isn't locked on free-threaded
+         * builds; PyList_GetItemRef() isn't in the limited API */
+        PyObject* weakref = PySequence_GetItem(refs, i);
+        struct PySass_MapRef* ref;
+        PyObject* obj;
+        if (weakref == NULL) {
+            retv = -1;
+            break;
+        }
+#if PY_VERSION_HEX >= 0x030D0000
+        if (PyWeakref_GetRef(weakref, &obj) < 0) {
+            Py_DECREF(weakref);
+            retv = -1;
+            continue;
+        }
+#else
+        obj = PyWeakref_GetObject(weakref);
+        if (obj == Py_None) obj = NULL;
+        Py_XINCREF(obj);
+#endif
+        Py_DECREF(weakref);
+        if (obj == NULL) continue;
+        ref = (struct PySass_MapRef*)obj;
+        if (ref->value != NULL && retv == 0) {
+            ref->detached = _to_py_value(ref->state, ref->value, NULL);
+            if (ref->detached == NULL) retv = -1;
+        }
+        ref->value = NULL;
+        Py_CLEAR(ref->refs);
+        Py_CLEAR(ref->keys);
+        Py_CLEAR(ref->index);
+        Py_DECREF(obj);
+    }
     return retv;
 }
 
-static union Sass_Value* _list_to_sass_value(PyObject* value) {
-    PyObject* types_mod = PyImport_ImportModule("sass");
-    PyObject* sass_comma = PyObject_GetAttrString(types_mod, "SASS_SEPARATOR_COMMA");
-    PyObject* sass_space = PyObject_GetAttrString(types_mod, "SASS_SEPARATOR_SPACE");
-    union Sass_Value* retv = NULL;
-    Py_ssize_t i = 0;
-    PyObject* items = PyObject_GetAttrString(value, "items");
-    PyObject* separator = PyObject_GetAttrString(value, "separator");
-    PyObject* bracketed = PyObject_GetAttrString(value, "bracketed");
+static union Sass_Value* _color_to_sass_value(PyObject* value) {
+    double r = PyFloat_AsDouble(PyTuple_GetItem(value, 0));
+    double g = PyFloat_AsDouble(PyTuple_GetItem(value, 1));
+    double b = PyFloat_AsDouble(PyTuple_GetItem(value, 2));
+    double a = PyFloat_AsDouble(PyTuple_GetItem(value, 3));
+    if (PyErr_Occurred()) return NULL;
+    return sass_make_color(r, g, b, a);
+}
+
+/* Returns an empty list for the caller to fill in with *items */
+static union Sass_Value* _list_to_sass_value(
+        struct PySass_State* state, PyObject* value, PyObject** items
+) {
+    PyObject* separator = PyTuple_GetItem(value, 1);
     enum Sass_Separator sep = SASS_COMMA;
-    if (separator == sass_comma) {
+    if (separator == state->separator_comma) {
         sep = SASS_COMMA;
-    } else if (separator == sass_space) {
+    } else if (separator == state->separator_space) {
         sep = SASS_SPACE;
     } else {
         assert(0);
     }
-    int is_bracketed = bracketed == Py_True;
-    retv = sass_make_list(PyTuple_Size(items), sep, is_bracketed);
-    for (i = 0; i < PyTuple_Size(items); i += 1) {
-        sass_list_set_value(
-            retv, i, _to_sass_value(PyTuple_GetItem(items, i))
-        );
-    }
-    Py_DECREF(types_mod);
-    Py_DECREF(sass_comma);
-    Py_DECREF(sass_space);
-    Py_DECREF(items);
-    Py_DECREF(separator);
-    Py_DECREF(bracketed);
-    return retv;
+    *items = PyTuple_GetItem(value, 0);
+    Py_INCREF(*items);
+    return sass_make_list(
+        PyTuple_Size(*items), sep, PyTuple_GetItem(value, 2) == Py_True
+    );
 }
 
-static union Sass_Value* _mapping_to_sass_value(PyObject* value) {
-    union Sass_Value* retv = NULL;
-    size_t i = 0;
-    Py_ssize_t pos = 0;
-    PyObject* d_key = NULL;
-    PyObject* d_value = NULL;
+/* Returns an empty map for the caller to fill in with *items */
+static union Sass_Value* _mapping_to_sass_value(
+        PyObject* value, PyObject** items
+) {
     PyObject* dct = PyDict_New();
-    PyDict_Update(dct, value);
-    retv = sass_make_map(PyDict_Size(dct));
-    while (PyDict_Next(dct, &pos, &d_key, &d_value)) {
-        sass_map_set_key(retv, i, _to_sass_value(d_key));
-        sass_map_set_value(retv, i, _to_sass_value(d_value));
-        i += 1;
-    }
-    Py_DECREF(dct);
-    return retv;
+    if (dct == NULL) return NULL;
+    if (PyDict_Update(dct, value) < 0) {
+        Py_DECREF(dct);
+        return NULL;
+    }
+    *items = dct;
+    return sass_make_map(PyDict_Size(dct));
+}
+
+/* Gives the libsass map back as is if the proxy is still backed by it */
+static union Sass_Value* _map_proxy_to_sass_value(
+        struct PySass_State* state, PyObject* value, PyObject** items
+) {
+    PyObject* ref = PyObject_GetAttrString(value, "_dict");
+    const union Sass_Value* map = NULL;
+    if (ref == NULL) return NULL;
+    if (Py_TYPE(ref) == (PyTypeObject*)state->map_ref_type) {
+        map = ((struct PySass_MapRef*)ref)->value;
+    }
+    Py_DECREF(ref);
+    if (map != NULL) return sass_clone_value(map);
+    return _mapping_to_sass_value(value, items);
 }
 
 static union Sass_Value* _number_to_sass_value(PyObject* value) {
     union Sass_Value* retv = NULL;
-    PyObject* d_value = PyObject_GetAttrString(value, "value");
-    PyObject* unit = PyObject_GetAttrString(value, "unit");
-    PyObject* bytes = PyUnicode_AsEncodedString(unit, "UTF-8", "strict");
-    retv = sass_make_number(
-        PyFloat_AsDouble(d_value), PyBytes_AsString(bytes)
+    PyObject* bytes = NULL;
+    double d_value = PyFloat_AsDouble(PyTuple_GetItem(value, 0));
+    if (PyErr_Occurred()) return NULL;
+    bytes = PyUnicode_AsEncodedString(
+        PyTuple_GetItem(value, 1), "UTF-8", "strict"
     );
-    Py_DECREF(d_value);
-    Py_DECREF(unit);
+    if (bytes == NULL) return NULL;
+    retv = sass_make_number(d_value, PyBytes_AsString(bytes));
     Py_DECREF(bytes);
     return retv;
 }
@@ -211,6 +1385,7 @@ static union Sass_Value* _number_to_sass_value(PyObject* value) {
 static union Sass_Value* _unicode_to_sass_value(PyObject* value) {
     union Sass_Value* retv = NULL;
     PyObject* bytes = PyUnicode_AsEncodedString(value, "UTF-8", "strict");
+    if (bytes == NULL) return NULL;
     retv = sass_make_string(PyBytes_AsString(bytes));
     Py_DECREF(bytes);
     return retv;
@@ -218,20 +1393,22 @@ static union Sass_Value* _unicode_to_sass_value(PyObject* value) {
 
 static union Sass_Value* _warning_to_sass_value(PyObject* value) {
     union Sass_Value* retv = NULL;
-    PyObject* msg = PyObject_GetAttrString(value, "msg");
-    PyObject* bytes = PyUnicode_AsEncodedString(msg, "UTF-8", "strict");
+    PyObject* bytes = PyUnicode_AsEncodedString(
+        PyTuple_GetItem(value, 0), "UTF-8", "strict"
+    );
+    if (bytes == NULL) return NULL;
     retv = sass_make_warning(PyBytes_AsString(bytes));
-    Py_DECREF(msg);
     Py_DECREF(bytes);
     return retv;
 }
 
 static union Sass_Value* _error_to_sass_value(PyObject* value) {
     union Sass_Value* retv = NULL;
-    PyObject* msg = PyObject_GetAttrString(value, "msg");
-    PyObject* bytes = PyUnicode_AsEncodedString(msg, "UTF-8", "strict");
+    PyObject* bytes = PyUnicode_AsEncodedString(
+        PyTuple_GetItem(value, 0), "UTF-8", "strict"
+    );
+    if (bytes == NULL) return NULL;
     retv = sass_make_error(PyBytes_AsString(bytes));
-    Py_DECREF(msg);
     Py_DECREF(bytes);
     return retv;
 }
@@ -279,7 +1456,8 @@ static PyObject* _exception_to_bytes() {
     {
         PyObject* traceback_mod = PyImport_ImportModule("traceback");
         PyObject* traceback_parts = PyObject_CallMethod(
-            traceback_mod, "format_exception", "OOO", etype, evalue, etb
+            traceback_mod, "format_exception", "OOO", etype, evalue,
+            etb ? etb : Py_None  /* exceptions raised in C have none */
         );
         PyList_Insert(traceback_parts, 0, PyUnicode_FromString("\n"));
         PyObject* joinstr = PyUnicode_FromString("");
@@ -292,7 +1470,7 @@ static PyObject* _exception_to_bytes() {
     }
     Py_DECREF(etype);
     Py_DECREF(evalue);
-    Py_DECREF(etb);
+    Py_XDECREF(etb);
     return retv;
 }
 
@@ -303,85 +1481,395 @@ static union Sass_Value* _exception_to_sass_error() {
     return retv;
 }
 
-static Sass_Import_List _exception_to_sass_import_error(const char* path) {
-    PyObject* bytes = _exception_to_bytes();
+static Sass_Import_List _make_sass_import_error(
+        const char* path, const char* message
+) {
     Sass_Import_List import_list = sass_make_import_list(1);
     import_list[0] = sass_make_import_entry(path, 0, 0);
-    sass_import_set_error(import_list[0], PyBytes_AsString(bytes), 0, 0);
+    sass_import_set_error(import_list[0], message, 0, 0);
+    return import_list;
+}
+
+static Sass_Import_List _exception_to_sass_import_error(const char* path) {
+    PyObject* bytes = _exception_to_bytes();
+    Sass_Import_List import_list = _make_sass_import_error(
+        path, PyBytes_AsString(bytes)
+    );
     Py_DECREF(bytes);
     return import_list;
 }
 
-static union Sass_Value* _to_sass_value(PyObject* value) {
-    union Sass_Value* retv = NULL;
-    PyObject* types_mod = PyImport_ImportModule("sass");
-    PyObject* sass_number_t = PyObject_GetAttrString(types_mod, "SassNumber");
-    PyObject* sass_color_t = PyObject_GetAttrString(types_mod, "SassColor");
-    PyObject* sass_list_t = PyObject_GetAttrString(types_mod, "SassList");
-    PyObject* sass_warning_t = PyObject_GetAttrString(types_mod, "SassWarning");
-    PyObject* sass_error_t = PyObject_GetAttrString(types_mod, "SassError");
-    PyObject* collections_mod = PyImport_ImportModule(COLLECTIONS_ABC_MOD);
-    PyObject* mapping_t = PyObject_GetAttrString(collections_mod, "Mapping");
-
-    if (value == Py_None) {
-        retv = sass_make_null();
-    } else if (PyBool_Check(value)) {
-        retv = sass_make_boolean(value == Py_True);
-    } else if (PyUnicode_Check(value)) {
-        retv = _unicode_to_sass_value(value);
-    } else if (PyBytes_Check(value)) {
-        retv = sass_make_string(PyBytes_AsString(value));
-    /* XXX: PyMapping_Check returns true for lists and tuples in python3 :( */
-    /* XXX: pypy derps on dicts: https://bitbucket.org/pypy/pypy/issue/1970 */
-    } else if (PyDict_Check(value) || PyObject_IsInstance(value, mapping_t)) {
-        retv = _mapping_to_sass_value(value);
-    } else if (PyObject_IsInstance(value, sass_number_t)) {
-        retv = _number_to_sass_value(value);
-    } else if (PyObject_IsInstance(value, sass_color_t)) {
-        retv = _color_to_sass_value(value);
-    } else if (PyObject_IsInstance(value, sass_list_t)) {
-        retv = _list_to_sass_value(value);
-    } else if (PyObject_IsInstance(value, sass_warning_t)) {
-        retv = _warning_to_sass_value(value);
-    } else if (PyObject_IsInstance(value, sass_error_t)) {
-        retv = _error_to_sass_value(value);
+/* Converts value, except that lists and maps come back empty, with the
+ * Python objects to fill them in from in *items.  Returns NULL with an
+ * exception set on failure. */
+static union Sass_Value* _make_sass_value(
+        struct PySass_State* state, PyObject* value, PyObject** items
+) {
+    *items = NULL;
+    switch (_value_kind(state, value)) {
+        case -1:
+            return NULL;
+        case PYSASS_NULL:
+            return sass_make_null();
+        case PYSASS_BOOLEAN:
+            return sass_make_boolean(value == Py_True);
+        case PYSASS_UNICODE:
+            return _unicode_to_sass_value(value);
+        case PYSASS_BYTES:
+            return sass_make_string(PyBytes_AsString(value));
+        case PYSASS_MAPPING:
+            return _mapping_to_sass_value(value, items);
+        case PYSASS_MAP_PROXY:
+            return _map_proxy_to_sass_value(state, value, items);
+        case PYSASS_NUMBER:
+            return _number_to_sass_value(value);
+        case PYSASS_COLOR:
+            return _color_to_sass_value(value);
+        case PYSASS_LIST:
+            return _list_to_sass_value(state, value, items);
+        case PYSASS_WARNING:
+            return _warning_to_sass_value(value);
+        case PYSASS_ERROR:
+            return _error_to_sass_value(value);
+        default:
+            return _unknown_type_to_sass_error(value);
     }
+}
+
+/* A list or map whose children _to_sass_value() is still converting */
+struct PySass_SassFrame {
+    union Sass_Value* value;
+    PyObject* items;    /* the tuple of a SassList, or a dict */
+    PyObject* pending;  /* a map value waiting for its key to be set */
+    Py_ssize_t pos;     /* PyDict_Next() position in items */
+    size_t size;        /* number of children; maps have two per entry */
+    size_t next;        /* index of the next child to convert */
+};
 
-    if (retv == NULL) {
-        retv = _unknown_type_to_sass_error(value);
+static PyObject* _sass_frame_next_child(struct PySass_SassFrame* frame) {
+    size_t i = frame->next++;
+    PyObject* key = NULL;
+    if (sass_value_is_list(frame->value)) {
+        return PyTuple_GetItem(frame->items, i);
+    } else if (i % 2) {
+        return frame->pending;
     }
+    PyDict_Next(frame->items, &frame->pos, &key, &frame->pending);
+    return key;
+}
 
-    Py_DECREF(types_mod);
-    Py_DECREF(sass_number_t);
-    Py_DECREF(sass_color_t);
-    Py_DECREF(sass_list_t);
-    Py_DECREF(sass_warning_t);
-    Py_DECREF(sass_error_t);
-    Py_DECREF(collections_mod);
-    Py_DECREF(mapping_t);
+/* Stores the last child handed out by _sass_frame_next_child() */
+static void _sass_frame_set_child(
+        struct PySass_SassFrame* frame, union Sass_Value* item
+) {
+    size_t i = frame->next - 1;
+    if (sass_value_is_list(frame->value)) {
+        sass_list_set_value(frame->value, i, item);
+    } else if (i % 2) {
+        sass_map_set_value(frame->value, i / 2, item);
+    } else {
+        sass_map_set_key(frame->value, i / 2, item);
+    }
+}
+
+/* Like _to_py_value(), this converts lists and maps without recursion */
+static union Sass_Value* _to_sass_value(
+        struct PySass_State* state, PyObject* value
+) {
+    struct PySass_SassFrame* stack = NULL;
+    struct PySass_SassFrame* frame;
+    size_t depth = 0, capacity = 0;
+    union Sass_Value* root;
+    union Sass_Value* converted;
+    PyObject* items;
+
+    root = converted = _make_sass_value(state, value, &items);
+    for (;;) {
+        if (converted == NULL) goto error;
+        if (items != NULL) {
+            if (depth == capacity) {
+                frame = _grow_stack(stack, &capacity, sizeof(*stack));
+                if (frame == NULL) {
+                    Py_DECREF(items);
+                    goto error;
+                }
+                stack = frame;
+            }
+            frame = &stack[depth];
+            frame->value = converted;
+            frame->items = items;
+            frame->pending = NULL;
+            frame->pos = 0;
+            frame->next = 0;
+            if (sass_value_is_list(converted)) {
+                frame->size = sass_list_get_length(converted);
+            } else {
+                frame->size = 2 * sass_map_get_length(converted);
+            }
+            depth += 1;
+        }
+
+        while (depth > 0 && stack[depth - 1].next == stack[depth - 1].size) {
+            depth -= 1;
+            Py_DECREF(stack[depth].items);
+        }
+        if (depth == 0) break;
+
+        frame = &stack[depth - 1];
+        value = _sass_frame_next_child(frame);
+        converted = _make_sass_value(state, value, &items);
+        if (converted != NULL) _sass_frame_set_child(frame, converted);
+    }
+
+    PyMem_Free(stack);
+    return root;
+
+error:
+    while (depth > 0) {
+        depth -= 1;
+        Py_DECREF(stack[depth].items);
+    }
+    PyMem_Free(stack);
+    sass_delete_value(root);
+    return _exception_to_sass_error();
+}
+
+/* Adds a call to the profile of the function, from the _monotonic() times
+ * it started, converted the arguments, got the result, and finished at.
+ * The ones it didn't get to, e.g. for a cached result, are zero. */
+static void _profile_call(
+        struct PySass_Callback* callback,
+        double started, double converted, double called, double finished
+) {
+    double total = finished - started;
+    PySass_LOCK(callback);
+    callback->total_time += total;
+    if (total > callback->max_time) callback->max_time = total;
+    if (converted) {
+        callback->arguments_time += converted - started;
+        if (called) {
+            callback->call_time += called - converted;
+            callback->result_time += finished - called;
+        }
+    }
+    PySass_UNLOCK(callback);
+}
+
+/* What a key of FunctionCache is made of */
+struct PySass_KeyBuffer {
+    char* data;
+    size_t size;
+    size_t capacity;
+};
+
+static int _key_write(
+        struct PySass_KeyBuffer* buffer, const void* data, size_t size
+) {
+    if (buffer->size + size > buffer->capacity) {
+        size_t capacity = buffer->capacity ? buffer->capacity : 64;
+        char* grown;
+        while (capacity < buffer->size + size) capacity *= 2;
+        if (!(grown = PyMem_Realloc(buffer->data, capacity))) {
+            PyErr_NoMemory();
+            return -1;
+        }
+        buffer->data = grown;
+        buffer->capacity = capacity;
+    }
+    memcpy(buffer->data + buffer->size, data, size);
+    buffer->size += size;
+    return 0;
+}
+
+static int _key_write_string(
+        struct PySass_KeyBuffer* buffer, const char* string
+) {
+    return _key_write(buffer, string, strlen(string) + 1);
+}
+
+/* Writes what tells value apart from the others which _to_py_value()
+ * converts differently; children of lists and maps follow their header */
+static int _key_write_value(
+        struct PySass_KeyBuffer* buffer, const union Sass_Value* value
+) {
+    char tag = (char)sass_value_get_tag(value);
+    double numbers[4];
+    size_t size;
+    char flags[2];
+
+    if (_key_write(buffer, &tag, 1) < 0) return -1;
+    switch (sass_value_get_tag(value)) {
+        case SASS_BOOLEAN:
+            flags[0] = (char)sass_boolean_get_value(value);
+            return _key_write(buffer, flags, 1);
+        case SASS_STRING:
+            return _key_write_string(buffer, sass_string_get_value(value));
+        case SASS_NUMBER:
+            numbers[0] = sass_number_get_value(value);
+            if (_key_write(buffer, numbers, sizeof(double)) < 0) return -1;
+            return _key_write_string(buffer, sass_number_get_unit(value));
+        case SASS_COLOR:
+            numbers[0] = sass_color_get_r(value);
+            numbers[1] = sass_color_get_g(value);
+            numbers[2] = sass_color_get_b(value);
+            numbers[3] = sass_color_get_a(value);
+            return _key_write(buffer, numbers, sizeof(numbers));
+        case SASS_LIST:
+            size = sass_list_get_length(value);
+            flags[0] = (char)sass_list_get_separator(value);
+            flags[1] = (char)sass_list_get_is_bracketed(value);
+            if (_key_write(buffer, flags, 2) < 0) return -1;
+            return _key_write(buffer, &size, sizeof(size));
+        case SASS_MAP:
+            size = sass_map_get_length(value);
+            return _key_write(buffer, &size, sizeof(size));
+        case SASS_ERROR:
+            return _key_write_string(buffer, sass_error_get_message(value));
+        case SASS_WARNING:
+            return _key_write_string(buffer, sass_warning_get_message(value));
+        default:
+            return 0;
+    }
+}
+
+/* Makes the key of FunctionCache, (function, arguments serialized), without
+ * converting the arguments.  Like _to_py_value(), it doesn't recurse. */
+static PyObject* _function_cache_key(
+        PyObject* function, const union Sass_Value* args
+) {
+    struct PySass_KeyBuffer buffer = {NULL, 0, 0};
+    struct PySass_PyFrame* stack = NULL;
+    struct PySass_PyFrame* frame;
+    size_t depth = 0, capacity = 0;
+    const union Sass_Value* value = args;
+    PyObject* key = NULL;
+
+    for (;;) {
+        if (_key_write_value(&buffer, value) < 0) goto done;
+        if (sass_value_is_list(value) || sass_value_is_map(value)) {
+            if (depth == capacity) {
+                frame = _grow_stack(stack, &capacity, sizeof(*stack));
+                if (frame == NULL) goto done;
+                stack = frame;
+            }
+            frame = &stack[depth];
+            frame->value = value;
+            frame->next = 0;
+            frame->size = sass_value_is_list(value) ?
+                sass_list_get_length(value) : 2 * sass_map_get_length(value);
+            depth += 1;
+        }
+        while (depth > 0 && stack[depth - 1].next == stack[depth - 1].size) {
+            depth -= 1;
+        }
+        if (depth == 0) break;
+        value = _py_frame_next_child(&stack[depth - 1]);
+    }
+    key = PyBytes_FromStringAndSize(buffer.data, (Py_ssize_t)buffer.size);
+    if (key != NULL) key = Py_BuildValue("(ON)", function, key);
+
+done:
+    PyMem_Free(stack);
+    PyMem_Free(buffer.data);
+    return key;
+}
+
+#define PySass_VALUE_CAPSULE "_sass.value"
+
+static void _delete_value_capsule(PyObject* capsule) {
+    sass_delete_value(PyCapsule_GetPointer(capsule, PySass_VALUE_CAPSULE));
+}
+
+/* Returns a copy of what the pure function returned for key, NULL if it
+ * isn't cached yet, or NULL with an exception set on failure */
+static union Sass_Value* _function_cache_get(PyObject* cache, PyObject* key) {
+    union Sass_Value* retv = NULL;
+    PyObject* cached = PyObject_CallMethod(cache, "_get", "(O)", key);
+    if (cached == NULL) return NULL;
+    if (cached != Py_None) {
+        retv = PyCapsule_GetPointer(cached, PySass_VALUE_CAPSULE);
+        if (retv != NULL) retv = sass_clone_value(retv);
+    }
+    Py_DECREF(cached);
     return retv;
 }
 
+static int _function_cache_put(
+        PyObject* cache, PyObject* key, const union Sass_Value* value
+) {
+    union Sass_Value* copy = sass_clone_value(value);
+    PyObject* capsule;
+    PyObject* put;
+
+    if (!(capsule = PyCapsule_New(
+            copy, PySass_VALUE_CAPSULE, _delete_value_capsule))) {
+        sass_delete_value(copy);
+        return -1;
+    }
+    put = PyObject_CallMethod(cache, "_put", "OO", key, capsule);
+    Py_DECREF(capsule);
+    if (put == NULL) return -1;
+    Py_DECREF(put);
+    return 0;
+}
+
 static union Sass_Value* _call_py_f(
         const union Sass_Value* sass_args,
         Sass_Function_Entry cb,
         struct Sass_Compiler* compiler
 ) {
     size_t i;
-    PyObject* pyfunc = (PyObject*)sass_function_get_cookie(cb);
-    PyObject* py_args = PyTuple_New(sass_list_get_length(sass_args));
+    struct PySass_Callback* callback = sass_function_get_cookie(cb);
+    PyObject* py_args = NULL;
     PyObject* py_result = NULL;
+    PyObject* refs = NULL;
+    PyObject* key = NULL;
     union Sass_Value* sass_result = NULL;
+    int stop;
+    double started = 0, converted = 0, called = 0;
+    /* libsass runs without the GIL; take it back only for the callback */
+    PyEval_RestoreThread(PySass_thread_state);
+    if (callback->profile) started = _monotonic();
+
+    PySass_COUNT_CALL(callback);
+    if ((stop = _should_stop(callback->opts))) {
+        callback->opts->stopped = stop;
+        sass_result = sass_make_error(PySass_stop_messages[stop]);
+        goto done;
+    }
+    if (_load_state(callback->state) < 0) goto done;
+    /* A pure function is called only for arguments it's never got */
+    if (callback->cache != Py_None) {
+        key = _function_cache_key(callback->callable, sass_args);
+        if (key == NULL) goto done;
+        sass_result = _function_cache_get(callback->cache, key);
+        if (sass_result != NULL || PyErr_Occurred()) goto done;
+    }
+    if (callback->lazy && !(refs = PyList_New(0))) goto done;
+    py_args = PyTuple_New(sass_list_get_length(sass_args));
 
     for (i = 0; i < sass_list_get_length(sass_args); i += 1) {
         const union Sass_Value* sass_arg = sass_list_get_value(sass_args, i);
         PyObject* py_arg = NULL;
-        if (!(py_arg = _to_py_value(sass_arg))) goto done;
+        if (!(py_arg = _to_py_value(callback->state, sass_arg, refs))) {
+            goto done;
+        }
         PyTuple_SetItem(py_args, i, py_arg);
     }
 
-    if (!(py_result = PyObject_CallObject(pyfunc, py_args))) goto done;
-    sass_result = _to_sass_value(py_result);
+    if (callback->profile) converted = _monotonic();
+    if (!(py_result = PyObject_CallObject(callback->callable, py_args))) {
+        goto done;
+    }
+    if (callback->profile) called = _monotonic();
+    sass_result = _to_sass_value(callback->state, py_result);
+    if (key != NULL && sass_result != NULL &&
+            !sass_value_is_error(sass_result) &&
+            !sass_value_is_warning(sass_result) &&
+            _function_cache_put(callback->cache, key, sass_result) < 0) {
+        sass_delete_value(sass_result);
+        sass_result = NULL;
+    }
 
 done:
     if (sass_result == NULL) {
@@ -389,44 +1877,160 @@ done:
     }
     Py_XDECREF(py_args);
     Py_XDECREF(py_result);
+    Py_XDECREF(key);
+    if (refs != NULL) {
+        if (_detach_map_refs(refs) < 0) {
+            sass_delete_value(sass_result);
+            sass_result = _exception_to_sass_error();
+        }
+        Py_DECREF(refs);
+    }
+    if (callback->profile) {
+        _profile_call(callback, started, converted, called, _monotonic());
+    }
+    PyEval_SaveThread();
     return sass_result;
 }
 
+#define PySass_VARIABLES_CAPSULE "_sass.variables"
+#define PySass_VARIABLE_FUNCTION "-pysass-variable"
+
+/* Python values converted to Sass once, to be injected as global variables
+ * without formatting them as Sass source.  A header assigns every variable
+ * what -pysass-variable($index) returns, i.e. a copy of its value; see
+ * PySass_make_variables() */
+struct PySass_Variables {
+    char* header;
+    Py_ssize_t size;
+    union Sass_Value** values;
+};
+
+static void _delete_variables_capsule(PyObject* capsule) {
+    struct PySass_Variables* variables = PyCapsule_GetPointer(
+        capsule, PySass_VARIABLES_CAPSULE
+    );
+    Py_ssize_t i;
+
+    for (i = 0; i < variables->size; i += 1) {
+        if (variables->values[i]) sass_delete_value(variables->values[i]);
+    }
+    PyMem_Free(variables->values);
+    PyMem_Free(variables->header);
+    PyMem_Free(variables);
+}
+
+/* Runs without the GIL, as the variables are only read while compiling */
+static union Sass_Value* _call_variable_f(
+        const union Sass_Value* sass_args,
+        Sass_Function_Entry cb,
+        struct Sass_Compiler* compiler
+) {
+    struct PySass_Variables* variables = sass_function_get_cookie(cb);
+    const union Sass_Value* index = sass_list_get_value(sass_args, 0);
+    double i;
+
+    if (!sass_value_is_number(index)) {
+        return sass_make_error("index must be a number");
+    }
+    i = sass_number_get_value(index);
+    if (i < 0 || i >= variables->size || i != (Py_ssize_t)i) {
+        return sass_make_error("index out of range");
+    }
+    return sass_clone_value(variables->values[(Py_ssize_t)i]);
+}
+
+static Sass_Import_List _call_variables_header(
+        const char* path, Sass_Importer_Entry cb, struct Sass_Compiler* comp
+) {
+    struct PySass_Variables* variables = sass_importer_get_cookie(cb);
+    Sass_Import_List import_list = sass_make_import_list(1);
+
+    import_list[0] = sass_make_import_entry(
+        "pysass-variables", sass_copy_c_string(variables->header), NULL
+    );
+    return import_list;
+}
+
+static void _add_variables_header(
+        struct Sass_Options* options, struct PySass_Variables* variables
+) {
+    Sass_Importer_List header_list = sass_make_importer_list(1);
+
+    header_list[0] = sass_make_importer(_call_variables_header, 0, variables);
+    sass_option_set_c_headers(options, header_list);
+}
 
 static void _add_custom_functions(
-        struct Sass_Options* options, PyObject* custom_functions
+        struct Sass_Options* options,
+        PyObject* custom_functions,
+        struct PySass_Callback* callbacks,
+        struct PySass_Variables* variables
 ) {
     Py_ssize_t i;
     Sass_Function_List fn_list = sass_make_function_list(
-        PyList_Size(custom_functions)
+        PyTuple_Size(custom_functions) + (variables != NULL)
     );
-    for (i = 0; i < PyList_Size(custom_functions); i += 1) {
-        PyObject* sass_function = PyList_GetItem(custom_functions, i);
-        PyObject* signature = PySass_Object_Bytes(sass_function);
+    /* sass.py gives us (signature bytes, function, lazy, cache, profiler)
+     * so that signatures don't have to be formatted for every compile */
+    for (i = 0; i < PyTuple_Size(custom_functions); i += 1) {
+        PyObject* item = PyTuple_GetItem(custom_functions, i);
         Sass_Function_Entry fn = sass_make_function(
-            PyBytes_AsString(signature),
+            PyBytes_AsString(PyTuple_GetItem(item, 0)),
             _call_py_f,
-            sass_function
+            &callbacks[i]
         );
         sass_function_set_list_entry(fn_list, i, fn);
     }
+    if (variables != NULL) {
+        sass_function_set_list_entry(fn_list, i, sass_make_function(
+            PySass_VARIABLE_FUNCTION "($index)", _call_variable_f, variables
+        ));
+    }
     sass_option_set_c_functions(options, fn_list);
 }
 
 static Sass_Import_List _call_py_importer_f(
         const char* path, Sass_Importer_Entry cb, struct Sass_Compiler* comp
 ) {
-    PyObject* pyfunc = (PyObject*)sass_importer_get_cookie(cb);
+    struct PySass_Callback* callback = sass_importer_get_cookie(cb);
     PyObject* py_result = NULL;
     Sass_Import_List sass_imports = NULL;
     struct Sass_Import* previous;
     const char* prev_path;
     Py_ssize_t i;
+    int stop;
 
+    /* Most imports aren't for the importer; tell them without the GIL */
+    if (callback->prefix &&
+            strncmp(path, callback->prefix, callback->prefix_size) != 0) {
+        return NULL;
+    }
     previous = sass_compiler_get_last_import(comp);
     prev_path = sass_import_get_abs_path(previous);
 
-    py_result = PyObject_CallFunction(pyfunc, PySass_IF_PY3("yy", "ss"), path, prev_path);
+    PyEval_RestoreThread(PySass_thread_state);
+    if ((stop = _should_stop(callback->opts))) {
+        callback->opts->stopped = stop;
+        sass_imports = _make_sass_import_error(
+            path, PySass_stop_messages[stop]
+        );
+        goto done;
+    }
+    if (callback->pattern != Py_None) {
+        PyObject* match = PyObject_CallMethod(
+            callback->pattern, "search", "s", path
+        );
+        if (match == NULL) goto done;
+        Py_DECREF(match);
+        if (match == Py_None) {
+            PyEval_SaveThread();
+            return NULL;
+        }
+    }
+    PySass_COUNT_CALL(callback);
+    py_result = PyObject_CallFunction(
+        callback->callable, "ss", path, prev_path
+    );
 
     /* Handle importer throwing an exception */
     if (!py_result) goto done;
@@ -434,6 +2038,7 @@ static Sass_Import_List _call_py_importer_f(
     /* Could return None indicating it could not handle the import */
     if (py_result == Py_None) {
         Py_XDECREF(py_result);
+        PyEval_SaveThread();
         return NULL;
     }
 
@@ -477,12 +2082,15 @@ done:
     }
 
     Py_XDECREF(py_result);
+    PyEval_SaveThread();
 
     return sass_imports;
 }
 
 static void _add_custom_importers(
-        struct Sass_Options* options, PyObject* custom_importers
+        struct Sass_Options* options,
+        PyObject* custom_importers,
+        struct PySass_Callback* callbacks
 ) {
     Py_ssize_t i;
     Sass_Importer_List importer_list;
@@ -495,105 +2103,569 @@ static void _add_custom_importers(
 
     for (i = 0; i < PyTuple_Size(custom_importers); i += 1) {
         PyObject* item = PyTuple_GetItem(custom_importers, i);
-        int priority = 0;
-        PyObject* import_function = NULL;
-
-        PyArg_ParseTuple(item, "iO", &priority, &import_function);
+        /* (priority, importer, prefix, pattern) */
+        int priority = PyLong_AsLong(PyTuple_GetItem(item, 0));
 
         importer_list[i] = sass_make_importer(
-            _call_py_importer_f, priority, import_function
+            _call_py_importer_f, priority, &callbacks[i]
         );
     }
 
     sass_option_set_c_importers(options, importer_list);
 }
 
+/* Copies a str or bytes-like Sass source into memory which libsass takes
+ * the ownership of, as a NUL-terminated string.  That is the only copy
+ * made of it where the limited API allows. */
+static char* _to_sass_source(PyObject* source) {
+    const char* data = NULL;
+    Py_ssize_t size = 0;
+    char* retv = NULL;
+    PyObject* bytes = NULL;
+#if !defined(Py_LIMITED_API) || Py_LIMITED_API+0 >= 0x030B0000
+    Py_buffer view;
+    int has_view = 0;
+#else
+    PyObject* view;
+#endif
+
+    if (PyUnicode_Check(source)) {
+#if !defined(Py_LIMITED_API) || Py_LIMITED_API+0 >= 0x030A0000
+        /* The UTF-8 form is cached in the str, or is the str itself */
+        if (!(data = PyUnicode_AsUTF8AndSize(source, &size))) return NULL;
+#else
+        if (!(bytes = PyUnicode_AsUTF8String(source))) return NULL;
+#endif
+    } else if (PyBytes_Check(source)) {
+        data = PyBytes_AsString(source);
+        size = PyBytes_Size(source);
+#if !defined(Py_LIMITED_API) || Py_LIMITED_API+0 >= 0x030B0000
+    } else if (PyObject_CheckBuffer(source)) {
+        if (PyObject_GetBuffer(source, &view, PyBUF_SIMPLE) < 0) return NULL;
+        has_view = 1;
+        data = view.buf;
+        size = view.len;
+#else
+    } else if ((view = PyMemoryView_FromObject(source))) {
+        /* Buffers are out of the limited API before 3.11 */
+        bytes = PyBytes_FromObject(view);
+        Py_DECREF(view);
+        if (bytes == NULL) return NULL;
+#endif
+    } else {
+#if defined(Py_LIMITED_API) && Py_LIMITED_API+0 < 0x030B0000
+        PyErr_Clear();
+#endif
+        PyErr_Format(
+            PyExc_TypeError,
+            "string must be a string or a bytes-like object, not %R",
+            source
+        );
+        return NULL;
+    }
+    if (bytes != NULL) {
+        data = PyBytes_AsString(bytes);
+        size = PyBytes_Size(bytes);
+    }
+
+    if (memchr(data, '\0', size)) {
+        PyErr_SetString(PyExc_ValueError, "embedded null byte");
+    } else if ((retv = sass_alloc_memory(size + 1))) {
+        memcpy(retv, data, size);
+        retv[size] = '\0';
+    } else {
+        PyErr_NoMemory();
+    }
+
+#if !defined(Py_LIMITED_API) || Py_LIMITED_API+0 >= 0x030B0000
+    if (has_view) PyBuffer_Release(&view);
+#endif
+    Py_XDECREF(bytes);
+    return retv;
+}
+
+/* The options shared by every compile entry point, parsed from the
+ * arguments that sass.py passes in. */
+
+/* Where compiled output goes instead of being returned: a file descriptor
+ * of the caller's, or a path which is opened only once the compile has
+ * succeeded, so that a failed compile doesn't truncate the previous
+ * output. */
+struct PySass_Sink {
+    int fd;            /* -1 if none */
+    const char* path;  /* NULL if none */
+};
+
+#define PySass_HAS_SINK(sink) ((sink)->fd >= 0 || (sink)->path != NULL)
+
+/* A PyArg_ParseTuple() converter of None, a file descriptor, or a path as
+ * bytes.  The path is borrowed from the argument tuple. */
+static int _sink_converter(PyObject* obj, void* ptr) {
+    struct PySass_Sink* sink = ptr;
+    sink->fd = -1;
+    sink->path = NULL;
+    if (obj == Py_None) return 1;
+    if (PyBytes_Check(obj)) {
+        sink->path = PyBytes_AsString(obj);
+        return 1;
+    }
+    if (PyLong_Check(obj)) {
+        long fd = PyLong_AsLong(obj);
+        if (fd == -1 && PyErr_Occurred()) return 0;
+        if (fd >= 0 && fd <= INT_MAX) {
+            sink->fd = (int) fd;
+            return 1;
+        }
+    }
+    PyErr_Format(
+        PyExc_TypeError,
+        "output must be a file descriptor or a path, not %R", obj
+    );
+    return 0;
+}
+
+/* Writes the whole NUL-terminated data.  It doesn't need the GIL, and
+ * returns an errno value or 0. */
+static int _write_sink_nogil(struct PySass_Sink* sink, const char* data) {
+    size_t size = strlen(data);
+    int fd = sink->fd, error = 0;
+
+    if (sink->path) {
+        fd = open(sink->path, O_WRONLY | O_CREAT | O_TRUNC | O_BINARY, 0666);
+        if (fd < 0) return errno;
+    }
+    while (size) {
+        /* Windows takes an unsigned int for the size */
+        unsigned int chunk = size > INT_MAX ? INT_MAX : (unsigned int) size;
+        int written = write(fd, data, chunk);
+        if (written < 0) {
+            if (errno == EINTR) continue;
+            error = errno;
+            break;
+        }
+        data += written;
+        size -= written;
+    }
+    if (sink->path && close(fd) < 0 && !error) error = errno;
+    return error;
+}
+
+/* Writes data to the sink releasing the GIL, and raises OSError on
+ * failure. */
+static int _write_sink(struct PySass_Sink* sink, const char* data) {
+    int error;
+
+    Py_BEGIN_ALLOW_THREADS
+    error = _write_sink_nogil(sink, data);
+    Py_END_ALLOW_THREADS
+
+    if (error) {
+        errno = error;
+        PyErr_SetFromErrnoWithFilename(PyExc_OSError, sink->path);
+        return -1;
+    }
+    return 0;
+}
+
+static int _init_callbacks(PyObject* module, struct PySass_Options* opts) {
+    Py_ssize_t i;
+    Py_ssize_t functions_size = PyTuple_Size(opts->custom_functions);
+    Py_ssize_t size = functions_size;
+
+    if (opts->custom_importers != Py_None) {
+        size += PyTuple_Size(opts->custom_importers);
+    }
+    opts->callbacks = PyMem_Calloc(size + 1, sizeof(*opts->callbacks));
+    if (opts->callbacks == NULL) {
+        PyErr_NoMemory();
+        return -1;
+    }
+    opts->profiler = Py_None;
+    for (i = 0; i < size; i += 1) {
+        PyObject* item = i < functions_size ?
+            PyTuple_GetItem(opts->custom_functions, i) :
+            PyTuple_GetItem(opts->custom_importers, i - functions_size);
+        /* (signature, function, lazy, cache, profiler) and
+         * (priority, importer, prefix, pattern) respectively */
+        opts->callbacks[i].callable = PyTuple_GetItem(item, 1);
+        opts->callbacks[i].state = PySass_GetState(module);
+        opts->callbacks[i].opts = opts;
+        opts->callbacks[i].prefix = NULL;
+        opts->callbacks[i].prefix_size = 0;
+        opts->callbacks[i].pattern = Py_None;
+        opts->callbacks[i].lazy = 0;
+        opts->callbacks[i].cache = Py_None;
+        if (i < functions_size) {
+            opts->callbacks[i].lazy = PyObject_IsTrue(PyTuple_GetItem(item, 2));
+            opts->callbacks[i].cache = PyTuple_GetItem(item, 3);
+            /* Every function is reported to the same profiler */
+            opts->profiler = PyTuple_GetItem(item, 4);
+            opts->callbacks[i].profile = opts->profiler != Py_None;
+        } else {
+            PyObject* prefix = PyTuple_GetItem(item, 2);
+            if (PyBytes_Check(prefix)) {
+                opts->callbacks[i].prefix = PyBytes_AsString(prefix);
+                opts->callbacks[i].prefix_size = PyBytes_Size(prefix);
+            }
+            opts->callbacks[i].pattern = PyTuple_GetItem(item, 3);
+        }
+        opts->callbacks[i].calls = 0;
+    }
+    return 0;
+}
+
+/* Makes a tuple of (calls, total time, max time, arguments time, call time,
+ * result time) of every custom function, or None if they aren't profiled */
+static PyObject* _function_profiles(struct PySass_Options* opts) {
+    Py_ssize_t i, size = PyTuple_Size(opts->custom_functions);
+    PyObject* profiles;
+
+    if (opts->profiler == Py_None) {
+        Py_INCREF(Py_None);
+        return Py_None;
+    }
+    if (!(profiles = PyTuple_New(size))) return NULL;
+    for (i = 0; i < size; i += 1) {
+        struct PySass_Callback* callback = &opts->callbacks[i];
+        PyObject* profile = Py_BuildValue(
+            "nddddd", callback->calls, callback->total_time,
+            callback->max_time, callback->arguments_time,
+            callback->call_time, callback->result_time
+        );
+        if (profile == NULL) {
+            Py_DECREF(profiles);
+            return NULL;
+        }
+        PyTuple_SetItem(profiles, i, profile);
+    }
+    return profiles;
+}
+
+/* Adds the profiles of a compile, whether it succeeded or not, to what the
+ * compiler accumulates.  Returns -1 if an exception is set afterwards, which
+ * may be the one already set. */
+static int _report_profiles(struct PySass_Options* opts) {
+    PyObject *etype, *evalue, *etb, *profiles, *added = NULL;
+
+    if (opts->profiler == Py_None) return PyErr_Occurred() ? -1 : 0;
+    PyErr_Fetch(&etype, &evalue, &etb);
+    if ((profiles = _function_profiles(opts))) {
+        added = PyObject_CallMethod(
+            opts->profiler, "_add", "(O)", profiles
+        );
+        Py_DECREF(profiles);
+    }
+    Py_XDECREF(added);
+    if (etype != NULL) {
+        PyErr_Clear();
+        PyErr_Restore(etype, evalue, etb);
+    }
+    return PyErr_Occurred() ? -1 : 0;
+}
+
+/* Makes (included files, output size, custom function calls, importer
+ * calls, function profiles) of a successful compile. */
+static PyObject* _compile_stats(
+        struct Sass_Context* ctx, struct PySass_Options* opts
+) {
+    char** included_files = sass_context_get_included_files(ctx);
+    size_t size = sass_context_get_included_files_size(ctx);
+    const char* output_string = sass_context_get_output_string(ctx);
+    Py_ssize_t functions_size = PyTuple_Size(opts->custom_functions);
+    Py_ssize_t size_all = functions_size;
+    Py_ssize_t function_calls = 0, importer_calls = 0, i;
+    PyObject* files;
+
+    if (opts->custom_importers != Py_None) {
+        size_all += PyTuple_Size(opts->custom_importers);
+    }
+    for (i = 0; i < size_all; i += 1) {
+        if (i < functions_size) {
+            function_calls += opts->callbacks[i].calls;
+        } else {
+            importer_calls += opts->callbacks[i].calls;
+        }
+    }
+
+    if (!(files = PyTuple_New(size))) return NULL;
+    for (i = 0; i < (Py_ssize_t) size; i += 1) {
+        PyObject* file = PyBytes_FromString(included_files[i]);
+        if (file == NULL) {
+            Py_DECREF(files);
+            return NULL;
+        }
+        PyTuple_SetItem(files, i, file);
+    }
+    return Py_BuildValue(
+        "NnnnN", files, (Py_ssize_t) strlen(output_string),
+        function_calls, importer_calls, _function_profiles(opts)
+    );
+}
+
+/* Runs the two phases of libsass, and deletes the compiler.  With
+ * parse_only, it stops after parsing, which already evaluates the whole
+ * stylesheet and reports every error but those of rendering CSS.  Returns
+ * the enum PySass_Stop if it had to stop in between. */
+static int _run_compiler(
+        struct Sass_Compiler* compiler, int parse_only,
+        struct PySass_Options* opts
+) {
+    int stop = PYSASS_RUNNING;
+    /* A failed parse may still return 0, hence the error status too */
+    if (sass_compiler_parse(compiler) == 0 && !parse_only &&
+            !sass_context_get_error_status(
+                sass_compiler_get_context(compiler)
+            ) &&
+            !(stop = _should_stop_nogil(opts))) {
+        sass_compiler_execute(compiler);
+    }
+    sass_delete_compiler(compiler);
+    return stop;
+}
+
+/* Tells whether the output of a successful compile exceeds the limits of
+ * opts.  Returns 1 with a new sass.CompileLimitExceeded in *error if it
+ * does, 0 if it doesn't, or -1 with an exception set.  It's checked before
+ * the output is copied or written anywhere. */
+static int _check_limits(
+        PyObject* module, struct PySass_Options* opts, const char* output,
+        PyObject** error
+) {
+    struct PySass_State* state = PySass_GetState(module);
+    size_t size = strlen(output);
+
+    if (opts->max_output_bytes < 0 ||
+            size <= (size_t)opts->max_output_bytes) {
+        return 0;
+    }
+    if (_load_state(state) < 0) return -1;
+    *error = PyObject_CallFunction(
+        state->limit_type, "N", PyUnicode_FromFormat(
+            "Output of %zu bytes exceeds max_output_bytes of %zd",
+            size, opts->max_output_bytes
+        )
+    );
+    return *error == NULL ? -1 : 1;
+}
+
+/* The same to _check_limits(), but raises the error */
+static int _raise_limits(
+        PyObject* module, struct PySass_Options* opts, const char* output
+) {
+    PyObject* error;
+    int exceeded = _check_limits(module, opts, output, &error);
+    if (exceeded > 0) {
+        PyErr_SetObject((PyObject*)Py_TYPE(error), error);
+        Py_DECREF(error);
+        return -1;
+    }
+    return exceeded;
+}
+
+/* Sets opts up to time out after timeout seconds, or never if it's
+ * negative */
+static void _set_deadline(struct PySass_Options* opts, double timeout) {
+    opts->deadline = timeout < 0 ? -1 : _monotonic() + timeout;
+    opts->stopped = PYSASS_RUNNING;
+}
+
+/* Tells whether a compile which has finished with error_status stopped,
+ * and raises sass.CompileCancelled or sass.CompileTimeout if so.  A failed
+ * compile counts as stopped only if a callback made it fail for stopping;
+ * an error of its own is still reported as such even past the deadline. */
+static int _check_stopped(
+        PyObject* module, struct PySass_Options* opts, int stop,
+        int error_status, const char* message
+) {
+    struct PySass_State* state = PySass_GetState(module);
+    if (stop == PYSASS_RUNNING && error_status) stop = opts->stopped;
+    if (stop == PYSASS_RUNNING) return 0;
+    if (_load_state(state) < 0) return -1;
+    PyErr_SetString(
+        stop == PYSASS_TIMED_OUT ? state->timeout_type : state->cancelled_type,
+        error_status && message ? message : PySass_stop_messages[stop]
+    );
+    return -1;
+}
+
+static void _set_options(
+        struct Sass_Options* options, struct PySass_Options* opts
+) {
+    struct PySass_Variables* variables = NULL;
+
+    sass_option_set_output_style(options, opts->output_style);
+    sass_option_set_source_comments(options, opts->source_comments);
+    sass_option_set_include_path(options, opts->include_paths);
+    sass_option_set_precision(options, opts->precision);
+    sass_option_set_source_map_contents(options, opts->source_map_contents);
+    sass_option_set_source_map_embed(options, opts->source_map_embed);
+    sass_option_set_omit_source_map_url(options, opts->omit_source_map_url);
+
+    if (
+            PyBytes_Check(opts->source_map_root) &&
+            PyBytes_Size(opts->source_map_root)
+    ) {
+        sass_option_set_source_map_root(
+            options, PyBytes_AsString(opts->source_map_root)
+        );
+    }
+    if (*opts->plugin_paths) {
+        sass_option_set_plugin_path(options, opts->plugin_paths);
+    }
+
+    if (opts->variables != Py_None) {
+        variables = PyCapsule_GetPointer(
+            opts->variables, PySass_VARIABLES_CAPSULE
+        );
+        _add_variables_header(options, variables);
+    }
+    _add_custom_functions(
+        options, opts->custom_functions, opts->callbacks, variables
+    );
+    _add_custom_importers(
+        options,
+        opts->custom_importers,
+        opts->callbacks + PyTuple_Size(opts->custom_functions)
+    );
+}
+
 static PyObject *
 PySass_compile_string(PyObject *self, PyObject *args) {
     struct Sass_Context *ctx;
     struct Sass_Data_Context *context;
     struct Sass_Options *options;
-    char *string, *include_paths;
+    struct PySass_Options opts;
+    struct PySass_Sink output;
+    char *source;
     const char *error_message, *output_string;
-    enum Sass_Output_Style output_style;
-    int source_comments, error_status, precision, indented,
-        source_map_embed, source_map_contents,
-        omit_source_map_url;
-    PyObject *custom_functions;
-    PyObject *custom_importers;
-    PyObject *source_map_root;
-    PyObject *result;
+    int error_status, with_stats, parse_only, stop;
+    double timeout;
+    PyObject *string, *result = NULL, *css = NULL, *stats = NULL;
 
     if (!PyArg_ParseTuple(args,
-                          PySass_IF_PY3("yiiyiOiOiiiO", "siisiOiOiiiO"),
-                          &string, &output_style, &source_comments,
-                          &include_paths, &precision,
-                          &custom_functions, &indented, &custom_importers,
-                          &source_map_contents, &source_map_embed,
-                          &omit_source_map_url, &source_map_root)) {
+                          PySass_IF_PY3("OiiyiOiOiiiOynOO&ppOd",
+                                        "OiisiOiOiiiOsnOO&iiOd"),
+                          &string, &opts.output_style, &opts.source_comments,
+                          &opts.include_paths, &opts.precision,
+                          &opts.custom_functions, &opts.indented,
+                          &opts.custom_importers, &opts.source_map_contents,
+                          &opts.source_map_embed, &opts.omit_source_map_url,
+                          &opts.source_map_root, &opts.plugin_paths,
+                          &opts.max_output_bytes, &opts.variables,
+                          _sink_converter, &output, &with_stats, &parse_only,
+                          &opts.cancel, &timeout)) {
+        return NULL;
+    }
+    _set_deadline(&opts, timeout);
+    if (!(source = _to_sass_source(string))) return NULL;
+    if (_init_callbacks(self, &opts) < 0) {
+        sass_free_memory(source);
         return NULL;
     }
 
-    context = sass_make_data_context(sass_copy_c_string(string));
+    context = sass_make_data_context(source);
     options = sass_data_context_get_options(context);
-    sass_option_set_output_style(options, output_style);
-    sass_option_set_source_comments(options, source_comments);
-    sass_option_set_include_path(options, include_paths);
-    sass_option_set_precision(options, precision);
-    sass_option_set_is_indented_syntax_src(options, indented);
-    sass_option_set_source_map_contents(options, source_map_contents);
-    sass_option_set_source_map_embed(options, source_map_embed);
-    sass_option_set_omit_source_map_url(options, omit_source_map_url);
-
-    if (PyBytes_Check(source_map_root) && PyBytes_Size(source_map_root)) {
-        sass_option_set_source_map_root(
-            options, PyBytes_AsString(source_map_root)
-        );
-    }
+    sass_option_set_is_indented_syntax_src(options, opts.indented);
+    _set_options(options, &opts);
 
-    _add_custom_functions(options, custom_functions);
-    _add_custom_importers(options, custom_importers);
-    sass_compile_data_context(context);
+    PySass_BEGIN_COMPILE
+    stop = _run_compiler(
+        sass_make_data_compiler(context), parse_only, &opts
+    );
+    PySass_END_COMPILE
 
     ctx = sass_data_context_get_context(context);
     error_status = sass_context_get_error_status(ctx);
     error_message = sass_context_get_error_message(ctx);
     output_string = sass_context_get_output_string(ctx);
-    result = Py_BuildValue(
-        PySass_IF_PY3("hy", "hs"),
-        (short int) !error_status,
-        error_status ? error_message : output_string
-    );
+    if (_check_stopped(self, &opts, stop, error_status, error_message) < 0) {
+        css = NULL;
+    } else if (error_status) {
+        css = PyBytes_FromString(error_message);
+    } else if (parse_only) {
+        css = Py_None;
+        Py_INCREF(css);
+    } else if (_raise_limits(self, &opts, output_string) < 0) {
+        css = NULL;
+    } else if (!PySass_HAS_SINK(&output)) {
+        css = PyBytes_FromString(output_string);
+    } else if (_write_sink(&output, output_string) == 0) {
+        css = Py_None;
+        Py_INCREF(css);
+    }
+    if (css == NULL) {
+        stats = NULL;
+    } else if (!error_status && with_stats && !parse_only) {
+        stats = _compile_stats(ctx, &opts);
+    } else {
+        stats = Py_None;
+        Py_INCREF(stats);
+    }
+    if (css != NULL && stats != NULL) {
+        result = Py_BuildValue("hOO", (short int) !error_status, css, stats);
+    }
+    Py_XDECREF(css);
+    Py_XDECREF(stats);
     sass_delete_data_context(context);
+    if (_report_profiles(&opts) < 0) Py_CLEAR(result);
+    PyMem_Free(opts.callbacks);
     return result;
 }
 
+/* Compiles the file of filename, or source if it isn't None as if it were
+ * the contents of the file, e.g. for relative imports and source maps. */
 static PyObject *
 PySass_compile_filename(PyObject *self, PyObject *args) {
     struct Sass_Context *ctx;
-    struct Sass_File_Context *context;
+    struct Sass_File_Context *context = NULL;
+    struct Sass_Data_Context *data_context = NULL;
     struct Sass_Options *options;
-    char *filename, *include_paths;
+    struct PySass_Options opts;
+    struct PySass_Sink output, source_map_output;
+    char *filename, *string;
     const char *error_message, *output_string, *source_map_string;
-    enum Sass_Output_Style output_style;
-    int source_comments, error_status, precision, source_map_embed,
-        source_map_contents, omit_source_map_url;
-    PyObject *source_map_filename, *custom_functions, *custom_importers,
-             *result, *output_filename_hint, *source_map_root;
+    int error_status, with_stats, parse_only, stop;
+    double timeout;
+    PyObject *source, *source_map_filename, *result, *output_filename_hint;
+    PyObject *css = NULL, *source_map = NULL, *stats = NULL;
 
     if (!PyArg_ParseTuple(args,
-                          PySass_IF_PY3("yiiyiOOOOiiiO", "siisiOOOOiiiO"),
-                          &filename, &output_style, &source_comments,
-                          &include_paths, &precision,
-                          &source_map_filename, &custom_functions,
-                          &custom_importers, &output_filename_hint,
-                          &source_map_contents, &source_map_embed,
-                          &omit_source_map_url, &source_map_root)) {
+                          PySass_IF_PY3("yOpiiyiOOOOiiiOynOO&O&ppOd",
+                                        "sOiiisiOOOOiiiOsnOO&O&iiOd"),
+                          &filename, &source, &opts.indented,
+                          &opts.output_style, &opts.source_comments,
+                          &opts.include_paths, &opts.precision,
+                          &source_map_filename, &opts.custom_functions,
+                          &opts.custom_importers, &output_filename_hint,
+                          &opts.source_map_contents, &opts.source_map_embed,
+                          &opts.omit_source_map_url, &opts.source_map_root,
+                          &opts.plugin_paths, &opts.max_output_bytes,
+                          &opts.variables, _sink_converter, &output,
+                          _sink_converter, &source_map_output,
+                          &with_stats, &parse_only,
+                          &opts.cancel, &timeout)) {
+        return NULL;
+    }
+    _set_deadline(&opts, timeout);
+    if (source == Py_None) {
+        string = NULL;
+    } else if (!(string = _to_sass_source(source))) {
+        return NULL;
+    }
+    if (_init_callbacks(self, &opts) < 0) {
+        if (string != NULL) sass_free_memory(string);
         return NULL;
     }
 
-    context = sass_make_file_context(filename);
-    options = sass_file_context_get_options(context);
+    if (string == NULL) {
+        context = sass_make_file_context(filename);
+        options = sass_file_context_get_options(context);
+    } else {
+        data_context = sass_make_data_context(string);
+        options = sass_data_context_get_options(data_context);
+        sass_option_set_input_path(options, filename);
+        sass_option_set_is_indented_syntax_src(options, opts.indented);
+    }
 
     if (PyBytes_Check(source_map_filename)) {
         if (PyBytes_Size(source_map_filename)) {
@@ -610,43 +2682,437 @@ PySass_compile_filename(PyObject *self, PyObject *args) {
         }
     }
 
-    if (PyBytes_Check(source_map_root) && PyBytes_Size(source_map_root)) {
-        sass_option_set_source_map_root(
-            options, PyBytes_AsString(source_map_root)
-        );
-    }
+    _set_options(options, &opts);
 
-    sass_option_set_output_style(options, output_style);
-    sass_option_set_source_comments(options, source_comments);
-    sass_option_set_include_path(options, include_paths);
-    sass_option_set_precision(options, precision);
-    sass_option_set_source_map_contents(options, source_map_contents);
-    sass_option_set_source_map_embed(options, source_map_embed);
-    sass_option_set_omit_source_map_url(options, omit_source_map_url);
-    _add_custom_functions(options, custom_functions);
-    _add_custom_importers(options, custom_importers);
-    sass_compile_file_context(context);
+    PySass_BEGIN_COMPILE
+    stop = _run_compiler(
+        context ? sass_make_file_compiler(context)
+                : sass_make_data_compiler(data_context),
+        parse_only, &opts
+    );
+    PySass_END_COMPILE
 
-    ctx = sass_file_context_get_context(context);
+    ctx = context ? sass_file_context_get_context(context)
+                  : sass_data_context_get_context(data_context);
     error_status = sass_context_get_error_status(ctx);
     error_message = sass_context_get_error_message(ctx);
     output_string = sass_context_get_output_string(ctx);
     source_map_string = sass_context_get_source_map_string(ctx);
-    result = Py_BuildValue(
-        PySass_IF_PY3("hyy", "hss"),
-        (short int) !error_status,
-        error_status ? error_message : output_string,
-        error_status || source_map_string == NULL ? "" : source_map_string
-    );
-    sass_delete_file_context(context);
+    if (_check_stopped(self, &opts, stop, error_status, error_message) < 0) {
+        result = NULL;
+    } else if (error_status) {
+        result = Py_BuildValue(
+            PySass_IF_PY3("hyyO", "hssO"),
+            (short int) 0, error_message, "", Py_None
+        );
+    } else if (parse_only) {
+        result = Py_BuildValue(
+            "hOOO", (short int) 1, Py_None, Py_None, Py_None
+        );
+    } else if (_raise_limits(self, &opts, output_string) < 0) {
+        result = NULL;
+    } else {
+        if (source_map_string == NULL) source_map_string = "";
+        result = NULL;
+        /* Written ones are returned as None */
+        if (PySass_HAS_SINK(&output)) {
+            if (_write_sink(&output, output_string) == 0) {
+                css = Py_None;
+                Py_INCREF(css);
+            }
+        } else {
+            css = PyBytes_FromString(output_string);
+        }
+        if (css != NULL && PySass_HAS_SINK(&source_map_output)) {
+            if (_write_sink(&source_map_output, source_map_string) == 0) {
+                source_map = Py_None;
+                Py_INCREF(source_map);
+            }
+        } else if (css != NULL) {
+            source_map = PyBytes_FromString(source_map_string);
+        }
+        if (source_map != NULL && with_stats) {
+            stats = _compile_stats(ctx, &opts);
+        } else if (source_map != NULL) {
+            stats = Py_None;
+            Py_INCREF(stats);
+        }
+        if (stats != NULL) {
+            result = Py_BuildValue(
+                "hOOO", (short int) 1, css, source_map, stats
+            );
+        }
+        Py_XDECREF(css);
+        Py_XDECREF(source_map);
+        Py_XDECREF(stats);
+    }
+    if (context) {
+        sass_delete_file_context(context);
+    } else {
+        sass_delete_data_context(data_context);
+    }
+    if (_report_profiles(&opts) < 0) Py_CLEAR(result);
+    PyMem_Free(opts.callbacks);
+    return result;
+}
+
+/* A job of compile_many(): exactly one of the contexts is set. */
+struct PySass_Job {
+    struct Sass_File_Context* file_context;
+    struct Sass_Data_Context* data_context;
+    struct PySass_Sink output;
+    int stop;  /* enum PySass_Stop, only written by the job's worker */
+};
+
+/* The state shared by the worker threads of one compile_many() call. */
+struct PySass_Batch {
+    struct PySass_Job* jobs;
+    Py_ssize_t size;
+    struct PySass_Options* opts;
+    Py_ssize_t next;          /* index of the next job to pick up */
+    int running;              /* number of workers which haven't finished */
+    PyInterpreterState* interp;  /* of the caller, to run callbacks in */
+    PyThread_type_lock lock;  /* guards next and running */
+    PyThread_type_lock done;  /* released by the last worker to finish */
+};
+
+static void _batch_work(struct PySass_Batch* batch) {
+    struct PySass_Job* job;
+    Py_ssize_t i;
+
+    for (;;) {
+        PyThread_acquire_lock(batch->lock, WAIT_LOCK);
+        i = batch->next++;
+        PyThread_release_lock(batch->lock);
+        if (i >= batch->size) break;
+
+        job = &batch->jobs[i];
+        if ((job->stop = _should_stop_nogil(batch->opts))) continue;
+        if (job->file_context) {
+            job->stop = _run_compiler(
+                sass_make_file_compiler(job->file_context), 0, batch->opts
+            );
+        } else {
+            job->stop = _run_compiler(
+                sass_make_data_compiler(job->data_context), 0, batch->opts
+            );
+        }
+    }
+}
+
+static void _batch_finish(struct PySass_Batch* batch) {
+    int last;
+    PyThread_acquire_lock(batch->lock, WAIT_LOCK);
+    last = --batch->running == 0;
+    PyThread_release_lock(batch->lock);
+    if (last) PyThread_release_lock(batch->done);
+}
+
+static void _batch_worker(void* arg) {
+    struct PySass_Batch* batch = arg;
+    /* Keep a thread state of the caller's interpreter for the whole life of
+     * the worker, so custom functions and importers don't create a new one
+     * per callback */
+    PyThreadState* thread_state = PyThreadState_New(batch->interp);
+    if (thread_state != NULL) {
+        PySass_thread_state = thread_state;
+        _batch_work(batch);
+        PySass_thread_state = NULL;
+        PyEval_AcquireThread(thread_state);
+        PyThreadState_Clear(thread_state);
+        PyEval_ReleaseThread(thread_state);
+        PyThreadState_Delete(thread_state);
+    }
+    /* Only after the thread state is gone, as the caller may return and
+     * its interpreter may be finalized right after */
+    _batch_finish(batch);
+}
+
+static PyObject *
+PySass_compile_many(PyObject *self, PyObject *args) {
+    struct PySass_Options opts;
+    struct PySass_Batch batch;
+    struct Sass_Options *options;
+    struct Sass_Context *ctx;
+    PyObject *jobs, *result = NULL;
+    Py_ssize_t i, max_workers;
+    int error_status, stop_on_error, with_stats, failed = 0;
+    int any_failed = 0, stop = PYSASS_RUNNING;
+    double timeout;
+
+    if (!PyArg_ParseTuple(args,
+                          PySass_IF_PY3("O!nppiiyiOiOiiiOynOOd",
+                                        "O!nppiisiOiOiiiOsnOOd"),
+                          &PyTuple_Type, &jobs, &max_workers, &stop_on_error,
+                          &with_stats,
+                          &opts.output_style, &opts.source_comments,
+                          &opts.include_paths, &opts.precision,
+                          &opts.custom_functions, &opts.indented,
+                          &opts.custom_importers, &opts.source_map_contents,
+                          &opts.source_map_embed, &opts.omit_source_map_url,
+                          &opts.source_map_root, &opts.plugin_paths,
+                          &opts.max_output_bytes, &opts.variables,
+                          &opts.cancel, &timeout)) {
+        return NULL;
+    }
+    _set_deadline(&opts, timeout);
+    if (_init_callbacks(self, &opts) < 0) return NULL;
+
+    batch.size = PyTuple_Size(jobs);
+    batch.next = 0;
+    batch.opts = &opts;
+    batch.jobs = PyMem_Malloc((batch.size + 1) * sizeof(*batch.jobs));
+    if (batch.jobs == NULL) {
+        PyMem_Free(opts.callbacks);
+        return PyErr_NoMemory();
+    }
+    memset(batch.jobs, 0, (batch.size + 1) * sizeof(*batch.jobs));
+
+    /* Contexts are set up front while we hold the GIL, so that the workers
+     * only have to run libsass */
+    for (i = 0; i < batch.size; i += 1) {
+        int is_filename;
+        PyObject* source;
+
+        if (!PyArg_ParseTuple(
+                PyTuple_GetItem(jobs, i), "pOO&", &is_filename, &source,
+                _sink_converter, &batch.jobs[i].output)) {
+            goto done;
+        }
+        if (is_filename) {
+            if (!PyBytes_Check(source)) {
+                PyErr_SetString(PyExc_TypeError, "filename must be bytes");
+                goto done;
+            }
+            batch.jobs[i].file_context = sass_make_file_context(
+                PyBytes_AsString(source)
+            );
+            options = sass_file_context_get_options(
+                batch.jobs[i].file_context
+            );
+        } else {
+            char* string = _to_sass_source(source);
+            if (string == NULL) goto done;
+            batch.jobs[i].data_context = sass_make_data_context(string);
+            options = sass_data_context_get_options(
+                batch.jobs[i].data_context
+            );
+            sass_option_set_is_indented_syntax_src(options, opts.indented);
+        }
+        _set_options(options, &opts);
+    }
+
+    if (max_workers > batch.size) max_workers = batch.size;
+    if (max_workers < 1) max_workers = 1;
+    batch.running = 1;
+    batch.lock = PyThread_allocate_lock();
+    batch.done = PyThread_allocate_lock();
+    if (batch.lock == NULL || batch.done == NULL) {
+        PyErr_NoMemory();
+        goto free_locks;
+    }
+    PyThread_acquire_lock(batch.done, WAIT_LOCK);
+    batch.interp = PyInterpreterState_Get();
+
+    PySass_BEGIN_COMPILE
+    /* The calling thread is one of the workers as well */
+    for (i = 1; i < max_workers; i += 1) {
+        PyThread_acquire_lock(batch.lock, WAIT_LOCK);
+        batch.running += 1;
+        PyThread_release_lock(batch.lock);
+        if (PyThread_start_new_thread(_batch_worker, &batch) ==
+                PYTHREAD_INVALID_THREAD_ID) {
+            /* Carry on with the workers we already have */
+            PyThread_acquire_lock(batch.lock, WAIT_LOCK);
+            batch.running -= 1;
+            PyThread_release_lock(batch.lock);
+            break;
+        }
+    }
+    _batch_work(&batch);
+    _batch_finish(&batch);
+    PyThread_acquire_lock(batch.done, WAIT_LOCK);
+    PyThread_release_lock(batch.done);
+    PySass_END_COMPILE
+
+    /* A stopped batch writes nothing, as it's stopped as a whole */
+    for (i = 0; i < batch.size; i += 1) {
+        if (batch.jobs[i].file_context) {
+            ctx = sass_file_context_get_context(batch.jobs[i].file_context);
+        } else {
+            ctx = sass_data_context_get_context(batch.jobs[i].data_context);
+        }
+        any_failed = any_failed || sass_context_get_error_status(ctx);
+        if (batch.jobs[i].stop) stop = batch.jobs[i].stop;
+    }
+    if (_check_stopped(self, &opts, stop, any_failed, NULL) < 0) {
+        goto free_locks;
+    }
+
+    /* Outputs are written in order, and with stop_on_error only up to the
+     * first failed job, as if the jobs were compiled one by one */
+    result = PyList_New(batch.size);
+    for (i = 0; result != NULL && i < batch.size; i += 1) {
+        PyObject* item;
+        const char* output_string;
+        int exceeded = 0;
+        if (batch.jobs[i].file_context) {
+            ctx = sass_file_context_get_context(batch.jobs[i].file_context);
+        } else {
+            ctx = sass_data_context_get_context(batch.jobs[i].data_context);
+        }
+        error_status = sass_context_get_error_status(ctx);
+        output_string = sass_context_get_output_string(ctx);
+        if (!error_status) {
+            exceeded = _check_limits(self, &opts, output_string, &item);
+            if (exceeded < 0) {
+                Py_CLEAR(result);
+                break;
+            }
+        }
+        failed = failed || error_status || exceeded;
+        if (exceeded) {
+            /* The error is given as it is instead of the message */
+            item = Py_BuildValue("hN", (short int) 0, item);
+        } else if (!error_status && PySass_HAS_SINK(&batch.jobs[i].output) &&
+                !(failed && stop_on_error)) {
+            item = _write_sink(&batch.jobs[i].output, output_string) < 0 ?
+                NULL : Py_BuildValue("hO", (short int) 1, Py_None);
+        } else if (!error_status && with_stats) {
+            item = Py_BuildValue(
+                PySass_IF_PY3("hyN", "hsN"), (short int) 1, output_string,
+                _compile_stats(ctx, &opts)
+            );
+        } else {
+            item = Py_BuildValue(
+                PySass_IF_PY3("hy", "hs"),
+                (short int) !error_status,
+                error_status ?
+                    sass_context_get_error_message(ctx) : output_string
+            );
+        }
+        if (item == NULL) {
+            Py_CLEAR(result);
+            break;
+        }
+        PyList_SetItem(result, i, item);
+    }
+
+free_locks:
+    if (batch.lock) PyThread_free_lock(batch.lock);
+    if (batch.done) PyThread_free_lock(batch.done);
+done:
+    for (i = 0; i < batch.size; i += 1) {
+        if (batch.jobs[i].file_context) {
+            sass_delete_file_context(batch.jobs[i].file_context);
+        } else if (batch.jobs[i].data_context) {
+            sass_delete_data_context(batch.jobs[i].data_context);
+        }
+    }
+    PyMem_Free(batch.jobs);
+    if (_report_profiles(&opts) < 0) Py_CLEAR(result);
+    PyMem_Free(opts.callbacks);
     return result;
 }
 
+/* Converts a tuple of (name, value) pairs, the name as UTF-8 bytes without
+ * $, into a capsule of struct PySass_Variables */
+static PyObject* PySass_make_variables(PyObject* self, PyObject* args) {
+    struct PySass_State* state = PySass_GetState(self);
+    struct PySass_Variables* variables;
+    PyObject *items, *capsule;
+    Py_ssize_t i, size, header_size = 1;
+    char* end;
+
+    if (!PyArg_ParseTuple(args, "O!", &PyTuple_Type, &items)) return NULL;
+    if (_load_state(state) < 0) return NULL;
+    size = PyTuple_Size(items);
+    for (i = 0; i < size; i += 1) {
+        PyObject* name = PyTuple_GetItem(PyTuple_GetItem(items, i), 0);
+        if (!PyBytes_Check(name)) {
+            PyErr_SetString(PyExc_TypeError, "name must be bytes");
+            return NULL;
+        }
+        /* $name: -pysass-variable(i);\n */
+        header_size += PyBytes_Size(name) +
+            sizeof(PySass_VARIABLE_FUNCTION) + 30;
+    }
+
+    variables = PyMem_Calloc(1, sizeof(*variables));
+    if (variables == NULL) return PyErr_NoMemory();
+    if (!(capsule = PyCapsule_New(
+            variables, PySass_VARIABLES_CAPSULE, _delete_variables_capsule))) {
+        PyMem_Free(variables);
+        return NULL;
+    }
+    variables->values = PyMem_Calloc(size + 1, sizeof(*variables->values));
+    variables->header = end = PyMem_Malloc(header_size);
+    if (variables->values == NULL || variables->header == NULL) {
+        Py_DECREF(capsule);
+        return PyErr_NoMemory();
+    }
+    variables->size = size;
+    *end = '\0';
+    for (i = 0; i < size; i += 1) {
+        PyObject* item = PyTuple_GetItem(items, i);
+        union Sass_Value* value = _to_sass_value(
+            state, PyTuple_GetItem(item, 1)
+        );
+        variables->values[i] = value;
+        if (sass_value_is_error(value) || sass_value_is_warning(value)) {
+            PyErr_Format(
+                PyExc_TypeError, "$%s: %s",
+                PyBytes_AsString(PyTuple_GetItem(item, 0)),
+                sass_value_is_error(value) ?
+                    sass_error_get_message(value) :
+                    sass_warning_get_message(value)
+            );
+            Py_DECREF(capsule);
+            return NULL;
+        }
+        end += sprintf(
+            end, "$%s: " PySass_VARIABLE_FUNCTION "(%ld);\n",
+            PyBytes_AsString(PyTuple_GetItem(item, 0)), (long)i
+        );
+    }
+    return capsule;
+}
+
+/* Makes a hashable key of the names and the values of variables made by
+ * PySass_make_variables(), which are serialized like FunctionCache keys */
+static PyObject* PySass_variables_key(PyObject* self, PyObject* capsule) {
+    struct PySass_Variables* variables = PyCapsule_GetPointer(
+        capsule, PySass_VARIABLES_CAPSULE
+    );
+    PyObject *key, *item;
+    Py_ssize_t i;
+
+    if (variables == NULL) return NULL;
+    if (!(key = PyTuple_New(variables->size + 1))) return NULL;
+    for (i = 0; i <= variables->size; i += 1) {
+        item = i ?
+            _function_cache_key(Py_None, variables->values[i - 1]) :
+            PyBytes_FromString(variables->header);
+        if (item == NULL) {
+            Py_DECREF(key);
+            return NULL;
+        }
+        PyTuple_SetItem(key, i, item);
+    }
+    return key;
+}
+
 static PyMethodDef PySass_methods[] = {
     {"compile_string", PySass_compile_string, METH_VARARGS,
      "Compile a Sass string."},
     {"compile_filename", PySass_compile_filename, METH_VARARGS,
      "Compile a Sass file."},
+    {"compile_many", PySass_compile_many, METH_VARARGS,
+     "Compile many Sass files and strings on a pool of native threads."},
+    {"make_variables", PySass_make_variables, METH_VARARGS,
+     "Convert Python values to be injected as Sass variables."},
+    {"variables_key", PySass_variables_key, METH_O,
+     "Make a hashable key of variables."},
     {NULL, NULL, 0, NULL}
 };
 
@@ -661,29 +3127,85 @@ PyObject* PySass_make_enum_dict() {
     return dct;
 }
 
-void PySass_init_module(PyObject *module) {
+static int _add_state_object(
+        PyObject *module, const char *name, PyObject *value
+) {
+    Py_INCREF(value);
+    if (PyModule_AddObject(module, name, value) < 0) {
+        Py_DECREF(value);
+        return -1;
+    }
+    return 0;
+}
+
+int PySass_init_module(PyObject *module) {
+    struct PySass_State *state = PySass_GetState(module);
     PyModule_AddObject(module, "OUTPUT_STYLES", PySass_make_enum_dict());
     PyModule_AddObject(module, "libsass_version", PyUnicode_FromString(libsass_version()));
+    if (
+            PySass_init_types(state) < 0 ||
+            _add_state_object(module, "SassNumber", state->number_type) < 0 ||
+            _add_state_object(module, "SassColor", state->color_type) < 0 ||
+            _add_state_object(module, "SassList", state->list_type) < 0 ||
+            _add_state_object(module, "SassError", state->error_type) < 0 ||
+            _add_state_object(module, "SassWarning", state->warning_type) < 0 ||
+            _add_state_object(
+                module, "SASS_SEPARATOR_COMMA", state->separator_comma
+            ) < 0 ||
+            _add_state_object(
+                module, "SASS_SEPARATOR_SPACE", state->separator_space
+            ) < 0
+    ) {
+        return -1;
+    }
+    return 0;
 }
 
 #if PY_MAJOR_VERSION >= 3
 
+static int PySass_traverse(PyObject *module, visitproc visit, void *arg) {
+    return _traverse_state(PySass_GetState(module), visit, arg);
+}
+
+static int PySass_clear(PyObject *module) {
+    _clear_state(PySass_GetState(module));
+    return 0;
+}
+
+static void PySass_free(void *module) {
+    PySass_clear((PyObject *)module);
+}
+
+/* Everything the module needs lives in its state, so every interpreter
+ * gets its own module, and it can run under a per-interpreter GIL */
+static PyModuleDef_Slot PySass_slots[] = {
+    {Py_mod_exec, (void*)PySass_init_module},
+#ifdef Py_mod_multiple_interpreters
+    {Py_mod_multiple_interpreters, Py_MOD_PER_INTERPRETER_GIL_SUPPORTED},
+#endif
+#ifdef Py_mod_gil
+    /* Nothing relies on the GIL; see PySass_LOCK() */
+    {Py_mod_gil, Py_MOD_GIL_NOT_USED},
+#endif
+    {0, NULL}
+};
+
 static struct PyModuleDef sassmodule = {
     PyModuleDef_HEAD_INIT,
     "_sass",
     PySass_doc,
-    -1,
-    PySass_methods
+    sizeof(struct PySass_State),
+    PySass_methods,
+    PySass_slots,
+    PySass_traverse,
+    PySass_clear,
+    PySass_free
 };
 
 PyMODINIT_FUNC
 PyInit__sass()
 {
-    PyObject *module = PyModule_Create(&sassmodule);
-    if (module != NULL) {
-        PySass_init_module(module);
-    }
-    return module;
+    return PyModuleDef_Init(&sassmodule);
 }
 
 #else
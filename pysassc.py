@@ -77,6 +77,13 @@ There are options as well:
 
    .. versionadded:: 0.17.0
 
+.. option:: --plugin-path <dir>
+
+   Optional directory path to load libsass plugins from.
+   Can be multiply used.
+
+   .. versionadded:: 0.24.0
+
 .. option:: -v, --version
 
    Prints the program version.
@@ -151,6 +158,12 @@ def main(argv=sys.argv, stdout=sys.stdout, stderr=sys.stderr):
         help='Path to find "@import"ed (S)CSS source files. '
              'Can be multiply used.',
     )
+    parser.add_option(
+        '--plugin-path', metavar='DIR',
+        dest='plugin_paths', action='append',
+        help='Path to find libsass plugins to load. '
+             'Can be multiply used.',
+    )
     parser.add_option(
         '-p', '--precision', action='store', type='int', default=5,
         help='Set the precision for numbers. [default: %default]',
@@ -190,10 +203,12 @@ def main(argv=sys.argv, stdout=sys.stdout, stderr=sys.stderr):
             FutureWarning,
         )
 
+    # With the output filename given, _sass writes to it by itself
+    output_file = args[1] if len(args) > 1 else None
     try:
         if options.source_map:
             source_map_filename = options.source_map_file or args[1] + '.map'
-            css, source_map = sass.compile(
+            sass.compile(
                 filename=filename,
                 output_style=options.style,
                 source_comments=options.source_comments,
@@ -204,17 +219,20 @@ def main(argv=sys.argv, stdout=sys.stdout, stderr=sys.stderr):
                 source_map_root=options.source_map_root,
                 output_filename_hint=args[1],
                 include_paths=options.include_paths,
+                plugin_paths=options.plugin_paths,
                 precision=options.precision,
+                output_file=output_file,
+                source_map_file=source_map_filename,
             )
         else:
-            source_map_filename = None
-            source_map = None
             css = sass.compile(
                 filename=filename,
                 output_style=options.style,
                 source_comments=options.source_comments,
                 include_paths=options.include_paths,
+                plugin_paths=options.plugin_paths,
                 precision=options.precision,
+                output_file=output_file,
             )
     except OSError as e:
         error(e)
@@ -223,16 +241,8 @@ def main(argv=sys.argv, stdout=sys.stdout, stderr=sys.stderr):
         error(e)
         return 1
     else:
-        if len(args) < 2:
+        if output_file is None:
             print(css, file=stdout)
-        else:
-            with open(args[1], 'w', encoding='utf-8', newline='') as f:
-                f.write(css)
-        if source_map_filename:
-            with open(
-                source_map_filename, 'w', encoding='utf-8', newline='',
-            ) as f:
-                f.write(source_map)
     return 0
 
 
@@ -10,19 +10,39 @@ type.
 'a b {\n  color: blue; }\n'
 
 """
+import asyncio
 import collections.abc
+import concurrent.futures
+import functools
+import hashlib
 import inspect
+import io
+import json
+import marshal
+import multiprocessing
+import multiprocessing.connection
 import os.path
+import pickle
 import re
 import sys
+import tempfile
+import threading
+import time
+import types
 import warnings
+import weakref
 
 import _sass
 
 __all__ = (
-    'MODES', 'OUTPUT_STYLES', 'SOURCE_COMMENTS', 'CompileError', 'SassColor',
-    'SassError', 'SassFunction', 'SassList', 'SassMap', 'SassNumber',
-    'SassWarning', 'and_join', 'compile', 'libsass_version',
+    'MODES', 'OUTPUT_STYLES', 'OUTPUT_TYPES', 'SOURCE_COMMENTS',
+    'CompileCancelled', 'CompileError', 'CompileLimitExceeded',
+    'CompileCache', 'CompileCrashed', 'CompileResult', 'CompileTimeout',
+    'Compiler', 'DiskCompileCache', 'FunctionCache', 'FunctionProfile',
+    'ProcessPoolCompiler',
+    'SassColor', 'SassError', 'SassFunction', 'SassList', 'SassMap',
+    'SassMapProxy', 'SassNumber', 'SassWarning', 'and_join', 'check',
+    'compile', 'compile_async', 'compile_many', 'libsass_version', 'pure',
 )
 __version__ = '0.23.0'
 libsass_version = _sass.libsass_version
@@ -43,6 +63,12 @@ SOURCE_COMMENTS = {'none': 0, 'line_numbers': 1, 'default': 1, 'map': 2}
 #: (:class:`frozenset`) The set of keywords :func:`compile()` can take.
 MODES = frozenset(('string', 'filename', 'dirname'))
 
+#: (:class:`frozenset`) The set of types :func:`compile()` can return
+#: compiled CSS and source maps as.
+#:
+#: .. versionadded:: 0.24.0
+OUTPUT_TYPES = frozenset(('str', 'bytes', 'result'))
+
 
 def to_native_s(s):
     if isinstance(s, bytes):
@@ -60,6 +86,52 @@ class CompileError(ValueError):
         super().__init__(to_native_s(msg))
 
 
+class CompileCancelled(CompileError):
+    """The exception type that is raised when a compile is stopped by its
+    ``cancel`` token.  See also `timeouts and cancellation
+    <timeouts-and-cancellation_>`_.
+
+    .. versionadded:: 0.24.0
+
+    """
+
+
+class CompileCrashed(CompileError):
+    """The exception type that is raised when the worker process of
+    :class:`ProcessPoolCompiler` crashes while it compiles the source,
+    e.g. because libsass segfaults.
+
+    .. versionadded:: 0.24.0
+
+    """
+
+
+class CompileLimitExceeded(CompileError):
+    """The exception type that is raised when a compile exceeds its limit
+    e.g. ``max_output_bytes`` of :func:`compile()`.
+
+    .. versionadded:: 0.24.0
+
+    """
+
+
+class CompileTimeout(CompileCancelled):
+    """The exception type that is raised when a compile is stopped as it
+    didn't finish within its ``timeout``.  See also `timeouts and
+    cancellation <timeouts-and-cancellation_>`_.
+
+    .. versionadded:: 0.24.0
+
+    """
+
+
+def _to_compile_error(v):
+    """Makes :exc:`CompileError` of what :mod:`_sass` gives for a failed
+    compile: an error message, or an exception of it which it made by itself.
+    """
+    return v if isinstance(v, CompileError) else CompileError(v)
+
+
 def mkdirp(path):
     try:
         os.makedirs(path)
@@ -69,6 +141,77 @@ def mkdirp(path):
         raise
 
 
+def _to_sink(file):
+    """Converts ``output_file`` or ``source_map_file`` to what :mod:`_sass`
+    writes to by itself: a file descriptor or an encoded path.  Returns
+    :const:`None` for text files and file objects without a file descriptor,
+    which have to be written in Python instead; see :func:`_write_to()`.
+    """
+    if file is None or isinstance(file, io.TextIOBase):
+        return None
+    elif isinstance(file, int):
+        return file
+    elif isinstance(file, (str, bytes, os.PathLike)):
+        return os.fsencode(file)
+    elif not callable(getattr(file, 'write', None)):
+        raise TypeError(
+            'output must be a path, a file object, or a file descriptor, '
+            'not ' + repr(file),
+        )
+    try:
+        fd = file.fileno()
+    except (AttributeError, OSError):  # io.UnsupportedOperation as well
+        return None
+    # What is buffered has to go before what _sass writes
+    file.flush()
+    return fd
+
+
+def _encode_filename(filename, is_file=True):
+    """Validates the ``filename`` of a source to compile, and encodes it
+    for :mod:`_sass`.  Unless ``is_file`` is set, the file doesn't have to
+    exist, as its contents are given in memory.
+    """
+    if not isinstance(filename, str):
+        raise TypeError('filename must be a string, not ' + repr(filename))
+    elif is_file and not os.path.isfile(filename):
+        raise OSError(f'{filename!r} seems not a file')
+    fs_encoding = sys.getfilesystemencoding() or sys.getdefaultencoding()
+    return filename.encode(fs_encoding)
+
+
+def _to_stop_args(timeout, cancel):
+    """Validates ``timeout`` and ``cancel``, and converts them to what
+    :mod:`_sass` takes.
+    """
+    if cancel is not None and not callable(getattr(cancel, 'is_set', None)):
+        raise TypeError(
+            'cancel must have is_set() method e.g. threading.Event, not ' +
+            repr(cancel),
+        )
+    if timeout is None:
+        return cancel, -1.0
+    elif isinstance(timeout, bool) or not isinstance(timeout, (int, float)):
+        raise TypeError('timeout must be a number, not ' + repr(timeout))
+    elif timeout < 0:
+        raise ValueError('timeout must not be negative, not ' + repr(timeout))
+    return cancel, float(timeout)
+
+
+def _write_to(file, output):
+    """Writes UTF-8 encoded ``output`` to the ``file`` :func:`_to_sink()`
+    couldn't convert, or to what it converted to when :mod:`_sass` doesn't
+    write, e.g. cached outputs.
+    """
+    if isinstance(file, io.TextIOBase):
+        file.write(output.decode('utf-8'))
+    elif isinstance(file, (int, str, bytes, os.PathLike)):
+        with open(file, 'wb', closefd=not isinstance(file, int)) as f:
+            f.write(output)
+    else:
+        file.write(output)
+
+
 class SassFunction:
     """Custom function for Sass.  It can be instantiated using
     :meth:`from_lambda()` and :meth:`from_named_function()` as well.
@@ -79,15 +222,28 @@ class SassFunction:
     :type arguments: :class:`collections.abc.Sequence`
     :param callable_: the actual function to be called
     :type callable_: :class:`collections.abc.Callable`
+    :param lazy: whether to pass Sass maps as :class:`SassMapProxy`, which
+                 converts only the keys and values looked up, instead of
+                 converting them as a whole.  :const:`False` by default
+    :type lazy: :class:`bool`
+    :param pure: whether the function always returns the same for the same
+                 arguments, and has no side effects, so that what it returns
+                 can be remembered in :class:`FunctionCache`.  callables
+                 decorated with :func:`pure()` are pure anyway.
+                 :const:`False` by default
+    :type pure: :class:`bool`
 
     .. versionadded:: 0.7.0
 
+    .. versionadded:: 0.24.0
+       The ``lazy`` and ``pure`` parameters.
+
     """
 
-    __slots__ = 'name', 'arguments', 'callable_'
+    __slots__ = 'name', 'arguments', 'callable_', 'lazy', 'pure'
 
     @classmethod
-    def from_lambda(cls, name, lambda_):
+    def from_lambda(cls, name, lambda_, lazy=False, pure=False):
         """Make a :class:`SassFunction` object from the given ``lambda_``
         function.  Since lambda functions don't have their name, it need
         its ``name`` as well.  Arguments are automatically inspected.
@@ -96,6 +252,10 @@ class SassFunction:
         :type name: :class:`str`
         :param lambda_: the actual lambda function to be called
         :type lambda_: :class:`types.LambdaType`
+        :param lazy: whether to pass Sass maps as :class:`SassMapProxy`
+        :type lazy: :class:`bool`
+        :param pure: whether to remember what the function returns
+        :type pure: :class:`bool`
         :returns: a custom function wrapper of the ``lambda_`` function
         :rtype: :class:`SassFunction`
 
@@ -111,24 +271,30 @@ class SassFunction:
                     name, lambda_,
                 ),
             )
-        return cls(name, a.args, lambda_)
+        return cls(name, a.args, lambda_, lazy=lazy, pure=pure)
 
     @classmethod
-    def from_named_function(cls, function):
+    def from_named_function(cls, function, lazy=False, pure=False):
         """Make a :class:`SassFunction` object from the named ``function``.
         Function name and arguments are automatically inspected.
 
         :param function: the named function to be called
         :type function: :class:`types.FunctionType`
+        :param lazy: whether to pass Sass maps as :class:`SassMapProxy`
+        :type lazy: :class:`bool`
+        :param pure: whether to remember what the function returns
+        :type pure: :class:`bool`
         :returns: a custom function wrapper of the ``function``
         :rtype: :class:`SassFunction`
 
         """
         if not getattr(function, '__name__', ''):
             raise TypeError('function must be named')
-        return cls.from_lambda(function.__name__, function)
+        return cls.from_lambda(
+            function.__name__, function, lazy=lazy, pure=pure,
+        )
 
-    def __init__(self, name, arguments, callable_):
+    def __init__(self, name, arguments, callable_, lazy=False, pure=False):
         if not isinstance(name, str):
             raise TypeError('name must be a string, not ' + repr(name))
         elif not isinstance(arguments, collections.abc.Sequence):
@@ -144,6 +310,8 @@ class SassFunction:
             for arg in arguments
         )
         self.callable_ = callable_
+        self.lazy = bool(lazy)
+        self.pure = bool(pure or getattr(callable_, '_sass_pure', False))
 
     @property
     def signature(self):
@@ -157,6 +325,597 @@ class SassFunction:
         return self.signature
 
 
+def pure(function):
+    """Marks the custom ``function`` as pure, i.e. it always returns the same
+    for the same arguments, and has no side effects.  It's the same to
+    ``pure=True`` of :class:`SassFunction`, but works with every form of
+    ``custom_functions`` of :func:`compile()`.
+
+    .. code-block:: python
+
+       @sass.pure
+       def rem(px):
+           return sass.SassNumber(px.value / 16, 'rem')
+
+    .. versionadded:: 0.24.0
+
+    """
+    function._sass_pure = True
+    return function
+
+
+class FunctionCache:
+    """A bounded LRU cache of what pure custom functions (see ``pure`` of
+    :class:`SassFunction`) returned for their arguments.  The arguments are
+    looked up without converting them to Python, and cached results are
+    given back to libsass without calling Python at all.
+
+    A :class:`Compiler` makes its own unless ``function_cache`` is given,
+    so that its compiles share the results.  Pass the same cache to share
+    them wider, e.g. throughout a build.
+
+    :param maxsize: the number of results to keep.  :const:`1024` by default
+    :type maxsize: :class:`int`
+
+    .. versionadded:: 0.24.0
+
+    """
+
+    __slots__ = 'maxsize', 'hits', 'misses', '_results', '_lock'
+
+    def __init__(self, maxsize=1024):
+        if isinstance(maxsize, bool) or not isinstance(maxsize, int):
+            raise TypeError('maxsize must be an integer, not ' + repr(maxsize))
+        elif maxsize < 0:
+            raise ValueError('maxsize must not be negative, not ' +
+                             repr(maxsize))
+        #: (:class:`int`) The number of results to keep.
+        self.maxsize = maxsize
+        #: (:class:`int`) The number of calls answered from the cache.
+        self.hits = 0
+        #: (:class:`int`) The number of calls which called the functions.
+        self.misses = 0
+        self._results = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._results)
+
+    def __reduce__(self):
+        # Other interpreters and processes get an empty one of their own
+        return type(self), (self.maxsize,)
+
+    def clear(self):
+        """Forgets every result, and resets the counters."""
+        with self._lock:
+            self._results.clear()
+            self.hits = self.misses = 0
+
+    # _sass calls them with (function, serialized arguments) keys, and
+    # capsules of Sass values
+
+    def _get(self, key):
+        with self._lock:
+            try:
+                result = self._results[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._results.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def _put(self, key, result):
+        with self._lock:
+            self._results[key] = result
+            if len(self._results) > self.maxsize:
+                self._results.popitem(last=False)
+
+
+def _file_state(path):
+    """The state of an included file a cached compile depends on, or
+    :const:`None` if it isn't a file e.g. what an importer returned.
+    """
+    try:
+        stat = os.stat(path)
+    except (OSError, ValueError):
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class CompileCache:
+    """A size-bounded LRU cache of compiled CSS, accounted in bytes.  A
+    compile with the same source, the same options, and every included file
+    unmodified since then is answered from the cache without running
+    libsass.  Every job of :func:`compile_many()` and every file of
+    ``dirname`` mode is cached on its own.
+
+    Included files are compared by their modification times and sizes, so
+    files which didn't exist when a result was cached, e.g. a new partial
+    which would shadow an imported one, aren't noticed.  Custom functions
+    and importers are assumed to give the same results for the same
+    arguments; :meth:`invalidate()` the cache when they don't.
+
+    Pass the same cache to share the results between compiles, e.g. to
+    every :func:`compile()` in request handlers.
+
+    :param max_bytes: the approximate number of bytes of the sources and
+                      results to keep.  64 MiB by default
+    :type max_bytes: :class:`int`
+
+    .. versionadded:: 0.24.0
+
+    """
+
+    __slots__ = (
+        'max_bytes', 'size', 'hits', 'misses', 'evictions', '_results',
+        '_lock',
+    )
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        if isinstance(max_bytes, bool) or not isinstance(max_bytes, int):
+            raise TypeError(
+                'max_bytes must be an integer, not ' + repr(max_bytes),
+            )
+        elif max_bytes < 0:
+            raise ValueError(
+                'max_bytes must not be negative, not ' + repr(max_bytes),
+            )
+        #: (:class:`int`) The approximate number of bytes to keep.
+        self.max_bytes = max_bytes
+        #: (:class:`int`) The approximate number of bytes kept.
+        self.size = 0
+        #: (:class:`int`) The number of compiles answered from the cache.
+        self.hits = 0
+        #: (:class:`int`) The number of compiles which ran libsass.
+        self.misses = 0
+        #: (:class:`int`) The number of results dropped to keep the size
+        #: under :attr:`max_bytes`.
+        self.evictions = 0
+        self._results = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._results)
+
+    def __reduce__(self):
+        # Other interpreters and processes get an empty one of their own
+        return type(self), (self.max_bytes,)
+
+    def invalidate(self, filename=None):
+        """Forgets every result, or only those which included ``filename``
+        if it's given.  The counters are kept.
+
+        :param filename: optional path of a source or an included file
+        :type filename: :class:`str`, :class:`os.PathLike`
+
+        """
+        if filename is not None:
+            filename = os.fsencode(os.path.abspath(filename))
+        with self._lock:
+            if filename is None:
+                self._results.clear()
+                self.size = 0
+                return
+            for key, (_, files, size) in list(self._results.items()):
+                if filename in files or key[1:] == ('filename', filename):
+                    del self._results[key]
+                    self.size -= size
+
+    def _key(self, options_key, mode, source, paths):
+        """The key of the result of compiling ``source``, a filename or
+        a string, with the options of ``options_key`` and ``paths``, the
+        encoded include paths and the absolute ``filename_hint`` if any.
+        """
+        return (options_key, paths), mode, source
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._results.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._results.move_to_end(key)
+        result, files, size = entry
+        # Checked without the lock as it may take a while
+        if all(_file_state(path) == state for path, state in files.items()):
+            with self._lock:
+                self.hits += 1
+            return result
+        with self._lock:
+            if self._results.get(key) is entry:
+                del self._results[key]
+                self.size -= size
+            self.misses += 1
+        return None
+
+    def _put(self, key, result, started):
+        """Caches ``result`` of :mod:`_sass`, whose last item is the stats,
+        of a compile which ``started`` at :func:`time.time_ns()`.
+        """
+        files = {}
+        for path in result[-1][0]:
+            state = files[path] = _file_state(path)
+            # It may have been read before or after the modification, as
+            # file systems don't record modification times precisely
+            if state is not None and state[0] >= started - 1_000_000_000:
+                return
+        source = key[-1]
+        size = sum(
+            len(item) for item in (*result[1:-1], source, *files)
+            if item is not None
+        )
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            entry = self._results.pop(key, None)
+            if entry is not None:
+                self.size -= entry[2]
+            self._results[key] = result, files, size
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, _, evicted) = self._results.popitem(last=False)
+                self.size -= evicted
+                self.evictions += 1
+
+
+def _stable_key(value, _seen=()):
+    """Converts the options key of a compiler to what is the same in every
+    process, which callables aren't; functions are identified by their
+    qualified names and code, along with their defaults and what their
+    closures hold.  Raises :exc:`TypeError` for what can't be identified,
+    e.g. objects which have their own state.
+    """
+    if isinstance(value, tuple):
+        return tuple(_stable_key(item, _seen) for item in value)
+    elif value is None or isinstance(value, (bool, int, float, str, bytes)):
+        return value
+    elif isinstance(value, re.Pattern):
+        return 're', value.pattern, value.flags
+    name = (
+        getattr(value, '__module__', None),
+        getattr(value, '__qualname__', None),
+    )
+    if isinstance(value, type):
+        return name
+    elif isinstance(value, types.BuiltinFunctionType) and (
+        value.__self__ is None or isinstance(value.__self__, types.ModuleType)
+    ):
+        return name
+    elif isinstance(value, functools.partial):
+        return (
+            'partial', _stable_key(value.func, _seen),
+            _stable_key(value.args, _seen),
+            _stable_key(tuple(sorted(value.keywords.items())), _seen),
+        )
+    elif not isinstance(value, types.FunctionType):
+        raise TypeError(
+            'cannot identify {!r} in other processes'.format(value),
+        )
+    elif id(value) in _seen:  # a recursive closure
+        return name
+    _seen += id(value),
+    try:
+        cells = tuple(cell.cell_contents for cell in value.__closure__ or ())
+    except ValueError:  # an empty cell
+        raise TypeError(
+            'cannot identify {!r} in other processes'.format(value),
+        )
+    return name + (
+        hashlib.sha256(marshal.dumps(value.__code__)).hexdigest(),
+        _stable_key(value.__defaults__, _seen),
+        _stable_key(
+            tuple(sorted((value.__kwdefaults__ or {}).items())), _seen,
+        ),
+        _stable_key(cells, _seen),
+    )
+
+
+def _relpath(path):
+    """``path`` relative to the current directory if it's absolute, so that
+    it's the same in every checkout of the sources.
+    """
+    if os.path.isabs(path):
+        try:
+            return os.path.relpath(path)
+        except ValueError:
+            pass  # On another drive of Windows
+    return path
+
+
+class DiskCompileCache:
+    """A persistent cache of compiled CSS and source maps in ``directory``,
+    which many processes, e.g. parallel CI jobs, can share.  It's addressed
+    by the contents of the sources rather than their modification times:
+    a compile with the same source, the same options, and the same contents
+    of every included file is answered from the cache without running
+    libsass, even in a fresh checkout in another directory, as the paths of
+    the sources, included files, and include paths are taken relative to
+    the current directory.  It can be passed as ``compile_cache`` in place
+    of :class:`CompileCache`, and to
+    :func:`sassutils.builder.build_directory()` and the ``build_sass``
+    command as well.
+
+    Every entry is written atomically, so readers never see a partial one.
+    When the entries grow larger than ``max_bytes``, the least recently
+    used ones are removed.
+
+    Custom functions and importers are identified by their qualified names
+    and code, along with their default arguments and what their closures
+    hold, and are assumed to give the same results for the same arguments;
+    :meth:`invalidate()` the cache when they don't.  Compiles with any
+    callable which can't be identified that way, e.g. a bound method of an
+    object with its own state, aren't cached.
+
+    :param directory: the path of the directory to store the cache in.
+                      it's made if it doesn't exist
+    :type directory: :class:`str`, :class:`os.PathLike`
+    :param max_bytes: the approximate number of bytes to keep.
+                      512 MiB by default
+    :type max_bytes: :class:`int`
+
+    .. versionadded:: 0.24.0
+
+    """
+
+    __slots__ = (
+        'directory', 'max_bytes', 'hits', 'misses', 'evictions', '_written',
+        '_digests', '_lock',
+    )
+
+    #: The number of sets of included files kept for the same source
+    _MANIFEST_SIZE = 16
+
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024):
+        if isinstance(max_bytes, bool) or not isinstance(max_bytes, int):
+            raise TypeError(
+                'max_bytes must be an integer, not ' + repr(max_bytes),
+            )
+        elif max_bytes < 0:
+            raise ValueError(
+                'max_bytes must not be negative, not ' + repr(max_bytes),
+            )
+        #: (:class:`str`) The path of the directory the cache is stored in.
+        self.directory = os.fspath(directory)
+        #: (:class:`int`) The approximate number of bytes to keep.
+        self.max_bytes = max_bytes
+        #: (:class:`int`) The number of compiles answered from the cache by
+        #: this process.
+        self.hits = 0
+        #: (:class:`int`) The number of compiles which ran libsass in this
+        #: process.
+        self.misses = 0
+        #: (:class:`int`) The number of files this process removed to keep
+        #: the size under :attr:`max_bytes`.
+        self.evictions = 0
+        # The size is checked by the first write, and then every time
+        # an eighth of max_bytes has been written
+        self._written = max_bytes
+        # {path: ((mtime, size), digest)} of the included files hashed
+        self._digests = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def __reduce__(self):
+        return type(self), (self.directory, self.max_bytes)
+
+    def invalidate(self):
+        """Removes every entry of the cache.  The counters are kept."""
+        for path, _, _ in self._scan():
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def _scan(self):
+        """Yields (path, modification time, size) of every file of the
+        cache, including those being written.
+        """
+        with os.scandir(self.directory) as subdirs:
+            for subdir in subdirs:
+                if len(subdir.name) != 2 or not subdir.is_dir():
+                    continue
+                with os.scandir(subdir.path) as entries:
+                    for entry in entries:
+                        try:
+                            stat = entry.stat()
+                        except FileNotFoundError:
+                            continue
+                        yield entry.path, stat.st_mtime_ns, stat.st_size
+
+    def _path(self, digest, suffix):
+        return os.path.join(self.directory, digest[:2], digest[2:] + suffix)
+
+    def _read(self, path):
+        try:
+            with open(path, 'rb') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, path, data):
+        """Writes JSON ``data`` to ``path`` atomically.  Failures are
+        ignored as they only lose the entry.
+        """
+        data = json.dumps(data, separators=(',', ':')).encode('utf-8')
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(
+                dir=os.path.dirname(path), prefix='.tmp',
+            )
+        except OSError:
+            return
+        try:
+            with open(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except OSError:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            return
+        with self._lock:
+            self._written += len(data)
+            if self._written < self.max_bytes // 8:
+                return
+            self._written = 0
+        self._evict()
+
+    def _evict(self):
+        try:
+            entries = sorted(self._scan(), key=lambda entry: entry[1])
+        except OSError:
+            return
+        size = sum(entry[2] for entry in entries)
+        for path, _, entry_size in entries:
+            if size <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                continue
+            size -= entry_size
+            with self._lock:
+                self.evictions += 1
+
+    def _file_digest(self, path):
+        """The digest of the contents of an included file, or :const:`None`
+        if it isn't a file e.g. what an importer returned.
+        """
+        state = _file_state(path)
+        if state is None:
+            return None
+        cached = self._digests.get(path)
+        if cached is not None and cached[0] == state:
+            return cached[1]
+        try:
+            with open(path, 'rb') as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+        except OSError:
+            return None
+        # Modification times are trusted only if they're precise enough
+        if state[0] < time.time_ns() - 1_000_000_000:
+            self._digests[path] = state, digest
+        return digest
+
+    def _key(self, options_key, mode, source, paths):
+        try:
+            options_key = _stable_key(options_key)
+        except TypeError:
+            # Compiles with callables it can't tell apart aren't cached
+            return None
+        # Paths are relative to the current directory, so that checkouts
+        # in different directories share the entries
+        if mode == 'filename':
+            source = _relpath(source)
+        key = hashlib.sha256(
+            repr((
+                __version__, libsass_version, options_key, mode,
+                tuple(map(_relpath, paths)),
+            )).encode('utf-8'),
+        )
+        key.update(source if isinstance(source, bytes) else
+                   source.encode('utf-8', 'surrogatepass'))
+        return key.hexdigest(), mode
+
+    def _get(self, key):
+        if key is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        digest, mode = key
+        manifest_path = self._path(digest, '.manifest')
+        try:
+            for entry in reversed(self._read(manifest_path) or ()):
+                if not all(
+                    self._file_digest(os.path.abspath(os.fsencode(path))) ==
+                    file_digest
+                    for path, file_digest in entry['files'].items()
+                ):
+                    continue
+                result_path = self._path(entry['result'], '.css')
+                result = self._read(result_path)
+                if result is None:
+                    continue
+                result = self._to_result(mode, result)
+                # Recently used ones are evicted last
+                for path in manifest_path, result_path:
+                    try:
+                        os.utime(path)
+                    except OSError:
+                        pass
+                with self._lock:
+                    self.hits += 1
+                return result
+        except (AttributeError, KeyError, TypeError, ValueError):
+            pass  # An entry broken by someone else is a miss
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _to_result(self, mode, result):
+        """Converts a cached ``result`` to what :mod:`_sass` returns."""
+        source_map = result['source_map']
+        stats = (
+            tuple(
+                os.path.abspath(os.fsencode(path)) if absolute
+                else os.fsencode(path)
+                for path, absolute in result['included_files']
+            ),
+            result['output_size'], result['function_calls'],
+            result['importer_calls'], None,
+        )
+        css = result['css'].encode('utf-8')
+        if mode == 'string':
+            return True, css, stats
+        return (
+            True, css,
+            None if source_map is None else source_map.encode('utf-8'),
+            stats,
+        )
+
+    def _put(self, key, result, started):
+        if key is None:
+            return
+        digest, mode = key
+        stats = result[-1]
+        files = {}
+        for path in stats[0]:
+            state = _file_state(path)
+            # It may have been read before or after the modification, as
+            # file systems don't record modification times precisely
+            if state is not None and state[0] >= started - 1_000_000_000:
+                return
+            files[os.fsdecode(_relpath(path))] = self._file_digest(path)
+        source_map = result[2] if mode != 'string' else None
+        result_digest = hashlib.sha256(
+            (digest + json.dumps(files, sort_keys=True)).encode('utf-8'),
+        ).hexdigest()
+        self._write(self._path(result_digest, '.css'), {
+            'css': result[1].decode('utf-8'),
+            'source_map': None if source_map is None else
+            source_map.decode('utf-8'),
+            'included_files': [
+                (os.fsdecode(_relpath(path)), os.path.isabs(path))
+                for path in stats[0]
+            ],
+            'output_size': stats[1],
+            'function_calls': stats[2],
+            'importer_calls': stats[3],
+        })
+        manifest_path = self._path(digest, '.manifest')
+        entry = {'files': files, 'result': result_digest}
+        manifest = self._read(manifest_path)
+        if not isinstance(manifest, list):
+            manifest = []
+        manifest = [other for other in manifest if other != entry]
+        manifest = manifest[-(self._MANIFEST_SIZE - 1):] + [entry]
+        self._write(manifest_path, manifest)
+
+
 def _normalize_importer_return_value(result):
     # An importer must return an iterable of iterables of 1-3 stringlike
     # objects
@@ -182,23 +941,32 @@ def _normalize_importer_return_value(result):
     return tuple(_to_importer_result(x) for x in result)
 
 
+def _takes_prev_path(func):
+    """Tells whether the importer ``func`` takes the previously resolved path
+    besides the path to import.  It's inspected once when the importer is
+    registered instead of catching :exc:`TypeError` for every import.
+    """
+    try:
+        signature = inspect.signature(func)
+    except (TypeError, ValueError):  # e.g. some builtins
+        return True
+    try:
+        signature.bind('', '')
+    except TypeError:
+        return False
+    return True
+
+
 def _importer_callback_wrapper(func):
-    def inner(path, prev):
-        path, prev = path.decode('UTF-8'), prev.decode('UTF-8')
-        num_args = getattr(inner, '_num_args', None)
-        if num_args is None:
-            try:
-                ret = func(path, prev)
-            except TypeError:
-                inner._num_args = 1
-                ret = func(path)
-            else:
-                inner._num_args = 2
-        elif num_args == 2:
-            ret = func(path, prev)
-        else:
-            ret = func(path)
-        return _normalize_importer_return_value(ret)
+    if _takes_prev_path(func):
+        def inner(path, prev):
+            return _normalize_importer_return_value(func(path, prev))
+    else:
+        def inner(path, prev):
+            return _normalize_importer_return_value(func(path))
+    # The importer it wraps is what caches tell importers apart by, as
+    # every compiler wraps it anew
+    inner.__wrapped__ = func
     return inner
 
 
@@ -210,25 +978,40 @@ def _validate_importers(importers):
     if importers is None:
         return None
 
-    def _to_importer(priority, func):
+    def _to_importer(priority, func, path_filter=None):
         assert isinstance(priority, int), priority
         assert callable(func), func
-        return (priority, _importer_callback_wrapper(func))
+        # _sass matches them by itself to skip calling func at all
+        prefix = pattern = None
+        if isinstance(path_filter, str):
+            prefix = path_filter.encode('UTF-8')
+        elif (
+                isinstance(path_filter, re.Pattern) and
+                isinstance(path_filter.pattern, str)
+        ):
+            pattern = path_filter
+        elif path_filter is not None:
+            raise TypeError(
+                'importer filter must be a prefix string or a compiled '
+                'regular expression of str, not ' + repr(path_filter),
+            )
+        return (priority, _importer_callback_wrapper(func), prefix, pattern)
 
     # Our code assumes tuple of tuples
-    return tuple(_to_importer(priority, func) for priority, func in importers)
+    return tuple(_to_importer(*importer) for importer in importers)
 
 
 def _raise(e):
     raise e
 
 
-def compile_dirname(
-    search_path, output_path, output_style, source_comments, include_paths,
-    precision, custom_functions, importers, source_map_contents,
-    source_map_embed, omit_source_map_url, source_map_root,
-):
+def _dirname_jobs(search_path, output_path):
+    """Finds the sources :func:`compile_dirname()` compiles, and makes the
+    directories of their outputs on the way.  Returns the jobs
+    :func:`_sass.compile_many()` takes.
+    """
     fs_encoding = sys.getfilesystemencoding() or sys.getdefaultencoding()
+    jobs = []
     for dirpath, _, filenames in os.walk(search_path, onerror=_raise):
         filenames = [
             filename for filename in filenames
@@ -240,50 +1023,928 @@ def compile_dirname(
             relpath_to_file = os.path.relpath(input_filename, search_path)
             output_filename = os.path.join(output_path, relpath_to_file)
             output_filename = re.sub('.s[ac]ss$', '.css', output_filename)
-            input_filename = input_filename.encode(fs_encoding)
-            s, v, _ = _sass.compile_filename(
-                input_filename, output_style, source_comments, include_paths,
-                precision, None, custom_functions, importers, None,
-                source_map_contents, source_map_embed, omit_source_map_url,
-                source_map_root,
-            )
-            if s:
-                v = v.decode('UTF-8')
-                mkdirp(os.path.dirname(output_filename))
-                with open(
-                    output_filename, 'w', encoding='UTF-8', newline='',
-                ) as output_file:
-                    output_file.write(v)
-            else:
-                return False, v
+            mkdirp(os.path.dirname(output_filename))
+            jobs.append((
+                True, input_filename.encode(fs_encoding),
+                os.fsencode(output_filename),
+            ))
+    return tuple(jobs)
+
+
+def compile_dirname(
+    search_path, output_path, output_style, source_comments, include_paths,
+    precision, custom_functions, importers, source_map_contents,
+    source_map_embed, omit_source_map_url, source_map_root, plugin_paths,
+    max_output_bytes=-1, variables=None, cancel=None, timeout=-1.0,
+):
+    # _sass writes what succeeded up to the first error
+    results = _sass.compile_many(
+        _dirname_jobs(search_path, output_path), os.cpu_count() or 1, True,
+        False, output_style, source_comments, include_paths, precision,
+        custom_functions, False, importers, source_map_contents,
+        source_map_embed, omit_source_map_url, source_map_root, plugin_paths,
+        max_output_bytes, variables, cancel, timeout,
+    )
+    for s, v in results:
+        if not s:
+            return False, v
     return True, None
 
 
-def _check_no_remaining_kwargs(func, kwargs):
-    if kwargs:
+_Options = collections.namedtuple(
+    '_Options',
+    (
+        'output_style', 'source_comments', 'include_paths', 'precision',
+        'custom_functions', 'importers', 'source_map_contents',
+        'source_map_embed', 'omit_source_map_url', 'source_map_root',
+        'plugin_paths', 'max_output_bytes', 'variables',
+    ),
+)
+
+
+def _pop_options(kwargs, function_cache):
+    """Pops the options every mode of :func:`compile()` shares out of
+    ``kwargs``, and validates and converts them to what :mod:`_sass` takes.
+    """
+    precision = kwargs.pop('precision', 5)
+    output_style = kwargs.pop('output_style', 'nested')
+    if not isinstance(output_style, str):
         raise TypeError(
-            '{}() got unexpected keyword argument(s) {}'.format(
-                func.__name__,
-                ', '.join(f"'{arg}'" for arg in sorted(kwargs)),
-            ),
+            'output_style must be a string, not ' +
+            repr(output_style),
+        )
+    try:
+        output_style = OUTPUT_STYLES[output_style]
+    except KeyError:
+        raise CompileError(
+            '{} is unsupported output_style; choose one of {}'
+            ''.format(output_style, and_join(OUTPUT_STYLES)),
+        )
+    source_comments = kwargs.pop('source_comments', False)
+    if source_comments in SOURCE_COMMENTS:
+        if source_comments == 'none':
+            deprecation_message = (
+                'you can simply pass False to '
+                "source_comments instead of 'none'"
+            )
+            source_comments = False
+        elif source_comments in ('line_numbers', 'default'):
+            deprecation_message = (
+                'you can simply pass True to '
+                'source_comments instead of ' +
+                repr(source_comments)
+            )
+            source_comments = True
+        else:
+            deprecation_message = (
+                "you don't have to pass 'map' to "
+                'source_comments but just need to '
+                'specify source_map_filename'
+            )
+            source_comments = False
+        warnings.warn(
+            "values like 'none', 'line_numbers', and 'map' for "
+            'the source_comments parameter are deprecated; ' +
+            deprecation_message,
+            FutureWarning,
+        )
+    if not isinstance(source_comments, bool):
+        raise TypeError(
+            'source_comments must be bool, not ' +
+            repr(source_comments),
         )
 
+    source_map_contents = kwargs.pop('source_map_contents', False)
+    source_map_embed = kwargs.pop('source_map_embed', False)
+    omit_source_map_url = kwargs.pop('omit_source_map_url', False)
+    source_map_root = kwargs.pop('source_map_root', None)
 
-def compile(**kwargs):
-    r"""There are three modes of parameters :func:`compile()` can take:
-    ``string``, ``filename``, and ``dirname``.
+    if isinstance(source_map_root, str):
+        source_map_root = source_map_root.encode('utf-8')
 
-    The ``string`` parameter is the most basic way to compile Sass.
-    It simply takes a string of Sass code, and then returns a compiled
-    CSS string.
+    fs_encoding = sys.getfilesystemencoding() or sys.getdefaultencoding()
+    # #208: cwd is always included in include paths
+    include_paths = (os.getcwd(),)
+    include_paths += tuple(kwargs.pop('include_paths', ()) or ())
+    include_paths = os.pathsep.join(include_paths)
+    if isinstance(include_paths, str):
+        include_paths = include_paths.encode(fs_encoding)
+    plugin_paths = kwargs.pop('plugin_paths', None) or ()
+    if isinstance(plugin_paths, str):
+        raise TypeError(
+            'plugin_paths must be a sequence of paths, not ' +
+            repr(plugin_paths),
+        )
+    plugin_paths = os.pathsep.join(map(os.fspath, plugin_paths))
+    plugin_paths = plugin_paths.encode(fs_encoding)
+    max_output_bytes = kwargs.pop('max_output_bytes', None)
+    if max_output_bytes is None:
+        max_output_bytes = -1
+    elif (
+            isinstance(max_output_bytes, bool) or
+            not isinstance(max_output_bytes, int)
+    ):
+        raise TypeError(
+            'max_output_bytes must be an integer, not ' +
+            repr(max_output_bytes),
+        )
+    elif max_output_bytes < 0:
+        raise ValueError(
+            'max_output_bytes must not be negative, not ' +
+            repr(max_output_bytes),
+        )
 
-    :param string: Sass source code to compile.  it's exclusive to
-                   ``filename`` and ``dirname`` parameters
-    :type string: :class:`str`
-    :param output_style: an optional coding style of the compiled result.
-                         choose one of: ``'nested'`` (default), ``'expanded'``,
-                         ``'compact'``, ``'compressed'``
-    :type output_style: :class:`str`
+    custom_functions = kwargs.pop('custom_functions', ())
+    if isinstance(custom_functions, collections.abc.Mapping):
+        custom_functions = [
+            SassFunction.from_lambda(name, lambda_)
+            for name, lambda_ in custom_functions.items()
+        ]
+    elif isinstance(
+            custom_functions,
+            (collections.abc.Set, collections.abc.Sequence),
+    ):
+        custom_functions = [
+            func if isinstance(func, SassFunction)
+            else SassFunction.from_named_function(func)
+            for func in custom_functions
+        ]
+    else:
+        raise TypeError(
+            'custom_functions must be one of:\n'
+            '- a set/sequence of {0.__module__}.{0.__name__} objects,\n'
+            '- a mapping of function name strings to lambda functions,\n'
+            '- a set/sequence of named functions,\n'
+            'not {1!r}'.format(SassFunction, custom_functions),
+        )
+    # Signatures are encoded ahead, so that _sass doesn't have to format
+    # them for every compile
+    custom_functions = tuple(
+        (
+            str(func).encode('utf-8'), func, func.lazy,
+            function_cache if func.pure else None, None,
+        )
+        for func in custom_functions
+    )
+
+    if kwargs.pop('custom_import_extensions', None) is not None:
+        warnings.warn(
+            '`custom_import_extensions` has no effect and will be removed in '
+            'a future version.',
+            FutureWarning,
+        )
+
+    importers = _validate_importers(kwargs.pop('importers', None))
+    variables = _to_variables(kwargs.pop('variables', None))
+
+    return _Options(
+        output_style, source_comments, include_paths, precision,
+        custom_functions, importers, source_map_contents, source_map_embed,
+        omit_source_map_url, source_map_root, plugin_paths, max_output_bytes,
+        variables,
+    )
+
+
+_VARIABLE_NAME_RE = re.compile(r'\$?(-?[^\W\d]|--)[-\w]*')
+
+
+def _to_variables(variables):
+    """Converts the ``variables`` option to what :mod:`_sass` injects."""
+    if variables is None:
+        return None
+    elif not isinstance(variables, collections.abc.Mapping):
+        raise TypeError(
+            'variables must be a mapping, not ' + repr(variables),
+        )
+    items = []
+    for name, value in variables.items():
+        if not isinstance(name, str):
+            raise TypeError(
+                'variable name must be a string, not ' + repr(name),
+            )
+        elif not _VARIABLE_NAME_RE.fullmatch(name):
+            raise ValueError(f'{name!r} is not a valid variable name')
+        items.append((name.lstrip('$').encode('utf-8'), value))
+    return _sass.make_variables(tuple(items)) if items else None
+
+
+def _from_filename_hint(string, filename, filename_hint):
+    """Makes ``string`` compiled as if it were the contents of the file of
+    ``filename_hint`` be compiled like ``filename`` instead.  Returns the
+    ``string`` and the ``filename`` to compile, and the source of the file.
+    """
+    if filename_hint is None:
+        return string, filename, None
+    elif string is None or filename is not None:
+        raise TypeError(
+            'filename_hint is only available with string= keyword argument',
+        )
+    elif not isinstance(filename_hint, str):
+        raise TypeError(
+            'filename_hint must be a string, not ' + repr(filename_hint),
+        )
+    return None, filename_hint, string
+
+
+def _check_no_remaining_kwargs(func, kwargs):
+    if kwargs:
+        raise TypeError(
+            '{}() got unexpected keyword argument(s) {}'.format(
+                func.__name__,
+                ', '.join(f"'{arg}'" for arg in sorted(kwargs)),
+            ),
+        )
+
+
+class FunctionProfile:
+    """How much time a custom function took, measured when
+    ``profile_functions=True`` is passed to :func:`compile()`,
+    :func:`compile_many()`, or :class:`Compiler`.  See also
+    :attr:`CompileResult.function_profiles` and
+    :attr:`Compiler.function_profiles`.
+
+    The total time of a call is divided into converting its arguments to
+    Python, running the Python function, and converting what it returns
+    back to Sass.  The rest of the total, e.g. looking up
+    :class:`FunctionCache`, isn't divided.
+
+    .. versionadded:: 0.24.0
+
+    """
+
+    __slots__ = (
+        'name', 'calls', 'total_time', 'max_time', 'arguments_time',
+        'call_time', 'result_time',
+    )
+
+    def __init__(
+        self, name, calls=0, total_time=0.0, max_time=0.0,
+        arguments_time=0.0, call_time=0.0, result_time=0.0,
+    ):
+        #: (:class:`str`) The name of the function.
+        self.name = name
+        #: (:class:`int`) The number of times the function was called.
+        self.calls = calls
+        #: (:class:`float`) The seconds every call took in total.
+        self.total_time = total_time
+        #: (:class:`float`) The seconds the slowest call took.
+        self.max_time = max_time
+        #: (:class:`float`) The seconds converting the arguments took.
+        self.arguments_time = arguments_time
+        #: (:class:`float`) The seconds the Python function took.
+        self.call_time = call_time
+        #: (:class:`float`) The seconds converting the results took.
+        self.result_time = result_time
+
+    def _add(
+        self, calls, total_time, max_time, arguments_time, call_time,
+        result_time,
+    ):
+        self.calls += calls
+        self.total_time += total_time
+        self.max_time = max(self.max_time, max_time)
+        self.arguments_time += arguments_time
+        self.call_time += call_time
+        self.result_time += result_time
+
+    def __repr__(self):
+        return (
+            '<{0.__module__}.{0.__qualname__} {1.name!r} calls={1.calls} '
+            'total_time={1.total_time:.6f} max_time={1.max_time:.6f}>'.format(
+                type(self), self,
+            )
+        )
+
+
+class _FunctionProfiler:
+    """Accumulates the profiles :mod:`_sass` reports after every compile of
+    a compiler, as tuples in the order of the custom functions.
+    """
+
+    __slots__ = 'profiles', '_lock'
+
+    def __init__(self, functions):
+        self.profiles = [FunctionProfile(func.name) for func in functions]
+        self._lock = threading.Lock()
+
+    def __reduce__(self):
+        # Other interpreters and processes profile on their own
+        return type(self), ((),)
+
+    def _add(self, profiles):
+        with self._lock:
+            for profile, added in zip(self.profiles, profiles):
+                profile._add(*added)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                profile.name: FunctionProfile(
+                    profile.name, profile.calls, profile.total_time,
+                    profile.max_time, profile.arguments_time,
+                    profile.call_time, profile.result_time,
+                )
+                for profile in self.profiles
+            }
+
+
+class CompileResult:
+    """The result of :func:`compile()` with ``output_type='result'``.  It
+    keeps what libsass gives as it is, and decodes only the fields which
+    are read.
+
+    .. versionadded:: 0.24.0
+
+    """
+
+    def __init__(
+        self, css_bytes, source_map_bytes, included_files, output_size,
+        function_calls, importer_calls, function_profiles, wall_time,
+        cpu_time, cached=False,
+    ):
+        #: (:class:`bytes`) The UTF-8 encoded compiled CSS.
+        #: :const:`None` if it's written to ``output_file``.
+        self.css_bytes = css_bytes
+        #: (:class:`bytes`) The UTF-8 encoded source map.  :const:`None` if
+        #: ``source_map_filename`` isn't set or it's written to
+        #: ``source_map_file``.
+        self.source_map_bytes = source_map_bytes
+        self._included_files = included_files
+        #: (:class:`int`) The size of the compiled CSS in bytes.
+        self.output_size = output_size
+        #: (:class:`int`) The number of times custom functions were called.
+        self.function_calls = function_calls
+        #: (:class:`int`) The number of times importers were called.
+        self.importer_calls = importer_calls
+        #: (:class:`dict`) The :class:`FunctionProfile` of every custom
+        #: function by its name.  :const:`None` unless ``profile_functions``
+        #: is set.
+        self.function_profiles = function_profiles
+        #: (:class:`float`) The wall-clock seconds the compile took.
+        self.wall_time = wall_time
+        #: (:class:`float`) The CPU seconds the compile took.
+        self.cpu_time = cpu_time
+        #: (:class:`bool`) Whether it's taken from ``compile_cache`` instead
+        #: of compiled.  No custom function nor importer is called then, so
+        #: :attr:`function_calls` and :attr:`importer_calls` are zero, and
+        #: :attr:`function_profiles` is empty.
+        self.cached = cached
+
+    @functools.cached_property
+    def css(self):
+        """(:class:`str`) The compiled CSS.  :const:`None` if it's written
+        to ``output_file``.
+        """
+        if self.css_bytes is not None:
+            return self.css_bytes.decode('utf-8')
+
+    @functools.cached_property
+    def source_map(self):
+        """(:class:`str`) The source map.  :const:`None` if
+        ``source_map_filename`` isn't set or it's written to
+        ``source_map_file``.
+        """
+        if self.source_map_bytes is not None:
+            return self.source_map_bytes.decode('utf-8')
+
+    @functools.cached_property
+    def included_files(self):
+        """(:class:`tuple`) The paths of every file the compile read,
+        including the source itself if it's compiled from ``filename``.
+        """
+        return tuple(map(os.fsdecode, self._included_files))
+
+    def __repr__(self):
+        return (
+            '<{0.__module__}.{0.__qualname__} output_size={1.output_size} '
+            'included_files={2} wall_time={1.wall_time:.6f}>'.format(
+                type(self), self, len(self._included_files),
+            )
+        )
+
+
+class Compiler:
+    r"""Compiles Sass with the same options over and over.  It takes the
+    same keyword arguments as :func:`compile()` except for ``string``,
+    ``filename``, and ``dirname``.  Options are validated, and everything
+    :mod:`_sass` needs is prepared only once when the compiler is made,
+    so that compiling a lot of small sources doesn't pay for that every time.
+
+    >>> compiler = sass.Compiler(output_style='compressed')
+    >>> compiler.compile(string='a { b { color: blue; } }')
+    'a b{color:blue}\n'
+
+    Note that the current working directory, which is always searched for
+    ``@import``\ ed files, is also determined when the compiler is made.
+
+    .. versionadded:: 0.24.0
+
+    """
+
+    def __init__(self, **kwargs):
+        self._pop_kwargs(kwargs)
+        _check_no_remaining_kwargs(Compiler, kwargs)
+
+    @classmethod
+    def _from_kwargs(cls, func, kwargs, file_args=True):
+        """Makes a compiler on behalf of ``func`` which takes ``kwargs``."""
+        compiler = cls.__new__(cls)
+        compiler._pop_kwargs(kwargs, file_args)
+        _check_no_remaining_kwargs(func, kwargs)
+        return compiler
+
+    def _pop_kwargs(self, kwargs, file_args=True):
+        function_cache = kwargs.pop('function_cache', None)
+        if function_cache is None:
+            function_cache = FunctionCache()
+        elif not isinstance(function_cache, FunctionCache):
+            raise TypeError(
+                'function_cache must be a {0.__module__}.{0.__name__}, '
+                'not {1!r}'.format(FunctionCache, function_cache),
+            )
+        #: (:class:`FunctionCache`) What the pure custom functions returned.
+        self.function_cache = function_cache
+        compile_cache = kwargs.pop('compile_cache', None)
+        if not isinstance(
+            compile_cache, (CompileCache, DiskCompileCache, type(None)),
+        ):
+            raise TypeError(
+                'compile_cache must be a {0.__module__}.{0.__name__} or '
+                '{0.__module__}.{1.__name__}, not {2!r}'.format(
+                    CompileCache, DiskCompileCache, compile_cache,
+                ),
+            )
+        #: (:class:`CompileCache`, :class:`DiskCompileCache`) What the
+        #: compiles compiled, or :const:`None` if they aren't cached.
+        self.compile_cache = compile_cache
+        profile_functions = kwargs.pop('profile_functions', False)
+        if not isinstance(profile_functions, bool):
+            raise TypeError(
+                'profile_functions must be bool, not ' +
+                repr(profile_functions),
+            )
+        options = _pop_options(kwargs, function_cache)
+        self._profiler = None
+        if profile_functions:
+            # Profiles are kept in the order of the prepared functions
+            self._profiler = _FunctionProfiler(
+                func for _, func, _, _, _ in options.custom_functions
+            )
+            options = options._replace(
+                custom_functions=tuple(
+                    item[:4] + (self._profiler,)
+                    for item in options.custom_functions
+                ),
+            )
+        fs_encoding = sys.getfilesystemencoding() or sys.getdefaultencoding()
+
+        def _get_file_arg(key):
+            ret = kwargs.pop(key, None)
+            if ret is not None and not isinstance(ret, str):
+                raise TypeError(f'{key} must be a string, not {ret!r}')
+            elif isinstance(ret, str):
+                ret = ret.encode(fs_encoding)
+            return ret
+
+        if file_args:
+            self._source_map_filename = _get_file_arg('source_map_filename')
+            self._output_filename_hint = _get_file_arg('output_filename_hint')
+        else:
+            self._source_map_filename = self._output_filename_hint = None
+        indented = kwargs.pop('indented', None)
+        if indented is not None and not isinstance(indented, bool):
+            raise TypeError('indented must be bool, not ' + repr(indented))
+        # None unless it's given, so that filename_hint can tell it
+        self._indented = indented
+        output_type = kwargs.pop('output_type', 'str')
+        if output_type not in OUTPUT_TYPES:
+            raise CompileError(
+                '{!r} is unsupported output_type; choose one of {}'.format(
+                    output_type, and_join(sorted(OUTPUT_TYPES)),
+                ),
+            )
+        self._decode = output_type == 'str'
+        self._result = output_type == 'result'
+        self._options = options
+        self._string_args = (
+            options.output_style, options.source_comments,
+            options.include_paths, options.precision,
+            options.custom_functions, bool(indented), options.importers,
+            options.source_map_contents, options.source_map_embed,
+            options.omit_source_map_url, options.source_map_root,
+            options.plugin_paths, options.max_output_bytes,
+            options.variables,
+        )
+        self._filename_args = (
+            options.output_style, options.source_comments,
+            options.include_paths, options.precision,
+            self._source_map_filename, options.custom_functions,
+            options.importers, self._output_filename_hint,
+            options.source_map_contents, options.source_map_embed,
+            options.omit_source_map_url, options.source_map_root,
+            options.plugin_paths, options.max_output_bytes,
+            options.variables,
+        )
+        if compile_cache is not None:
+            # What makes the same source compile differently
+            self._cache_key = (
+                options._replace(
+                    include_paths=None,
+                    custom_functions=tuple(
+                        (signature, func.callable_, lazy)
+                        for signature, func, lazy, _, _
+                        in options.custom_functions
+                    ),
+                    importers=options.importers and tuple(
+                        (priority, func.__wrapped__, prefix, pattern)
+                        for priority, func, prefix, pattern
+                        in options.importers
+                    ),
+                    variables=options.variables and
+                    _sass.variables_key(options.variables),
+                ),
+                indented, self._source_map_filename,
+                self._output_filename_hint,
+            )
+            # Left to compile_cache, as DiskCompileCache makes them relative
+            self._cache_paths = tuple(
+                options.include_paths.split(os.fsencode(os.pathsep)),
+            )
+
+    def _indented_of(self, filename_hint):
+        """Whether ``string`` compiled as if it were the contents of the
+        file of ``filename_hint`` is Sass, which is told by the extension
+        of the file unless ``indented`` is given.
+        """
+        if self._indented is None:
+            return filename_hint is not None and \
+                filename_hint.lower().endswith('.sass')
+        return self._indented
+
+    def _cache_key_of(self, is_filename, source, filename_hint=None):
+        """The key of :attr:`compile_cache` for ``source``, either an
+        encoded filename or a string, which is compiled as if it were the
+        contents of the encoded ``filename_hint`` if it's set.
+        """
+        paths = self._cache_paths
+        if is_filename:
+            return self.compile_cache._key(
+                self._cache_key, 'filename', os.path.abspath(source), paths,
+            )
+        elif not isinstance(source, (str, bytes)):
+            source = bytes(source)
+        if filename_hint is not None:
+            return self.compile_cache._key(
+                self._cache_key, 'filename_hint', source,
+                paths + (os.path.abspath(filename_hint),),
+            )
+        return self.compile_cache._key(
+            self._cache_key, 'string', source, paths,
+        )
+
+    def _compile_cached(self, key, compile_, *args):
+        """Calls :mod:`_sass`'s ``compile_`` with ``args`` unless
+        :attr:`compile_cache` has the result for ``key``.
+        """
+        result = self.compile_cache._get(key)
+        if result is None:
+            started = time.time_ns()
+            result = compile_(*args)
+            if result[0]:
+                self.compile_cache._put(key, result, started)
+            return result
+        # Nothing is called for a hit, which is told by the trailing True
+        included_files, output_size = result[-1][:2]
+        profiles = None if self._profiler is None else ()
+        stats = included_files, output_size, 0, 0, profiles, True
+        return result[:-1] + (stats,)
+
+    def _compile_jobs(self, jobs, max_workers, stop_on_error, stop_args):
+        """Does what :func:`_sass.compile_many()` does, but only for the
+        ``jobs`` :attr:`compile_cache` doesn't have the results for.
+        """
+        if self.compile_cache is None:
+            return _sass.compile_many(
+                jobs, max_workers, stop_on_error, False, *self._string_args,
+                *stop_args
+            )
+        keys = [
+            self._cache_key_of(is_filename, source)
+            for is_filename, source, _ in jobs
+        ]
+        results = [self.compile_cache._get(key) for key in keys]
+        misses = [i for i, result in enumerate(results) if result is None]
+        if misses:
+            started = time.time_ns()
+            compiled = _sass.compile_many(
+                tuple(jobs[i][:2] + (None,) for i in misses), max_workers,
+                stop_on_error, True, *self._string_args, *stop_args
+            )
+            for i, result in zip(misses, compiled):
+                if result[0] and jobs[i][0]:
+                    # Cached the same way to compile_filename()'s results
+                    result = result[:2] + (None,) + result[2:]
+                results[i] = result
+                if result[0]:
+                    self.compile_cache._put(keys[i], result, started)
+        # Written the same way to _sass, in order and with stop_on_error
+        # only up to the first failed job
+        failed = False
+        for i, ((_, _, output), result) in enumerate(zip(jobs, results)):
+            failed = failed or not result[0]
+            if result[0] and output is not None and not (
+                failed and stop_on_error
+            ):
+                _write_to(output, result[1])
+                results[i] = True, None
+            else:
+                results[i] = result[:2]
+        return results
+
+    @property
+    def function_profiles(self):
+        """(:class:`dict`) The :class:`FunctionProfile` of every custom
+        function by its name, accumulated over every compile of this
+        compiler.  :const:`None` unless ``profile_functions`` is set.
+        """
+        if self._profiler is not None:
+            return self._profiler.snapshot()
+
+    def _to_result(self, css, source_map, stats, wall_time, cpu_time):
+        # Stats of a cache hit are followed by True; see _compile_cached()
+        cached = len(stats) > 5
+        *stats, profiles = stats[:5]
+        if profiles is not None:
+            profiles = {
+                profile.name: FunctionProfile(profile.name, *added)
+                for profile, added in zip(self._profiler.profiles, profiles)
+            }
+        return CompileResult(
+            css, source_map, *stats, profiles, wall_time, cpu_time,
+            cached=cached,
+        )
+
+    def _check_file_args(self):
+        for key in 'source_map_filename', 'output_filename_hint':
+            if getattr(self, '_' + key):
+                raise CompileError(
+                    '{} is only available with filename= keyword argument '
+                    'since has to be aware of it'.format(key),
+                )
+
+    def compile(
+        self, string=None, filename=None, dirname=None,
+        output_file=None, source_map_file=None, timeout=None, cancel=None,
+        filename_hint=None,
+    ):
+        """Compiles either of ``string``, ``filename``, or ``dirname``,
+        which are the same to the parameters of :func:`compile()`, as well
+        as ``output_file``, ``source_map_file``, ``timeout``, ``cancel``,
+        and ``filename_hint``.
+
+        :returns: the same to what :func:`compile()` returns
+        :raises sass.CompileError: when it fails for any reason
+        :raises exceptions.IOError: when the ``filename`` doesn't exist or
+                                    cannot be read, or when it fails to
+                                    write to ``output_file`` or
+                                    ``source_map_file``
+
+        """
+        if source_map_file is not None and not self._source_map_filename:
+            raise CompileError(
+                'source_map_file is only available with '
+                'source_map_filename keyword argument',
+            )
+        stop_args = _to_stop_args(timeout, cancel)
+        output_sink = _to_sink(output_file)
+        string, filename, source = _from_filename_hint(
+            string, filename, filename_hint,
+        )
+        if string is not None and filename is None and dirname is None:
+            self._check_file_args()
+            wall_time, cpu_time = time.perf_counter(), time.thread_time()
+            if self.compile_cache is None:
+                s, v, stats = _sass.compile_string(
+                    string, *self._string_args, output_sink, self._result,
+                    False, *stop_args
+                )
+            else:
+                # The output is cached, and then written
+                output_sink = None
+                s, v, stats = self._compile_cached(
+                    self._cache_key_of(False, string),
+                    _sass.compile_string, string,
+                    *self._string_args, None, True, False, *stop_args
+                )
+            wall_time = time.perf_counter() - wall_time
+            cpu_time = time.thread_time() - cpu_time
+            if s:
+                if output_file is not None:
+                    if output_sink is None:
+                        _write_to(output_file, v)
+                    v = None
+                if self._result:
+                    return self._to_result(
+                        v, None, stats, wall_time, cpu_time,
+                    )
+                elif v is not None:
+                    return v.decode('utf-8') if self._decode else v
+                return
+        elif filename is not None and string is None and dirname is None:
+            filename = _encode_filename(filename, source is None)
+            source_map_sink = _to_sink(source_map_file)
+            wall_time, cpu_time = time.perf_counter(), time.thread_time()
+            if self.compile_cache is None:
+                s, v, source_map, stats = _sass.compile_filename(
+                    filename, source, self._indented_of(filename_hint),
+                    *self._filename_args,
+                    output_sink, source_map_sink, self._result, False,
+                    *stop_args
+                )
+            else:
+                output_sink = source_map_sink = None
+                if source is None:
+                    key = self._cache_key_of(True, filename)
+                else:
+                    key = self._cache_key_of(False, source, filename)
+                s, v, source_map, stats = self._compile_cached(
+                    key, _sass.compile_filename,
+                    filename, source, self._indented_of(filename_hint),
+                    *self._filename_args,
+                    None, None, True, False, *stop_args
+                )
+            wall_time = time.perf_counter() - wall_time
+            cpu_time = time.thread_time() - cpu_time
+            if s:
+                # What is written to files is left out of the result
+                if output_file is not None:
+                    if output_sink is None:
+                        _write_to(output_file, v)
+                    v = None
+                if source_map_file is not None:
+                    if source_map_sink is None:
+                        _write_to(source_map_file, source_map)
+                    source_map = None
+                elif not self._source_map_filename:
+                    source_map = None
+                if self._result:
+                    return self._to_result(
+                        v, source_map, stats, wall_time, cpu_time,
+                    )
+                result = tuple(
+                    output.decode('utf-8') if self._decode else output
+                    for output in (v, source_map) if output is not None
+                )
+                return result[0] if len(result) == 1 else result or None
+        elif dirname is not None and string is None and filename is None:
+            self._check_file_args()
+            if output_file is not None:
+                raise TypeError('output_file cannot be used with dirname')
+            try:
+                search_path, output_path = dirname
+            except ValueError:
+                raise ValueError(
+                    'dirname must be a pair of (source_dir, '
+                    'output_dir)',
+                )
+            if self.compile_cache is None:
+                s, v = compile_dirname(
+                    search_path, output_path, *self._options, *stop_args
+                )
+            else:
+                results = self._compile_jobs(
+                    _dirname_jobs(search_path, output_path),
+                    os.cpu_count() or 1, True, stop_args,
+                )
+                s, v = next(
+                    (result for result in results if not result[0]),
+                    (True, None),
+                )
+            if s:
+                return
+        else:
+            raise TypeError(
+                'pass only one of ' + and_join(sorted(MODES)),
+            )
+        assert not s
+        raise _to_compile_error(v)
+
+    def check(self, string=None, filename=None, filename_hint=None):
+        """Checks either of ``string`` or ``filename`` the same way to
+        :func:`check()`, optionally with ``filename_hint`` for ``string``.
+
+        :raises sass.CompileError: when the source has any error
+        :raises exceptions.IOError: when the ``filename`` doesn't exist or
+                                    cannot be read
+
+        """
+        string, filename, source = _from_filename_hint(
+            string, filename, filename_hint,
+        )
+        if string is not None and filename is None:
+            self._check_file_args()
+            s, v, _ = _sass.compile_string(
+                string, *self._string_args, None, False, True, None, -1.0,
+            )
+        elif filename is not None and string is None:
+            s, v, _, _ = _sass.compile_filename(
+                _encode_filename(filename, source is None), source,
+                self._indented_of(filename_hint),
+                *self._filename_args, None, None, False, True, None, -1.0,
+            )
+        else:
+            raise TypeError('pass only one of filename and string')
+        if not s:
+            raise CompileError(v)
+
+    def compile_many(
+        self, jobs, max_workers=None, return_exceptions=False,
+        timeout=None, cancel=None,
+    ):
+        """Compiles many ``jobs`` on a pool of native threads.  The parameters
+        and the return value are the same to :func:`compile_many()`'s.
+
+        """
+        stop_args = _to_stop_args(timeout, cancel)
+        self._check_file_args()
+        if self._result:
+            raise CompileError(
+                "output_type='result' is only available with compile()",
+            )
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+        elif not isinstance(max_workers, int) or max_workers < 1:
+            raise ValueError(
+                'max_workers must be a positive integer, not ' +
+                repr(max_workers),
+            )
+        sources = []
+        output_files = []
+        for job in jobs:
+            if not isinstance(job, collections.abc.Mapping):
+                raise TypeError('job must be a mapping, not ' + repr(job))
+            elif (
+                len(job.keys() & {'string', 'filename'}) != 1 or
+                job.keys() - {'string', 'filename', 'output_file'}
+            ):
+                raise TypeError(
+                    "job must have either of 'string' or 'filename' key, "
+                    "and optionally 'output_file' key, not " + repr(job),
+                )
+            output_file = job.get('output_file')
+            output_files.append(output_file)
+            if 'filename' in job:
+                source = True, _encode_filename(job['filename'])
+            else:
+                source = False, job['string']
+            sources.append(source + (_to_sink(output_file),))
+        results = self._compile_jobs(
+            tuple(sources), max_workers, not return_exceptions, stop_args,
+        )
+        css_list = []
+        for (s, v), output_file in zip(results, output_files):
+            if s and output_file is None:
+                css_list.append(v.decode('utf-8') if self._decode else v)
+            elif s:
+                if v is not None:
+                    _write_to(output_file, v)
+                css_list.append(None)
+            elif return_exceptions:
+                css_list.append(_to_compile_error(v))
+            else:
+                raise _to_compile_error(v)
+        return css_list
+
+
+def compile(**kwargs):
+    r"""There are three modes of parameters :func:`compile()` can take:
+    ``string``, ``filename``, and ``dirname``.
+
+    The ``string`` parameter is the most basic way to compile Sass.
+    It simply takes a string of Sass code, and then returns a compiled
+    CSS string.
+
+    :param string: Sass source code to compile.  it's exclusive to
+                   ``filename`` and ``dirname`` parameters.  besides
+                   :class:`str`, any bytes-like object of UTF-8 e.g.
+                   :class:`bytes`, :class:`bytearray`, :class:`memoryview`,
+                   or :class:`mmap.mmap` can be passed as it is
+    :type string: :class:`str`, :class:`bytes`
+    :param filename_hint: optional filename the ``string`` is compiled as
+                          if it were the contents of, e.g. what was read
+                          from the file in advance.  relative ``@import``\ s
+                          are resolved from its directory, errors and
+                          source comments refer to it, and it enables
+                          ``source_map_filename`` and
+                          ``output_filename_hint`` as ``filename`` does.
+                          the file itself is never read, but its
+                          :file:`.sass` extension makes ``string``
+                          indented unless ``indented`` is given
+    :type filename_hint: :class:`str`
+    :param output_style: an optional coding style of the compiled result.
+                         choose one of: ``'nested'`` (default), ``'expanded'``,
+                         ``'compact'``, ``'compressed'``
+    :type output_style: :class:`str`
     :param source_comments: whether to add comments about source lines.
                             :const:`False` by default
     :type source_comments: :class:`bool`
@@ -298,6 +1959,26 @@ def compile(**kwargs):
     :param include_paths: an optional list of paths to find ``@import``\ ed
                           Sass/CSS source files
     :type include_paths: :class:`collections.abc.Sequence`
+    :param plugin_paths: an optional list of directories to load libsass
+                         plugins from.  every shared library in them is
+                         loaded, and the custom functions, importers, and
+                         headers they provide are registered
+    :type plugin_paths: :class:`collections.abc.Sequence`
+    :param max_output_bytes: optional limit of the size of the compiled CSS.
+                             a larger output is neither returned nor
+                             written, but :exc:`CompileLimitExceeded` is
+                             raised instead.  it's checked after libsass
+                             has rendered the whole output, so it limits
+                             what is returned, not the peak memory use of
+                             the compile.  see ``max_memory_bytes`` of
+                             :class:`ProcessPoolCompiler` for that
+    :type max_output_bytes: :class:`int`
+    :param variables: optional mapping of global variables to inject, from
+                      their names to the same values custom functions may
+                      return.  they're converted natively instead of being
+                      formatted as Sass source, and assigned before the
+                      source as if they were prepended to it
+    :type variables: :class:`collections.abc.Mapping`
     :param precision: optional precision for numbers. :const:`5` by default.
     :type precision: :class:`int`
     :param custom_functions: optional mapping of custom functions.
@@ -306,11 +1987,43 @@ def compile(**kwargs):
     :type custom_functions: :class:`set`,
                             :class:`collections.abc.Sequence`,
                             :class:`collections.abc.Mapping`
+    :param function_cache: optional cache to share what pure custom
+                           functions returned with other compiles.
+                           a compile has its own by default
+    :type function_cache: :class:`FunctionCache`
+    :param compile_cache: optional cache of the compiled CSS to answer
+                          the same compiles without running libsass.
+                          not cached by default
+    :type compile_cache: :class:`CompileCache`,
+                         :class:`DiskCompileCache`
+    :param profile_functions: whether to measure how much time custom
+                              functions take.  see also
+                              :class:`FunctionProfile`
+    :type profile_functions: :class:`bool`
     :param custom_import_extensions: (ignored, for backward compatibility)
     :param indented: optional declaration that the string is Sass, not SCSS
-                     formatted. :const:`False` by default
+                     formatted. :const:`False` by default, or whether
+                     ``filename_hint`` ends with :file:`.sass`
     :type indented: :class:`bool`
-    :returns: the compiled CSS string
+    :param output_type: the type to return the compiled CSS as.
+                        choose one of: ``'str'`` (default), ``'bytes'``,
+                        ``'result'``.  ``'bytes'`` gives the UTF-8 encoded
+                        output of libsass as is, which saves decoding it
+                        when it's going to be written to a file or a socket
+                        anyway.  ``'result'`` gives a :class:`CompileResult`
+                        which also tells the included files and how long
+                        the compile took
+    :type output_type: :class:`str`
+    :param output_file: optional path, file object, or file descriptor to
+                        write the compiled CSS to instead of returning it.
+                        binary files and paths are written from C without
+                        making any Python string, and a path is opened
+                        only when the compile succeeds
+    :type output_file: :class:`str`, :class:`os.PathLike`,
+                       :term:`file object`, :class:`int`
+    :returns: the compiled CSS string, or :const:`None` if ``output_file``
+              is set.  a :class:`CompileResult` if ``output_type`` is
+              ``'result'``
     :param importers: optional callback functions.
                      see also below `importer callbacks
                      <importer-callbacks_>`_ description
@@ -347,6 +2060,26 @@ def compile(**kwargs):
     :param include_paths: an optional list of paths to find ``@import``\ ed
                           Sass/CSS source files
     :type include_paths: :class:`collections.abc.Sequence`
+    :param plugin_paths: an optional list of directories to load libsass
+                         plugins from.  every shared library in them is
+                         loaded, and the custom functions, importers, and
+                         headers they provide are registered
+    :type plugin_paths: :class:`collections.abc.Sequence`
+    :param max_output_bytes: optional limit of the size of the compiled CSS.
+                             a larger output is neither returned nor
+                             written, but :exc:`CompileLimitExceeded` is
+                             raised instead.  it's checked after libsass
+                             has rendered the whole output, so it limits
+                             what is returned, not the peak memory use of
+                             the compile.  see ``max_memory_bytes`` of
+                             :class:`ProcessPoolCompiler` for that
+    :type max_output_bytes: :class:`int`
+    :param variables: optional mapping of global variables to inject, from
+                      their names to the same values custom functions may
+                      return.  they're converted natively instead of being
+                      formatted as Sass source, and assigned before the
+                      source as if they were prepended to it
+    :type variables: :class:`collections.abc.Mapping`
     :param precision: optional precision for numbers. :const:`5` by default.
     :type precision: :class:`int`
     :param custom_functions: optional mapping of custom functions.
@@ -355,18 +2088,48 @@ def compile(**kwargs):
     :type custom_functions: :class:`set`,
                             :class:`collections.abc.Sequence`,
                             :class:`collections.abc.Mapping`
+    :param function_cache: optional cache to share what pure custom
+                           functions returned with other compiles.
+                           a compile has its own by default
+    :type function_cache: :class:`FunctionCache`
+    :param compile_cache: optional cache of the compiled CSS to answer
+                          the same compiles without running libsass.
+                          not cached by default
+    :type compile_cache: :class:`CompileCache`,
+                         :class:`DiskCompileCache`
+    :param profile_functions: whether to measure how much time custom
+                              functions take.  see also
+                              :class:`FunctionProfile`
+    :type profile_functions: :class:`bool`
     :param custom_import_extensions: (ignored, for backward compatibility)
     :param importers: optional callback functions.
                      see also below `importer callbacks
                      <importer-callbacks_>`_ description
     :type importers: :class:`collections.abc.Callable`
+    :param output_type: the type to return the compiled CSS and the source
+                        map as.  choose one of: ``'str'`` (default),
+                        ``'bytes'``, ``'result'``
+    :type output_type: :class:`str`
+    :param output_file: optional path, file object, or file descriptor to
+                        write the compiled CSS to instead of returning it
+    :type output_file: :class:`str`, :class:`os.PathLike`,
+                       :term:`file object`, :class:`int`
+    :param source_map_file: optional path, file object, or file descriptor
+                            to write the source map to instead of returning
+                            it.  it requires ``source_map_filename``
+    :type source_map_file: :class:`str`, :class:`os.PathLike`,
+                           :term:`file object`, :class:`int`
     :returns: the compiled CSS string, or a pair of the compiled CSS string
-              and the source map string if ``source_map_filename`` is set
+              and the source map string if ``source_map_filename`` is set.
+              what is written to ``output_file`` or ``source_map_file`` is
+              left out; :const:`None` is returned if nothing is left.
+              a :class:`CompileResult` if ``output_type`` is ``'result'``
     :rtype: :class:`str`, :class:`tuple`
     :raises sass.CompileError: when it fails for any reason
                                (for example the given Sass has broken syntax)
     :raises exceptions.IOError: when the ``filename`` doesn't exist or
-                                cannot be read
+                                cannot be read, or when it fails to write
+                                to ``output_file`` or ``source_map_file``
 
     The ``dirname`` is useful for automation.  It takes a pair of paths.
     The first of the ``dirname`` pair refers the source directory, contains
@@ -398,6 +2161,26 @@ def compile(**kwargs):
     :param include_paths: an optional list of paths to find ``@import``\ ed
                           Sass/CSS source files
     :type include_paths: :class:`collections.abc.Sequence`
+    :param plugin_paths: an optional list of directories to load libsass
+                         plugins from.  every shared library in them is
+                         loaded, and the custom functions, importers, and
+                         headers they provide are registered
+    :type plugin_paths: :class:`collections.abc.Sequence`
+    :param max_output_bytes: optional limit of the size of the compiled CSS.
+                             a larger output is neither returned nor
+                             written, but :exc:`CompileLimitExceeded` is
+                             raised instead.  it's checked after libsass
+                             has rendered the whole output, so it limits
+                             what is returned, not the peak memory use of
+                             the compile.  see ``max_memory_bytes`` of
+                             :class:`ProcessPoolCompiler` for that
+    :type max_output_bytes: :class:`int`
+    :param variables: optional mapping of global variables to inject, from
+                      their names to the same values custom functions may
+                      return.  they're converted natively instead of being
+                      formatted as Sass source, and assigned before the
+                      source as if they were prepended to it
+    :type variables: :class:`collections.abc.Mapping`
     :param precision: optional precision for numbers. :const:`5` by default.
     :type precision: :class:`int`
     :param custom_functions: optional mapping of custom functions.
@@ -406,6 +2189,19 @@ def compile(**kwargs):
     :type custom_functions: :class:`set`,
                             :class:`collections.abc.Sequence`,
                             :class:`collections.abc.Mapping`
+    :param function_cache: optional cache to share what pure custom
+                           functions returned with other compiles.
+                           a compile has its own by default
+    :type function_cache: :class:`FunctionCache`
+    :param compile_cache: optional cache of the compiled CSS to answer
+                          the same compiles without running libsass.
+                          not cached by default
+    :type compile_cache: :class:`CompileCache`,
+                         :class:`DiskCompileCache`
+    :param profile_functions: whether to measure how much time custom
+                              functions take.  see also
+                              :class:`FunctionProfile`
+    :type profile_functions: :class:`bool`
     :param custom_import_extensions: (ignored, for backward compatibility)
     :raises sass.CompileError: when it fails for any reason
                                (for example the given Sass has broken syntax)
@@ -463,6 +2259,29 @@ def compile(**kwargs):
               custom_functions={func_name}
           )
 
+    A function which reads only a few entries of the maps it's passed can
+    be declared with ``lazy=True`` of :class:`SassFunction`, so that it gets
+    :class:`SassMapProxy` converting only what it looks up:
+
+    .. code-block:: python
+
+       def token(tokens, name):
+           return tokens[name]
+
+       sass.compile(
+           ...,
+           custom_functions={
+               sass.SassFunction.from_named_function(token, lazy=True),
+           }
+       )
+
+    A function which always returns the same for the same arguments can be
+    marked with :func:`pure()` or ``pure=True`` of :class:`SassFunction`.
+    What it returns is then remembered in :class:`FunctionCache`, and it's
+    called only for arguments it hasn't got yet.  Every compile has its own
+    cache unless ``function_cache`` is passed, and the compiles of
+    a :class:`Compiler` share its :attr:`Compiler.function_cache`.
+
     .. _importer-callbacks:
 
     Newer versions of ``libsass`` allow developers to define callbacks to be
@@ -508,6 +2327,44 @@ def compile(**kwargs):
     instead attach ``color: red`` as a property of an element with the
     imported name.
 
+    An importer which handles only some kind of paths can be passed with
+    a third element, a filter of paths it's called for:
+
+    .. code-block:: python
+
+        (priority_int, callback_fn, 'icons/')
+        (priority_int, callback_fn, re.compile(r'\.svg$'))
+
+    A string filter is a prefix the path to import has to start with, and
+    a compiled regular expression has to be found in the path by its
+    :meth:`~re.Pattern.search()` method.  Unlike testing the path in the
+    callback, a prefix is tested without acquiring the GIL, so filtered out
+    imports don't contend with other threads, and they aren't counted in
+    :attr:`CompileResult.importer_calls`.
+
+    .. _timeouts-and-cancellation:
+
+    Every mode can also take ``timeout``, the number of seconds the compile
+    may take, and ``cancel``, a token which has :meth:`is_set()` method
+    like :class:`threading.Event`, to stop a runaway compile of untrusted
+    sources.  A stopped compile raises :exc:`CompileTimeout` or
+    :exc:`CompileCancelled`, both of which are :exc:`CompileError`\ s:
+
+    .. code-block:: python
+
+        try:
+            css = sass.compile(string=untrusted, timeout=5)
+        except sass.CompileTimeout:
+            ...
+
+    They are cooperative: libsass itself can't be interrupted, so they are
+    only checked whenever it calls a custom function or an importer, and
+    between its phases.  A compile which doesn't call back into Python at
+    all, e.g. an endless ``@while`` loop without any custom function, can't
+    be stopped before libsass is done.  To compile untrusted sources with
+    a hard limit, use :class:`ProcessPoolCompiler`, which kills the worker
+    process of a compile that doesn't finish within its ``timeout``.
+
     .. versionadded:: 0.4.0
        Added ``source_comments`` and ``source_map_filename`` parameters.
 
@@ -536,6 +2393,30 @@ def compile(**kwargs):
         The importer callbacks can now take a second argument, the previously-
         resolved path, so that importers can do relative path resolution.
 
+    .. versionadded:: 0.24.0
+       Added ``output_type``, ``output_file``, ``source_map_file``,
+       ``plugin_paths``, ``max_output_bytes``, ``timeout``, ``cancel``,
+       ``function_cache``, ``profile_functions``, ``variables``,
+       ``compile_cache``, and ``filename_hint`` parameters.
+
+    .. versionchanged:: 0.24.0
+       The ``string`` parameter can take bytes-like objects besides
+       :class:`str`.
+
+    .. versionchanged:: 0.24.0
+       The importer callbacks can be passed with a path filter.  Whether
+       a callback takes the previous resolved path is inspected from its
+       signature once instead of retried for every import.
+
+    """
+    compiler, compile_kwargs = _prepare_compile(compile, kwargs)
+    return compiler.compile(**compile_kwargs)
+
+
+def _prepare_compile(func, kwargs):
+    """Makes a :class:`Compiler` on behalf of ``func`` which takes
+    :func:`compile()`'s ``kwargs``, and the arguments of its
+    :meth:`~Compiler.compile()`.
     """
     modes = set()
     for mode_name in MODES:
@@ -548,181 +2429,806 @@ def compile(**kwargs):
             and_join(modes) + ' are exclusive each other; '
             'cannot be used at a time',
         )
-    precision = kwargs.pop('precision', 5)
-    output_style = kwargs.pop('output_style', 'nested')
-    if not isinstance(output_style, str):
+    mode_name, = modes
+    compile_kwargs = {mode_name: kwargs.pop(mode_name)}
+    for key in (
+        'output_file', 'source_map_file', 'timeout', 'cancel',
+        'filename_hint',
+    ):
+        compile_kwargs[key] = kwargs.pop(key, None)
+    return Compiler._from_kwargs(func, kwargs), compile_kwargs
+
+
+def compile_async(executor=None, **kwargs):
+    """Does the same to :func:`compile()` on a thread of ``executor``,
+    which releases the GIL while libsass runs, without blocking the event
+    loop.  It takes the same keyword arguments as :func:`compile()` except
+    for ``cancel``, and returns the same.
+
+    .. code-block:: python
+
+       css = await asyncio.wait_for(
+           sass.compile_async(filename='main.scss'),
+           timeout=10,
+       )
+
+    Cancelling the task stops the compile too, the same way to
+    ``cancel`` of :func:`compile()`.  Unless ``executor`` is given, compiles
+    run on a pool of as many threads as CPUs shared by every call, and the
+    rest wait for their turns, so that a burst of requests doesn't start
+    more compiles than the CPUs can run at a time.
+
+    Custom functions and importers can be ``async def`` functions.  They're
+    awaited on the event loop of the caller, while the compile thread waits
+    for their results:
+
+    .. code-block:: python
+
+       async def theme_color(name):
+           row = await db.fetchrow('SELECT color FROM themes WHERE name = $1',
+                                   name.value)
+           return row['color']
+
+       css = await sass.compile_async(
+           string='a { color: theme-color(brand); }',
+           custom_functions={theme_color},
+       )
+
+    :param executor: an optional executor to compile on instead
+    :type executor: :class:`concurrent.futures.Executor`
+    :returns: an awaitable of what :func:`compile()` returns
+    :raises sass.CompileError: when it fails for any reason
+    :raises asyncio.CancelledError: when the task is cancelled
+
+    .. versionadded:: 0.24.0
+
+    """
+    return _compile_async(executor, kwargs)
+
+
+async def _compile_async(executor, kwargs):
+    if 'cancel' in kwargs:
         raise TypeError(
-            'output_style must be a string, not ' +
-            repr(output_style),
+            'cancel cannot be used with compile_async(); cancel the task '
+            'instead',
         )
+    state = _AsyncCompile(asyncio.get_running_loop())
+    compiler, compile_kwargs = _prepare_compile(
+        compile_async, _with_sync_callbacks(kwargs),
+    )
+    compile_kwargs['cancel'] = state.cancel
+    if executor is None:
+        executor = _get_async_executor()
+    future = executor.submit(state.run, compiler.compile, compile_kwargs)
     try:
-        output_style = OUTPUT_STYLES[output_style]
-    except KeyError:
-        raise CompileError(
-            '{} is unsupported output_style; choose one of {}'
-            ''.format(output_style, and_join(OUTPUT_STYLES)),
-        )
-    source_comments = kwargs.pop('source_comments', False)
-    if source_comments in SOURCE_COMMENTS:
-        if source_comments == 'none':
-            deprecation_message = (
-                'you can simply pass False to '
-                "source_comments instead of 'none'"
-            )
-            source_comments = False
-        elif source_comments in ('line_numbers', 'default'):
-            deprecation_message = (
-                'you can simply pass True to '
-                'source_comments instead of ' +
-                repr(source_comments)
-            )
-            source_comments = True
-        else:
-            deprecation_message = (
-                "you don't have to pass 'map' to "
-                'source_comments but just need to '
-                'specify source_map_filename'
-            )
-            source_comments = False
-        warnings.warn(
-            "values like 'none', 'line_numbers', and 'map' for "
-            'the source_comments parameter are deprecated; ' +
-            deprecation_message,
-            FutureWarning,
-        )
-    if not isinstance(source_comments, bool):
-        raise TypeError(
-            'source_comments must be bool, not ' +
-            repr(source_comments),
-        )
-    fs_encoding = sys.getfilesystemencoding() or sys.getdefaultencoding()
+        return await asyncio.wrap_future(future)
+    except asyncio.CancelledError:
+        state.stop()
+        raise
 
-    def _get_file_arg(key):
-        ret = kwargs.pop(key, None)
-        if ret is not None and not isinstance(ret, str):
-            raise TypeError(f'{key} must be a string, not {ret!r}')
-        elif isinstance(ret, str):
-            ret = ret.encode(fs_encoding)
-        if ret and 'filename' not in modes:
-            raise CompileError(
-                '{} is only available with filename= keyword argument since '
-                'has to be aware of it'.format(key),
-            )
-        return ret
 
-    source_map_filename = _get_file_arg('source_map_filename')
-    output_filename_hint = _get_file_arg('output_filename_hint')
+class _AsyncCompile:
+    """What the compile thread of :func:`compile_async()` needs to await
+    ``async def`` custom functions and importers on the event loop.
+    """
 
-    source_map_contents = kwargs.pop('source_map_contents', False)
-    source_map_embed = kwargs.pop('source_map_embed', False)
-    omit_source_map_url = kwargs.pop('omit_source_map_url', False)
-    source_map_root = kwargs.pop('source_map_root', None)
+    __slots__ = 'loop', 'cancel', 'futures', '_lock'
 
-    if isinstance(source_map_root, str):
-        source_map_root = source_map_root.encode('utf-8')
+    #: The :class:`_AsyncCompile` of the compile the thread runs
+    current = threading.local()
 
-    # #208: cwd is always included in include paths
-    include_paths = (os.getcwd(),)
-    include_paths += tuple(kwargs.pop('include_paths', ()) or ())
-    include_paths = os.pathsep.join(include_paths)
-    if isinstance(include_paths, str):
-        include_paths = include_paths.encode(fs_encoding)
+    def __init__(self, loop):
+        self.loop = loop
+        self.cancel = threading.Event()
+        self.futures = set()
+        self._lock = threading.Lock()
 
-    custom_functions = kwargs.pop('custom_functions', ())
-    if isinstance(custom_functions, collections.abc.Mapping):
-        custom_functions = [
-            SassFunction.from_lambda(name, lambda_)
-            for name, lambda_ in custom_functions.items()
+    def run(self, compile_, kwargs):
+        _AsyncCompile.current.state = self
+        try:
+            return compile_(**kwargs)
+        finally:
+            _AsyncCompile.current.state = None
+
+    def stop(self):
+        with self._lock:
+            self.cancel.set()
+            for future in self.futures:
+                future.cancel()
+
+    def await_(self, coroutine):
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+        with self._lock:
+            if self.cancel.is_set():
+                future.cancel()
+            self.futures.add(future)
+        try:
+            return future.result()
+        finally:
+            with self._lock:
+                self.futures.discard(future)
+
+
+def _to_sync_function(function):
+    """Makes the callable of a :class:`SassFunction` :func:`_to_sync()`.
+    Others are returned as they are.
+    """
+    if not isinstance(function, SassFunction):
+        return function
+    return SassFunction(
+        function.name, function.arguments, _to_sync(function.callable_),
+        function.lazy, function.pure,
+    )
+
+
+#: The wrappers :func:`_to_sync()` made, so that the same function gets
+#: the same wrapper, e.g. for :class:`CompileCache` keys
+_sync_wrappers = weakref.WeakKeyDictionary()
+
+
+def _to_sync(function):
+    """Wraps an ``async def`` ``function`` to be called from the compile
+    thread of :func:`compile_async()`.  Others are returned as they are.
+    """
+    if not inspect.iscoroutinefunction(function):
+        return function
+    try:
+        return _sync_wrappers[function]
+    except (KeyError, TypeError):
+        pass
+
+    @functools.wraps(function)
+    def wrapper(*args):
+        return _AsyncCompile.current.state.await_(function(*args))
+
+    try:
+        _sync_wrappers[function] = wrapper
+    except TypeError:
+        pass
+    return wrapper
+
+
+def _with_sync_callbacks(kwargs):
+    """Makes the ``async def`` custom functions and importers of ``kwargs``
+    :func:`_to_sync()`.  What isn't valid is left to :func:`compile()`.
+    """
+    kwargs = dict(kwargs)
+    functions = kwargs.get('custom_functions')
+    if isinstance(functions, collections.abc.Mapping):
+        kwargs['custom_functions'] = [
+            _to_sync_function(SassFunction.from_lambda(name, function))
+            for name, function in functions.items()
         ]
     elif isinstance(
-            custom_functions,
-            (collections.abc.Set, collections.abc.Sequence),
+        functions, (collections.abc.Set, collections.abc.Sequence),
     ):
-        custom_functions = [
-            func if isinstance(func, SassFunction)
-            else SassFunction.from_named_function(func)
-            for func in custom_functions
+        kwargs['custom_functions'] = [
+            _to_sync_function(SassFunction.from_named_function(function))
+            if inspect.iscoroutinefunction(function)
+            else _to_sync_function(function)
+            for function in functions
         ]
-    else:
-        raise TypeError(
-            'custom_functions must be one of:\n'
-            '- a set/sequence of {0.__module__}.{0.__name__} objects,\n'
-            '- a mapping of function name strings to lambda functions,\n'
-            '- a set/sequence of named functions,\n'
-            'not {1!r}'.format(SassFunction, custom_functions),
+    importers = kwargs.get('importers')
+    if isinstance(importers, collections.abc.Iterable):
+        kwargs['importers'] = [
+            (importer[0], _to_sync(importer[1]), *importer[2:])
+            if isinstance(importer, (tuple, list)) and len(importer) >= 2
+            else importer
+            for importer in importers
+        ]
+    return kwargs
+
+
+_async_executor = None
+_async_executor_lock = threading.Lock()
+
+
+def _get_async_executor():
+    """The executor :func:`compile_async()` compiles on by default."""
+    global _async_executor
+    with _async_executor_lock:
+        if _async_executor is None:
+            _async_executor = concurrent.futures.ThreadPoolExecutor(
+                os.cpu_count() or 1, thread_name_prefix='sass-compile',
+            )
+        return _async_executor
+
+
+def compile_many(
+    jobs, max_workers=None, return_exceptions=False, interpreters=False,
+    timeout=None, cancel=None, **kwargs
+):
+    r"""Compiles many Sass sources which share the same options at a time.
+    Unlike calling :func:`compile()` in a loop, the sources are compiled on
+    a pool of native threads, so that a large number of files can be built
+    using every CPU core.
+
+    :param jobs: the sources to compile.  every job is a mapping that has
+                 either of ``'string'`` or ``'filename'`` key, and
+                 optionally ``'output_file'`` key, which are the same to
+                 the parameters of :func:`compile()`
+    :type jobs: :class:`collections.abc.Iterable`
+    :param max_workers: the maximum number of threads to compile on.
+                        the number of CPUs by default
+    :type max_workers: :class:`int`
+    :param return_exceptions: whether to put :exc:`CompileError` of failed
+                              jobs into the returned list instead of raising
+                              it.  :const:`False` by default
+    :type return_exceptions: :class:`bool`
+    :param interpreters: whether to compile on a pool of subinterpreters
+                         instead, so that custom functions and importers
+                         written in Python run in parallel as well.
+                         requires Python 3.14 or later.
+                         :const:`False` by default
+    :type interpreters: :class:`bool`
+    :param timeout: optional number of seconds all the jobs may take.
+                    see also `timeouts and cancellation
+                    <timeouts-and-cancellation_>`_
+    :type timeout: :class:`float`
+    :param cancel: optional token which has :meth:`is_set()` method e.g.
+                   :class:`threading.Event` to stop compiling the jobs.
+                   it can't be used with ``interpreters``
+    :type cancel: :class:`threading.Event`
+    :returns: the list of compiled CSS strings (or :class:`bytes` if
+              ``output_type`` is ``'bytes'``) in the same order to ``jobs``.
+              :const:`None` takes the place of what is written to
+              ``'output_file'``
+    :rtype: :class:`list`
+    :raises sass.CompileError: when any of the jobs fails.  the error of
+                               the first failed job is raised, and only the
+                               ``'output_file'``\ s of the jobs before it
+                               are written
+    :raises sass.CompileCancelled: when it's stopped by ``cancel``
+                                   or ``timeout``
+                                   (:exc:`CompileTimeout`).  it's raised
+                                   even if ``return_exceptions`` is set,
+                                   and no ``'output_file'`` is written
+    :raises exceptions.IOError: when a ``filename`` doesn't exist or
+                                cannot be read, or when it fails to write
+                                to an ``'output_file'``
+
+    The rest of keyword arguments are the same to :func:`compile()`'s except
+    for ``source_map_filename`` and ``output_filename_hint``, which only make
+    sense for a single file.
+
+    .. code-block:: python
+
+       css_list = sass.compile_many(
+           [{'filename': 'a.scss'}, {'string': 'b { c: d; }'}],
+           output_style='compressed',
+       )
+
+    With ``interpreters=True``, every worker interpreter makes its own
+    :class:`Compiler` from the keyword arguments, so that they have to be
+    picklable, e.g. custom functions and importers have to be module-level
+    functions.  Likewise ``'output_file'``\ s have to be paths.  Jobs are
+    compiled independently from each other then, so the ``'output_file'``\ s
+    of all succeeded jobs are written even if any of them fails.
+
+    .. versionadded:: 0.24.0
+
+    """
+    if interpreters:
+        try:
+            from concurrent.futures import InterpreterPoolExecutor
+        except ImportError:
+            raise RuntimeError(
+                'interpreters=True requires Python 3.14 or later',
+            )
+        if cancel is not None:
+            raise TypeError('cancel cannot be used with interpreters=True')
+        return _compile_many_in_executor(
+            InterpreterPoolExecutor, jobs, max_workers, return_exceptions,
+            timeout, kwargs,
         )
+    compiler = Compiler._from_kwargs(compile_many, kwargs, file_args=False)
+    return compiler.compile_many(
+        jobs, max_workers, return_exceptions, timeout, cancel,
+    )
 
-    if kwargs.pop('custom_import_extensions', None) is not None:
-        warnings.warn(
-            '`custom_import_extensions` has no effect and will be removed in '
-            'a future version.',
-            FutureWarning,
+
+#: The :class:`Compiler` of the worker process or interpreter
+#: :func:`_compile_many_in_executor()` made.
+_executor_compiler = None
+
+
+def _init_executor_compiler(kwargs):
+    global _executor_compiler
+    _executor_compiler = Compiler._from_kwargs(
+        compile_many, dict(kwargs), file_args=False,
+    )
+
+
+def _compile_chunk(chunk, deadline):
+    timeout = None if deadline is None else max(0, deadline - time.time())
+    return _executor_compiler.compile_many(chunk, 1, True, timeout)
+
+
+def _compile_many_in_executor(
+    executor_class, jobs, max_workers, return_exceptions, timeout, kwargs,
+):
+    """Compiles ``jobs`` the same way to :func:`compile_many()`, but in
+    the workers of ``executor_class``, a subtype of
+    :class:`concurrent.futures.Executor` which takes ``initializer``.
+    """
+    # Options are validated in the calling interpreter in advance
+    Compiler._from_kwargs(compile_many, dict(kwargs), file_args=False)
+    _to_stop_args(timeout, None)
+    # Workers may be other processes, which share only the wall clock
+    deadline = None if timeout is None else time.time() + timeout
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    elif not isinstance(max_workers, int) or max_workers < 1:
+        raise ValueError(
+            'max_workers must be a positive integer, not ' +
+            repr(max_workers),
         )
+    jobs = [dict(job) for job in jobs]
+    # A few chunks per worker balance the load without paying for
+    # a round trip per job
+    size = max(1, -(-len(jobs) // (max_workers * 4)))
+    chunks = [jobs[i:i + size] for i in range(0, len(jobs), size)]
+    with executor_class(
+        max_workers, initializer=_init_executor_compiler, initargs=(kwargs,),
+    ) as executor:
+        results = [
+            result
+            for chunk_results in executor.map(
+                _compile_chunk, chunks, [deadline] * len(chunks),
+            )
+            for result in chunk_results
+        ]
+    if not return_exceptions:
+        for result in results:
+            if isinstance(result, CompileError):
+                raise result
+    return results
+
+
+class ProcessPoolCompiler:
+    r"""Compiles Sass on a pool of worker processes which stay warm
+    between compiles.  It takes the same keyword arguments as
+    :func:`compile_many()` except for ``interpreters`` and ``cancel``.
+    Every worker makes its own :class:`Compiler` from them once, so that
+    custom functions and importers are looked up there by their importable
+    names, and have to be module-level functions or other picklable
+    objects.
 
-    importers = _validate_importers(kwargs.pop('importers', None))
+    .. code-block:: python
+
+       with sass.ProcessPoolCompiler(
+           custom_functions={theme.color},
+           max_jobs_per_worker=1000,
+       ) as compiler:
+           css = compiler.compile(filename='main.scss')
+           css_list = compiler.compile_many(
+               {'filename': filename} for filename in filenames
+           )
+
+    Unlike a pool of threads, custom functions and importers which hold
+    the GIL run in parallel, and a worker which crashes, e.g. because
+    libsass segfaults on a malformed source, fails only the job it was
+    compiling with :exc:`CompileCrashed`.  The crashed workers are replaced
+    with new ones.  Likewise the workers of compiles which don't finish
+    within their ``timeout`` are killed, even if libsass never calls back
+    into Python, so that untrusted sources can't hold a worker forever.
+    With ``max_memory_bytes``, they can't take more memory than that
+    either: unlike ``max_output_bytes``, which is checked once the output
+    is rendered, it limits every allocation of the worker as it's made.
+
+    :param max_workers: the number of worker processes.
+                        the number of CPUs by default
+    :type max_workers: :class:`int`
+    :param max_jobs_per_worker: the number of jobs each worker compiles
+                                before it's replaced with a new one, which
+                                caps its memory growth.  workers live as
+                                long as the pool by default
+    :type max_jobs_per_worker: :class:`int`
+    :param mp_context: an optional :mod:`multiprocessing` context to start
+                       the workers with
+    :type mp_context: :class:`multiprocessing.context.BaseContext`
+    :param max_memory_bytes: optional limit of the address space of each
+                             worker process, set as its
+                             :data:`resource.RLIMIT_AS`.  a job which needs
+                             more fails with :exc:`CompileLimitExceeded`.
+                             it counts the worker's interpreter as well,
+                             and forked workers start as large as the
+                             process which forks them, so leave room for
+                             them.  it needs :mod:`resource`, which
+                             Windows lacks, and macOS doesn't enforce it
+    :type max_memory_bytes: :class:`int`
+
+    .. versionadded:: 0.24.0
+
+    """
 
-    if 'string' in modes:
-        string = kwargs.pop('string')
-        if isinstance(string, str):
-            string = string.encode('utf-8')
-        indented = kwargs.pop('indented', False)
-        if not isinstance(indented, bool):
+    def __init__(
+        self, max_workers=None, max_jobs_per_worker=None, mp_context=None,
+        max_memory_bytes=None, **kwargs
+    ):
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+        elif not isinstance(max_workers, int) or max_workers < 1:
+            raise ValueError(
+                'max_workers must be a positive integer, not ' +
+                repr(max_workers),
+            )
+        if max_jobs_per_worker is not None and (
+            not isinstance(max_jobs_per_worker, int) or
+            max_jobs_per_worker < 1
+        ):
+            raise ValueError(
+                'max_jobs_per_worker must be a positive integer, not ' +
+                repr(max_jobs_per_worker),
+            )
+        if max_memory_bytes is not None:
+            if isinstance(max_memory_bytes, bool) or \
+                    not isinstance(max_memory_bytes, int):
+                raise TypeError(
+                    'max_memory_bytes must be an integer, not ' +
+                    repr(max_memory_bytes),
+                )
+            elif max_memory_bytes < 1:
+                raise ValueError(
+                    'max_memory_bytes must be positive, not ' +
+                    repr(max_memory_bytes),
+                )
+            try:
+                import resource  # noqa: F401
+            except ImportError:
+                raise RuntimeError(
+                    'max_memory_bytes requires the resource module, '
+                    'which is only available on Unix',
+                )
+        # Options are validated here in advance, not in every worker
+        Compiler._from_kwargs(ProcessPoolCompiler, dict(kwargs), False)
+        try:
+            self._kwargs = pickle.dumps(kwargs)
+        except Exception as e:
             raise TypeError(
-                'indented must be bool, not ' +
-                repr(source_comments),
-            )
-        _check_no_remaining_kwargs(compile, kwargs)
-        s, v = _sass.compile_string(
-            string, output_style, source_comments, include_paths, precision,
-            custom_functions, indented, importers,
-            source_map_contents, source_map_embed, omit_source_map_url,
-            source_map_root,
-        )
-        if s:
-            return v.decode('utf-8')
-    elif 'filename' in modes:
-        filename = kwargs.pop('filename')
-        if not isinstance(filename, str):
-            raise TypeError('filename must be a string, not ' + repr(filename))
-        elif not os.path.isfile(filename):
-            raise OSError(f'{filename!r} seems not a file')
-        elif isinstance(filename, str):
-            filename = filename.encode(fs_encoding)
-        _check_no_remaining_kwargs(compile, kwargs)
-        s, v, source_map = _sass.compile_filename(
-            filename, output_style, source_comments, include_paths, precision,
-            source_map_filename, custom_functions, importers,
-            output_filename_hint,
-            source_map_contents, source_map_embed, omit_source_map_url,
-            source_map_root,
-        )
-        if s:
-            v = v.decode('utf-8')
-            if source_map_filename:
-                source_map = source_map.decode('utf-8')
-                v = v, source_map
-            return v
-    elif 'dirname' in modes:
+                'the options of ProcessPoolCompiler have to be picklable, '
+                'e.g. custom functions and importers have to be '
+                'module-level functions: ' + str(e),
+            ) from e
+        self.max_workers = max_workers
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.max_memory_bytes = max_memory_bytes
+        self._mp_context = mp_context or multiprocessing.get_context()
+        self._idle = []
+        self._workers = 0  # the number of the workers which aren't retired
+        self._generation = 0  # bumped by close() to retire busy workers
+        self._condition = threading.Condition()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Stops the worker processes after they finish the jobs in
+        progress.  It's done by ``with`` statement as well.
+        """
+        with self._condition:
+            idle, self._idle = self._idle, []
+            self._workers -= len(idle)
+            self._generation += 1
+            self._condition.notify_all()
+        for worker in idle:
+            worker.close()
+
+    def _acquire(self):
+        """Takes an idle worker, or starts a new one if there are fewer
+        than :attr:`max_workers`.
+        """
+        with self._condition:
+            while not self._idle and self._workers >= self.max_workers:
+                self._condition.wait()
+            if self._idle:
+                return self._idle.pop()
+            self._workers += 1
+            generation = self._generation
         try:
-            search_path, output_path = kwargs.pop('dirname')
-        except ValueError:
-            raise ValueError(
-                'dirname must be a pair of (source_dir, '
-                'output_dir)',
+            return _ProcessWorker(
+                self._mp_context, self._kwargs, self.max_memory_bytes,
+                generation,
             )
-        _check_no_remaining_kwargs(compile, kwargs)
-        s, v = compile_dirname(
-            search_path, output_path, output_style, source_comments,
-            include_paths, precision, custom_functions, importers,
-            source_map_contents, source_map_embed, omit_source_map_url,
-            source_map_root,
+        except BaseException:
+            with self._condition:
+                self._workers -= 1
+                self._condition.notify()
+            raise
+
+    def _release(self, worker):
+        """Gives back ``worker`` taken by :meth:`_acquire()`, which is
+        stopped instead if it's dead, has compiled enough jobs, or is of
+        the pool before :meth:`close()`.
+        """
+        with self._condition:
+            retire = (
+                not worker.alive or
+                worker.generation != self._generation or
+                self.max_jobs_per_worker is not None and
+                worker.jobs >= self.max_jobs_per_worker
+            )
+            if retire:
+                self._workers -= 1
+            else:
+                self._idle.append(worker)
+            self._condition.notify()
+        if retire:
+            worker.close()
+
+    def _compile_chunk(self, chunk, deadline):
+        """Compiles ``chunk`` of jobs on a worker, and returns the list of
+        their results.  If the worker crashes, the jobs are retried one at
+        a time, so that only the job which really crashes it fails.
+        """
+        worker = self._acquire()
+        try:
+            if deadline is not None and time.time() >= deadline:
+                return [
+                    CompileTimeout(
+                        'the job did not start within the timeout: ' +
+                        repr(job),
+                    )
+                    for job in chunk
+                ]
+            results = worker.compile(chunk, deadline)
+        except CompileTimeout as e:
+            # Stopped in the worker, when libsass called back into it
+            return [e] * len(chunk)
+        except CompileLimitExceeded as e:
+            # Out of memory, which is told apart job by job as a crash is
+            results = None if len(chunk) > 1 else [e]
+        finally:
+            self._release(worker)
+        if results is None and len(chunk) > 1:
+            return [
+                result
+                for job in chunk
+                for result in self._compile_chunk([job], deadline)
+            ]
+        elif results is None:
+            return [
+                CompileCrashed(
+                    'the worker process crashed while it compiled the job ' +
+                    repr(chunk[0]),
+                ),
+            ]
+        elif results is False:
+            return [
+                CompileTimeout(
+                    'the worker process was killed as the job did not '
+                    'finish within the timeout: ' + repr(job),
+                )
+                for job in chunk
+            ]
+        return results
+
+    def compile(self, **kwargs):
+        """Compiles either of ``string`` or ``filename`` on a worker, and
+        optionally writes it to ``output_file``, the same way to
+        :func:`compile()`.
+
+        :returns: the compiled CSS string, or :const:`None` if it's written
+                  to ``output_file``
+        :rtype: :class:`str`
+        :raises sass.CompileError: when it fails to compile
+        :raises sass.CompileCrashed: when the worker crashes while it
+                                     compiles
+
+        """
+        timeout = kwargs.pop('timeout', None)
+        result, = self.compile_many((kwargs,), timeout=timeout)
+        return result
+
+    def compile_many(self, jobs, return_exceptions=False, timeout=None):
+        r"""Compiles ``jobs`` on the workers, the same way to
+        :func:`compile_many()` with ``interpreters=True``: jobs are compiled
+        independently from each other, so that the ``'output_file'``\ s
+        of all succeeded jobs are written even if any of them fails.
+
+        :param jobs: the sources to compile.  see :func:`compile_many()`
+        :type jobs: :class:`collections.abc.Iterable`
+        :param return_exceptions: whether to put :exc:`CompileError` of
+                                  failed jobs into the returned list instead
+                                  of raising it
+        :type return_exceptions: :class:`bool`
+        :param timeout: optional number of seconds all the jobs may take.
+                        the workers compiling the jobs which don't finish
+                        by then are killed, and the jobs fail with
+                        :exc:`CompileTimeout`
+        :type timeout: :class:`float`
+        :returns: the list of compiled CSS strings in the same order to
+                  ``jobs``
+        :rtype: :class:`list`
+        :raises sass.CompileError: when any of the jobs fails
+        :raises sass.CompileCrashed: when a worker crashes while it compiles
+                                     any of the jobs
+
+        """
+        _to_stop_args(timeout, None)
+        # Workers are other processes, which share only the wall clock
+        deadline = None if timeout is None else time.time() + timeout
+        jobs = [dict(job) for job in jobs]
+        # A few chunks per worker balance the load without paying for
+        # a round trip per job
+        size = max(1, -(-len(jobs) // (self.max_workers * 4)))
+        chunks = [jobs[i:i + size] for i in range(0, len(jobs), size)]
+        if len(chunks) > 1:
+            # Every thread waits for the worker it's taken
+            with concurrent.futures.ThreadPoolExecutor(
+                min(self.max_workers, len(chunks)),
+            ) as threads:
+                chunk_results = list(threads.map(
+                    self._compile_chunk, chunks, [deadline] * len(chunks),
+                ))
+        else:
+            chunk_results = [
+                self._compile_chunk(chunk, deadline) for chunk in chunks
+            ]
+        results = [
+            result for results in chunk_results for result in results
+        ]
+        if not return_exceptions:
+            for result in results:
+                if isinstance(result, CompileError):
+                    raise result
+        return results
+
+
+class _ProcessWorker:
+    """A worker process of :class:`ProcessPoolCompiler`, and the pipe to
+    send it chunks of jobs through.
+    """
+
+    #: Held while a worker is started, so that no other worker forked
+    #: meanwhile inherits the ends of its pipes, which would keep them open
+    #: after it crashes
+    _start_lock = threading.Lock()
+
+    def __init__(self, context, kwargs, max_memory_bytes, generation):
+        with self._start_lock:
+            self.connection, connection = context.Pipe()
+            self.process = context.Process(
+                target=_process_worker,
+                args=(connection, kwargs, max_memory_bytes), daemon=True,
+            )
+            self.process.start()
+            connection.close()
+        self.generation = generation
+        self.jobs = 0
+        self.alive = True
+
+    def compile(self, chunk, deadline):
+        """Compiles ``chunk`` of jobs, and returns their results,
+        :const:`None` if the process crashed, or :const:`False` if it
+        didn't finish before the ``deadline``, in which case it's killed.
+        """
+        self.jobs += len(chunk)
+        try:
+            self.connection.send((chunk, deadline))
+        except OSError:
+            self.kill()
+            return None
+        timeout = None if deadline is None else max(0, deadline - time.time())
+        ready = multiprocessing.connection.wait(
+            (self.connection, self.process.sentinel), timeout,
         )
-        if s:
+        if not ready:
+            # libsass can't be interrupted, but its process can be killed
+            self.kill()
+            return False
+        try:
+            if self.connection not in ready:
+                raise EOFError
+            succeeded, result = self.connection.recv()
+        except (EOFError, OSError):
+            self.kill()
+            return None
+        if not succeeded:
+            raise result
+        return result
+
+    def kill(self):
+        self.alive = False
+        self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+    def close(self):
+        """Lets the process exit, and waits for it."""
+        if self.connection.closed:
             return
-    else:
-        raise TypeError('something went wrong')
-    assert not s
-    raise CompileError(v)
+        self.alive = False
+        try:
+            self.connection.send(None)
+        except OSError:
+            self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+
+def _process_worker(connection, kwargs, max_memory_bytes):
+    """The main loop of a worker process of :class:`ProcessPoolCompiler`.
+    It compiles every chunk of jobs it receives through ``connection``,
+    and sends back the results, until it receives :const:`None`.
+    """
+    if max_memory_bytes is not None:
+        import resource
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        if hard != resource.RLIM_INFINITY:
+            max_memory_bytes = min(max_memory_bytes, hard)
+        resource.setrlimit(resource.RLIMIT_AS, (max_memory_bytes, hard))
+    _init_executor_compiler(pickle.loads(kwargs))
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            return
+        if message is None:
+            return
+        try:
+            results = _compile_chunk(*message)
+            if max_memory_bytes is not None:
+                results = list(map(_to_memory_limit_exceeded, results))
+            reply = True, results
+        except MemoryError:
+            reply = False, CompileLimitExceeded(
+                'the worker process ran out of max_memory_bytes',
+            )
+        except Exception as e:
+            reply = False, e
+        connection.send(reply)
+
+
+def _to_memory_limit_exceeded(result):
+    """Makes the error of libsass which failed to allocate memory over
+    ``max_memory_bytes`` of :class:`ProcessPoolCompiler`
+    :exc:`CompileLimitExceeded`.
+    """
+    if isinstance(result, CompileError) and \
+            'std::bad_alloc' in str(result):
+        return CompileLimitExceeded(*result.args)
+    return result
+
+
+def check(**kwargs):
+    r"""Checks whether the Sass source of either ``string`` or ``filename``
+    compiles, without rendering any CSS.  libsass stops after its parse
+    phase, which evaluates the whole stylesheet, so it finds the same
+    errors :func:`compile()` does, including those of imported files and
+    custom functions, but only saves the time to render CSS and a source
+    map.  It's meant for linters and CI steps which only need to know if
+    the sources are fine.
+
+    .. code-block:: python
+
+       try:
+           sass.check(filename='main.scss', include_paths=['vendor'])
+       except sass.CompileError as e:
+           print(e)
+
+    The rest of keyword arguments are the same to :func:`compile()`'s except
+    for ``output_type``, ``output_file`` and ``source_map_file``, which
+    make no sense without output.
+
+    :raises sass.CompileError: when the source has any error
+    :raises exceptions.IOError: when the ``filename`` doesn't exist or
+                                cannot be read
+
+    .. versionadded:: 0.24.0
+
+    """
+    modes = kwargs.keys() & {'string', 'filename'}
+    if len(modes) != 1:
+        raise TypeError('pass only one of filename and string')
+    mode_name, = modes
+    source = kwargs.pop(mode_name)
+    filename_hint = kwargs.pop('filename_hint', None)
+    compiler = Compiler._from_kwargs(check, kwargs)
+    compiler.check(**{mode_name: source}, filename_hint=filename_hint)
 
 
 def and_join(strings):
@@ -763,57 +3269,14 @@ SASS_WARNING: class:`SassWarning`
 """
 
 
-class SassNumber(collections.namedtuple('SassNumber', ('value', 'unit'))):
-
-    def __new__(cls, value, unit):
-        value = float(value)
-        if not isinstance(unit, str):
-            unit = unit.decode('UTF-8')
-        return super().__new__(cls, value, unit)
-
-
-class SassColor(collections.namedtuple('SassColor', ('r', 'g', 'b', 'a'))):
-
-    def __new__(cls, r, g, b, a):
-        r = float(r)
-        g = float(g)
-        b = float(b)
-        a = float(a)
-        return super().__new__(cls, r, g, b, a)
-
-
-SASS_SEPARATOR_COMMA = collections.namedtuple('SASS_SEPARATOR_COMMA', ())()
-SASS_SEPARATOR_SPACE = collections.namedtuple('SASS_SEPARATOR_SPACE', ())()
+SassNumber = _sass.SassNumber
+SassColor = _sass.SassColor
+SASS_SEPARATOR_COMMA = _sass.SASS_SEPARATOR_COMMA
+SASS_SEPARATOR_SPACE = _sass.SASS_SEPARATOR_SPACE
 SEPARATORS = frozenset((SASS_SEPARATOR_COMMA, SASS_SEPARATOR_SPACE))
-
-
-class SassList(
-    collections.namedtuple(
-        'SassList', ('items', 'separator', 'bracketed'),
-    ),
-):
-
-    def __new__(cls, items, separator, bracketed=False):
-        items = tuple(items)
-        assert separator in SEPARATORS, separator
-        assert isinstance(bracketed, bool), bracketed
-        return super().__new__(cls, items, separator, bracketed)
-
-
-class SassError(collections.namedtuple('SassError', ('msg',))):
-
-    def __new__(cls, msg):
-        if not isinstance(msg, str):
-            msg = msg.decode('UTF-8')
-        return super().__new__(cls, msg)
-
-
-class SassWarning(collections.namedtuple('SassWarning', ('msg',))):
-
-    def __new__(cls, msg):
-        if not isinstance(msg, str):
-            msg = msg.decode('UTF-8')
-        return super().__new__(cls, msg)
+SassList = _sass.SassList
+SassError = _sass.SassError
+SassWarning = _sass.SassWarning
 
 
 class SassMap(collections.abc.Mapping):
@@ -854,3 +3317,35 @@ class SassMap(collections.abc.Mapping):
         raise TypeError('SassMaps are immutable.')
 
     __setitem__ = __delitem__ = _immutable
+
+
+class SassMapProxy(SassMap):
+    """A :class:`SassMap` which custom functions declared with ``lazy=True``
+    get instead, backed by the Sass map itself.  Its keys and values are
+    converted only when they're looked up, and maps in it are proxies as
+    well, so that a function which reads a few entries of a huge map
+    doesn't pay for converting the whole map.
+
+    Looking a string key up compares it with the Sass map's keys without
+    converting them.  Other keys and iteration convert the keys, but not
+    the values.  A proxy which outlives the function call is converted as
+    a whole when the function returns, since the Sass map is freed then.
+    Returning a proxy as it is gives the Sass map back without converting.
+
+    It can't be instantiated by users.
+
+    .. versionadded:: 0.24.0
+
+    """
+
+    __slots__ = ()
+
+    def __init__(self, ref):
+        # _sass makes them with its _MapRef, which works as the dict
+        self._dict = ref
+        self._hash = None
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = hash(frozenset(self.items()))
+        return self._hash
@@ -1,16 +1,24 @@
+import asyncio
 import base64
 import collections.abc
+import concurrent.futures
 import contextlib
 import functools
 import glob
 import io
 import json
+import mmap
+import multiprocessing
 import os.path
+import pathlib
+import pickle
 import re
 import shutil
 import subprocess
 import sys
 import tempfile
+import threading
+import time
 import traceback
 import unittest
 
@@ -312,6 +320,22 @@ a {
         self.assertRaises(TypeError, sass.compile, string=1234)
         self.assertRaises(TypeError, sass.compile, string=[])
 
+    def test_compile_string_bytes_like(self):
+        source = 'a { b { color: blue; } } /* 유니코드 */'
+        expected = sass.compile(string=source)
+        encoded = source.encode('UTF-8')
+        for string in encoded, bytearray(encoded), memoryview(encoded):
+            assert sass.compile(string=string) == expected
+        with tempfile.TemporaryFile() as f:
+            f.write(encoded)
+            f.flush()
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                assert sass.compile(string=m) == expected
+        with pytest.raises(ValueError):
+            sass.compile(string=b'a { b: c; }\0')
+        with pytest.raises(ValueError):
+            sass.compile(string='a { b: c; }\0')
+
     def test_compile_string_sass_style(self):
         actual = sass.compile(
             string='a\n\tb\n\t\tcolor: blue;',
@@ -495,6 +519,60 @@ a {
         ):
             sass.compile(string='@import "hi";', importers=((0, importer),))
 
+    def test_importer_prefix_filter(self):
+        def importer(path):
+            return ((path, 'a { b: c; }'),)
+
+        result = sass.compile(
+            string='@import "b"; @import "icons/x";',
+            include_paths=['test'],
+            importers=((0, importer, 'icons/'),),
+            output_type='result',
+        )
+        assert result.css == B_EXPECTED_CSS + '\na {\n  b: c; }\n'
+        assert result.importer_calls == 1
+
+    def test_importer_regex_filter(self):
+        def importer(path, prev):
+            return ((path, '.' + path + ' { b: c; }'),)
+
+        result = sass.compile(
+            string='@import "b"; @import "x2";',
+            include_paths=['test'],
+            importers=((0, importer, re.compile(r'\d$')),),
+            output_type='result',
+        )
+        assert result.css == B_EXPECTED_CSS + '\n.x2 {\n  b: c; }\n'
+        assert result.importer_calls == 1
+
+    def test_importer_invalid_filter(self):
+        def importer(path):
+            return None
+
+        for path_filter in (b'icons/', re.compile(b'x')):
+            with pytest.raises(TypeError):
+                sass.compile(
+                    string='a { b: c; }',
+                    importers=((0, importer, path_filter),),
+                )
+
+    def test_importer_arity_from_signature(self):
+        def importer(path, prev=None):
+            assert prev == 'stdin'
+            return ((path, 'a { b: c; }'),)
+
+        def raising(path):
+            # It used to be called again with one argument on TypeError
+            raise TypeError('from the importer')
+
+        assert sass.compile(
+            string='@import "x";', importers=((0, importer),),
+        ) == 'a {\n  b: c; }\n'
+        with assert_raises_compile_error(
+            RegexMatcher(r'.+TypeError: from the importer'),
+        ):
+            sass.compile(string='@import "x";', importers=((0, raising),))
+
     def test_compile_string_deprecated_source_comments_line_numbers(self):
         source = '''a {
             b { color: blue; }
@@ -524,6 +602,99 @@ a {
         self.assertRaises(TypeError, sass.compile, filename=1234)
         self.assertRaises(TypeError, sass.compile, filename=[])
 
+    def test_compile_output_type_bytes(self):
+        actual = sass.compile(
+            string='a { color: blue; } /* 유니코드 */', output_type='bytes',
+        )
+        assert actual == sass.compile(
+            string='a { color: blue; } /* 유니코드 */',
+        ).encode('UTF-8')
+        actual, source_map = sass.compile(
+            filename='test/a.scss',
+            source_map_filename='a.scss.css.map',
+            output_type='bytes',
+        )
+        assert actual == A_EXPECTED_CSS_WITH_MAP.encode('UTF-8')
+        self.assert_source_map_equal(
+            A_EXPECTED_MAP, source_map.decode('UTF-8'),
+        )
+        assert sass.compile_many(
+            [{'filename': 'test/a.scss'}], output_type='bytes',
+        ) == [A_EXPECTED_CSS.encode('UTF-8')]
+
+    def test_compile_output_type_result(self):
+        result = sass.compile(
+            string='@import "b"; a { b: f(1px); }',
+            include_paths=['test'],
+            custom_functions={'f': lambda x: x},
+            importers=[(0, lambda path: None)],
+            output_type='result',
+        )
+        assert isinstance(result, sass.CompileResult)
+        assert result.css == B_EXPECTED_CSS + '\na {\n  b: 1px; }\n'
+        assert result.css_bytes == result.css.encode('UTF-8')
+        assert result.output_size == len(result.css_bytes)
+        assert result.source_map is None
+        assert [os.path.abspath(f) for f in result.included_files] == [
+            os.path.abspath('test/b.scss'),
+        ]
+        assert result.function_calls == 1
+        assert result.importer_calls == 1
+        assert 0 <= result.cpu_time
+        assert 0 <= result.wall_time
+        result = sass.compile(
+            filename='test/a.scss',
+            source_map_filename='a.scss.css.map',
+            output_type='result',
+        )
+        assert result.css == A_EXPECTED_CSS_WITH_MAP
+        self.assert_source_map_equal(A_EXPECTED_MAP, result.source_map)
+        assert [os.path.abspath(f) for f in result.included_files] == [
+            os.path.abspath('test/a.scss'),
+        ]
+        assert result.function_calls == result.importer_calls == 0
+        with pytest.raises(sass.CompileError):
+            sass.compile_many([{'string': 'a{b:c}'}], output_type='result')
+
+    def test_compile_plugin_paths(self):
+        # Directories without any plugins are fine
+        with tempdir() as tmpdir:
+            assert sass.compile(
+                string='a { b: c; }', plugin_paths=[tmpdir, 'i_dont_exist'],
+            ) == 'a {\n  b: c; }\n'
+        with pytest.raises(TypeError):
+            sass.compile(string='a { b: c; }', plugin_paths='plugins')
+
+    def test_compile_max_output_bytes(self):
+        css = 'a {\n  b: c; }\n'
+        assert sass.compile(string='a { b: c; }', max_output_bytes=14) == css
+        with pytest.raises(sass.CompileLimitExceeded) as excinfo:
+            sass.compile(string='a { b: c; }', max_output_bytes=13)
+        assert isinstance(excinfo.value, sass.CompileError)
+        assert str(excinfo.value) == (
+            'Output of 14 bytes exceeds max_output_bytes of 13'
+        )
+        with tempdir() as tmpdir:
+            output_file = os.path.join(tmpdir, 'a.css')
+            with pytest.raises(sass.CompileLimitExceeded):
+                sass.compile(
+                    filename='test/a.scss', max_output_bytes=10,
+                    output_file=output_file,
+                )
+            assert not os.path.exists(output_file)
+        results = sass.compile_many(
+            [{'string': 'a { b: c; }'}, {'string': 'a { bb: cc; }'}],
+            max_output_bytes=14, return_exceptions=True,
+        )
+        assert results[0] == css
+        assert isinstance(results[1], sass.CompileLimitExceeded)
+        with pytest.raises(ValueError):
+            sass.compile(string='a { b: c; }', max_output_bytes=-1)
+
+    def test_compile_invalid_output_type(self):
+        with pytest.raises(sass.CompileError):
+            sass.compile(string='a { color: blue; }', output_type='text')
+
     def test_compile_source_map(self):
         filename = 'test/a.scss'
         actual, source_map = sass.compile(
@@ -594,6 +765,47 @@ a {
         actual = sass.compile(filename='test/g.scss', precision=8)
         assert actual == G_EXPECTED_CSS_WITH_PRECISION_8
 
+    def test_compile_with_variables(self):
+        variables = {
+            'primary': sass.SassColor(255, 0, 0, 1),
+            '$gap': sass.SassNumber(4, 'px'),
+            'tokens': {'size': {'small': sass.SassNumber(1, 'em')}},
+            'font': 'Helvetica Neue',
+        }
+        actual = sass.compile(
+            string='$gap: 1px !default;\n'
+                   'a { b: $primary; c: $gap * 2; '
+                   'd: map-get(map-get($tokens, size), small); e: $font; }',
+            variables=variables,
+            output_style='compressed',
+        )
+        assert actual == 'a{b:red;c:8px;d:1em;e:Helvetica Neue}\n'
+        actual = sass.compile(
+            filename='test/h.sass', variables=variables,
+            output_style='compressed',
+        )
+        assert actual == 'a b{color:blue}\n'
+        actual = sass.compile(
+            string='a\n  b: $gap', indented=True, variables=variables,
+            output_style='compressed',
+        )
+        assert actual == 'a{b:4px}\n'
+
+    def test_compile_with_invalid_variables(self):
+        with pytest.raises(TypeError):
+            sass.compile(string='a { b: c; }', variables=[('a', 'b')])
+        with pytest.raises(TypeError):
+            sass.compile(string='a { b: c; }', variables={1: 'b'})
+        with pytest.raises(ValueError):
+            sass.compile(string='a { b: c; }', variables={'a b': 'c'})
+        with pytest.raises(TypeError) as excinfo:
+            sass.compile(string='a { b: c; }', variables={'a': 1})
+        assert 'Unexpected type: `int`' in str(excinfo.value)
+        with pytest.raises(TypeError):
+            sass.compile(
+                string='a { b: c; }', variables={'a': sass.SassError('b')},
+            )
+
     def test_regression_issue_2(self):
         actual = sass.compile(
             string='''
@@ -708,6 +920,25 @@ class BuilderTestCase(BaseTestCase):
             css,
         )
 
+    def test_compile_cache(self):
+        for dirpath, _, filenames in os.walk(self.sass_path):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                os.utime(path, (time.time() - 60,) * 2)
+        cache = sass.DiskCompileCache(os.path.join(self.temp_path, 'cache'))
+        result_files = build_directory(
+            self.sass_path, self.css_path, compile_cache=cache,
+        )
+        assert (cache.hits, cache.misses) == (0, 8)
+        shutil.rmtree(self.css_path)
+        cache = sass.DiskCompileCache(cache.directory)
+        assert build_directory(
+            self.sass_path, self.css_path, compile_cache=cache,
+        ) == result_files
+        assert (cache.hits, cache.misses) == (8, 0)
+        with open(os.path.join(self.css_path, 'a.scss.css')) as f:
+            assert f.read() == A_EXPECTED_CSS
+
 
 class ManifestTestCase(BaseTestCase):
 
@@ -747,9 +978,13 @@ class ManifestTestCase(BaseTestCase):
             with pytest.warns(FutureWarning):
                 m = Manifest(sass_path='test', css_path='css')
 
-            m.build_one(d, 'a.scss')
-            with open(os.path.join(d, 'css', 'a.scss.css')) as f:
+            css_path = os.path.join(d, 'css', 'a.scss.css')
+            assert m.build_one(d, 'a.scss') == css_path
+            with open(css_path) as f:
                 assert A_EXPECTED_CSS == f.read()
+            assert m.build_one(d, 'a.scss', keep_css=True) == (
+                css_path, A_EXPECTED_CSS.encode('utf-8'),
+            )
             m.build_one(d, 'b.scss', source_map=True)
             with open(
                 os.path.join(d, 'css', 'b.scss.css'), encoding='UTF-8',
@@ -888,6 +1123,46 @@ class WsgiTestCase(BaseTestCase):
             self.assertEqual(expected.encode(), r.data)
             assert r.mimetype == 'text/css'
 
+    def test_wsgi_sass_middleware_timeout(self):
+        with tempdir() as css_dir:
+            app = SassMiddleware(
+                self.sample_wsgi_app, {
+                    __name__: {
+                        'sass_path': 'test',
+                        'css_path': css_dir,
+                        'wsgi_path': '/static',
+                        'strip_extension': True,
+                    },
+                },
+                timeout=0,
+            )
+            client = Client(app, Response)
+            r = client.get('/static/h.css')
+            assert r.status_code == 200
+            assert r.data.startswith(b'/*\nCompile timed out\n*/')
+            assert r.mimetype == 'text/css'
+
+    def test_wsgi_sass_middleware_manifest_subclass(self):
+        built = []
+
+        class LoggingManifest(Manifest):
+            def build_one(self, package_dir, filename, **kwargs):
+                built.append(filename)
+                return super().build_one(package_dir, filename, **kwargs)
+
+        with tempdir() as css_dir:
+            app = SassMiddleware(
+                self.sample_wsgi_app, {
+                    __name__: LoggingManifest(
+                        'test', css_dir, '/static', strip_extension=True,
+                    ),
+                },
+            )
+            r = Client(app, Response).get('/static/h.css')
+            assert r.status_code == 200
+            assert r.data.startswith(b'a b {\n  color: blue; }\n')
+            assert built == ['h.sass']
+
 
 class DistutilsTestCase(BaseTestCase):
 
@@ -1037,6 +1312,481 @@ def write_file(filename, contents):
         f.write(contents)
 
 
+class CompilerTest(BaseTestCase):
+
+    def test_compile_string(self):
+        compiler = sass.Compiler(output_style='compressed')
+        for i in range(3):
+            css = compiler.compile(string=f'a {{ b: {i}; }}')
+            assert css == f'a{{b:{i}}}\n'
+
+    def test_compile_filename(self):
+        compiler = sass.Compiler(source_map_filename='a.scss.css.map')
+        css, source_map = compiler.compile(filename='test/a.scss')
+        assert (css, source_map) == sass.compile(
+            filename='test/a.scss', source_map_filename='a.scss.css.map',
+        )
+        assert compiler.compile(filename='test/b.scss')[0] == (
+            B_EXPECTED_CSS + '\n/*# sourceMappingURL=../a.scss.css.map */'
+        )
+
+    def test_compile_dirname(self):
+        with tempdir() as tmpdir:
+            input_dir = os.path.join(tmpdir, 'input')
+            output_dir = os.path.join(tmpdir, 'output')
+            os.makedirs(input_dir)
+            write_file(os.path.join(input_dir, 'f1.scss'), 'a { b: c; }')
+            compiler = sass.Compiler(output_style='compressed')
+            assert compiler.compile(dirname=(input_dir, output_dir)) is None
+            with open(os.path.join(output_dir, 'f1.css')) as f:
+                assert f.read() == 'a{b:c}\n'
+
+    def test_compile_many(self):
+        compiler = sass.Compiler(output_style='compressed')
+        assert compiler.compile_many(
+            [{'string': 'a { b: c; }'}, {'filename': 'test/h.sass'}],
+        ) == ['a{b:c}\n', 'a b{color:blue}\n']
+
+    def test_check(self):
+        compiler = sass.Compiler(custom_functions={returns_error})
+        assert compiler.check(string='a { b: c; }') is None
+        assert compiler.check(filename='test/a.scss') is None
+        with pytest.raises(sass.CompileError):
+            compiler.check(string='a {')
+        with pytest.raises(sass.CompileError) as excinfo:
+            compiler.check(string='a { b: returns_error(); }')
+        assert 'This is an error' in str(excinfo.value)
+        with pytest.raises(TypeError):
+            compiler.check()
+
+    def test_custom_functions_prepared_once(self):
+        compiler = sass.Compiler(custom_functions={'f': identity})
+        functions = compiler._options.custom_functions
+        assert compiler.compile(string='a { b: f(c); }') == 'a {\n  b: c; }\n'
+        assert compiler.compile(string='a { b: f(d); }') == 'a {\n  b: d; }\n'
+        assert compiler._options.custom_functions is functions
+
+    def test_variables(self):
+        compiler = sass.Compiler(
+            variables={'color': 'blue'}, output_style='compressed',
+        )
+        assert compiler.compile(string='a { b: $color; }') == 'a{b:blue}\n'
+        assert compiler.compile_many(
+            [{'string': 'a { b: $color; }'}, {'filename': 'test/h.sass'}],
+        ) == ['a{b:blue}\n', 'a b{color:blue}\n']
+        with tempdir() as tmpdir:
+            input_dir = os.path.join(tmpdir, 'input')
+            output_dir = os.path.join(tmpdir, 'output')
+            os.makedirs(input_dir)
+            write_file(os.path.join(input_dir, 'f1.scss'), 'a { b: $color; }')
+            assert compiler.compile(dirname=(input_dir, output_dir)) is None
+            with open(os.path.join(output_dir, 'f1.css')) as f:
+                assert f.read() == 'a{b:blue}\n'
+
+    def test_compile_cache(self):
+        cache = sass.CompileCache()
+        calls = []
+
+        def f(x):
+            calls.append(x)
+            return x
+
+        for _ in range(3):
+            assert sass.compile(
+                string='a { b: f(c); }', custom_functions={f},
+                compile_cache=cache, output_style='compressed',
+            ) == 'a{b:c}\n'
+        assert len(calls) == 1
+        assert (cache.hits, cache.misses, len(cache)) == (2, 1, 1)
+        assert sass.compile(
+            string='a { b: f(c); }', custom_functions={f},
+            compile_cache=cache,
+        ) == 'a {\n  b: c; }\n'
+        result = sass.compile(
+            string=b'a { b: f(c); }', custom_functions={f},
+            compile_cache=cache, output_style='compressed',
+            output_type='result',
+        )
+        assert result.css == 'a{b:c}\n'
+        assert (cache.hits, cache.misses, len(calls)) == (2, 3, 3)
+        cache.invalidate()
+        assert (len(cache), cache.size) == (0, 0)
+        with pytest.raises(TypeError):
+            sass.compile(string='a { b: c; }', compile_cache={})
+
+    def test_compile_cache_result(self):
+        cache = sass.CompileCache()
+
+        def f(x):
+            return x
+
+        results = [
+            sass.compile(
+                string='a { b: f(c); }', custom_functions={f},
+                compile_cache=cache, output_type='result',
+                profile_functions=True,
+            )
+            for _ in range(2)
+        ]
+        # A hit calls nothing, which its stats tell
+        assert [result.cached for result in results] == [False, True]
+        assert [result.function_calls for result in results] == [1, 0]
+        assert results[0].function_profiles['f'].calls == 1
+        assert results[1].function_profiles == {}
+        assert results[1].output_size == results[0].output_size
+        assert results[1].css == results[0].css
+
+    def test_compile_cache_importers(self):
+        cache = sass.CompileCache()
+
+        def importer(path):
+            return ((path, 'a { b: c; }'),)
+
+        for _ in range(2):
+            assert sass.compile(
+                string='@import "a";', importers=((0, importer),),
+                compile_cache=cache, output_style='compressed',
+            ) == 'a{b:c}\n'
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_compile_cache_included_files(self):
+        cache = sass.CompileCache()
+        with tempdir() as tmpdir:
+            partial = os.path.join(tmpdir, '_b.scss')
+            source = os.path.join(tmpdir, 'a.scss')
+            write_file(partial, 'b { c: d; }')
+            write_file(source, '@import "b";')
+            # Files modified just now aren't cached yet
+            for path in partial, source:
+                os.utime(path, (time.time() - 60,) * 2)
+            compiler = sass.Compiler(
+                compile_cache=cache, output_style='compressed',
+            )
+            for _ in range(2):
+                assert compiler.compile(filename=source) == 'b{c:d}\n'
+            assert (cache.hits, cache.misses) == (1, 1)
+            write_file(partial, 'b { c: e; }')
+            assert compiler.compile(filename=source) == 'b{c:e}\n'
+            assert (cache.hits, cache.misses) == (1, 2)
+            os.utime(partial, (time.time() - 30,) * 2)
+            assert compiler.compile(filename=source) == 'b{c:e}\n'
+            assert compiler.compile(filename=source) == 'b{c:e}\n'
+            assert (cache.hits, cache.misses) == (2, 3)
+            output = os.path.join(tmpdir, 'a.css')
+            compiler.compile(filename=source, output_file=output)
+            with open(output) as f:
+                assert f.read() == 'b{c:e}\n'
+            cache.invalidate(partial)
+            assert len(cache) == 0
+
+    def test_compile_cache_evictions(self):
+        cache = sass.CompileCache(max_bytes=100)
+        for i in range(3):
+            sass.compile(
+                string=f'a{i} {{ b: {"c" * 30}; }}', compile_cache=cache,
+            )
+        assert (len(cache), cache.evictions) == (1, 2)
+        assert cache.size <= 100
+        assert sass.compile(
+            string='a { b: ' + 'c' * 100 + '; }', compile_cache=cache,
+        )
+        assert cache.size <= 100
+        assert pickle.loads(pickle.dumps(cache)).max_bytes == 100
+        with pytest.raises(ValueError):
+            sass.CompileCache(-1)
+
+    def test_disk_compile_cache(self):
+        with tempdir() as tmpdir:
+            partial = os.path.join(tmpdir, '_b.scss')
+            source = os.path.join(tmpdir, 'a.scss')
+            directory = os.path.join(tmpdir, 'cache')
+
+            def write(path, contents):
+                write_file(path, contents)
+                # Files modified just now aren't cached yet
+                os.utime(path, (time.time() - 60,) * 2)
+
+            def compile_(**kwargs):
+                # Another process, as far as the cache is concerned
+                cache = sass.DiskCompileCache(directory)
+                css = sass.compile(
+                    compile_cache=cache, output_style='compressed', **kwargs
+                )
+                return css, (cache.hits, cache.misses)
+
+            write(partial, 'b { c: d; }')
+            write(source, '@import "b";')
+            assert compile_(filename=source) == ('b{c:d}\n', (0, 1))
+            assert compile_(filename=source) == ('b{c:d}\n', (1, 0))
+            write(partial, 'b { c: e; }')
+            assert compile_(filename=source) == ('b{c:e}\n', (0, 1))
+            write(partial, 'b { c: d; }')
+            assert compile_(filename=source) == ('b{c:d}\n', (1, 0))
+            assert compile_(
+                string='a { b: f(c); }', custom_functions={'f': identity},
+            ) == ('a{b:c}\n', (0, 1))
+            assert compile_(
+                string='a { b: f(c); }', custom_functions={'f': identity},
+            ) == ('a{b:c}\n', (1, 0))
+            # Importers and closures of them are told apart
+            for color in 'red', 'blue':
+                css = f'a{{color:{color}}}\n'
+                importer = color_importer(color)
+                assert compile_(
+                    string='@import "a";', importers=((0, importer),),
+                ) == (css, (0, 1))
+                assert compile_(
+                    string='@import "a";', importers=((0, importer),),
+                ) == (css, (1, 0))
+            # What can't be identified in other processes isn't cached
+
+            class Importer:
+                def import_(self, path):
+                    return ((path, 'a { b: c; }'),)
+
+            for _ in range(2):
+                assert compile_(
+                    string='@import "a";',
+                    importers=((0, Importer().import_),),
+                ) == ('a{b:c}\n', (0, 1))
+            cache = sass.DiskCompileCache(directory)
+            assert sass.compile_many(
+                [{'filename': source}, {'string': 'a { b: c; }'}],
+                compile_cache=cache, output_style='compressed',
+            ) == ['b{c:d}\n', 'a{b:c}\n']
+            assert (cache.hits, cache.misses) == (1, 1)
+            cache.invalidate()
+            assert compile_(filename=source) == ('b{c:d}\n', (0, 1))
+            assert pickle.loads(pickle.dumps(cache)).directory == directory
+            cache = sass.DiskCompileCache(directory, max_bytes=0)
+            sass.compile(string='a { b: c; }', compile_cache=cache)
+            assert cache.evictions > 0
+            assert not any(
+                os.listdir(os.path.join(directory, subdir))
+                for subdir in os.listdir(directory)
+            )
+
+    def test_modes(self):
+        compiler = sass.Compiler()
+        with pytest.raises(TypeError):
+            compiler.compile()
+        with pytest.raises(TypeError):
+            compiler.compile(string='a{b:c}', filename='test/a.scss')
+
+    def test_file_args_only_for_filename(self):
+        compiler = sass.Compiler(source_map_filename='a.map')
+        with pytest.raises(sass.CompileError):
+            compiler.compile(string='a { b: c; }')
+
+    def test_invalid_arguments(self):
+        with pytest.raises(TypeError) as excinfo:
+            sass.Compiler(herp='derp')
+        msg, = excinfo.value.args
+        assert msg == "Compiler() got unexpected keyword argument(s) 'herp'"
+        with pytest.raises(TypeError):
+            sass.Compiler(output_style=123)
+        with pytest.raises(TypeError):
+            sass.Compiler(indented='yes')
+
+
+class CheckTest(unittest.TestCase):
+
+    def test_valid(self):
+        assert sass.check(string='a { b { color: blue; } }') is None
+        assert sass.check(filename='test/a.scss') is None
+        assert sass.check(
+            string='@import "b";', include_paths=['test'],
+        ) is None
+
+    def test_errors(self):
+        with pytest.raises(sass.CompileError) as excinfo:
+            sass.check(string='a { b { color: blue; }')
+        assert 'Invalid CSS after' in str(excinfo.value)
+        # Not only syntax but evaluation errors are reported as well
+        with pytest.raises(sass.CompileError) as excinfo:
+            sass.check(string='a { b: $undefined; }')
+        assert 'Undefined variable' in str(excinfo.value)
+        with tempdir() as tmpdir:
+            filename = os.path.join(tmpdir, 'a.scss')
+            write_file(filename, '@import "missing";')
+            with pytest.raises(sass.CompileError):
+                sass.check(filename=filename)
+        with pytest.raises(OSError):
+            sass.check(filename='i_dont_exist_lol.scss')
+
+    def test_modes(self):
+        with pytest.raises(TypeError):
+            sass.check()
+        with pytest.raises(TypeError):
+            sass.check(string='a{b:c}', filename='test/a.scss')
+        with pytest.raises(TypeError):
+            sass.check(dirname=('test', 'out'))
+        with pytest.raises(TypeError):
+            sass.check(string='a{b:c}', herp='derp')
+
+
+class StopTest(unittest.TestCase):
+
+    source = '@for $i from 1 through 100 { .a-#{$i} { b: tick($i); } }'
+
+    def test_timeout(self):
+        def tick(i):
+            time.sleep(0.01)
+            return i
+
+        with pytest.raises(sass.CompileTimeout) as excinfo:
+            sass.compile(
+                string=self.source, custom_functions={tick}, timeout=0.1,
+            )
+        assert isinstance(excinfo.value, sass.CompileError)
+        assert 'Compile timed out' in str(excinfo.value)
+        # Long enough
+        css = sass.compile(
+            string=self.source, custom_functions={'tick': lambda i: i},
+            timeout=60,
+        )
+        assert '.a-100 {\n  b: 100; }' in css
+
+    def test_cancel(self):
+        cancel = threading.Event()
+        calls = []
+
+        def tick(i):
+            calls.append(i)
+            if len(calls) == 3:
+                cancel.set()
+            return i
+
+        with pytest.raises(sass.CompileCancelled) as excinfo:
+            sass.compile(
+                string=self.source, custom_functions={tick}, cancel=cancel,
+            )
+        assert not isinstance(excinfo.value, sass.CompileTimeout)
+        assert 'Compile cancelled' in str(excinfo.value)
+        assert len(calls) == 3
+        with pytest.raises(sass.CompileCancelled):
+            sass.compile(
+                string='@import "a";', cancel=cancel,
+                importers=((0, lambda path: ((path, 'a { b: c; }'),)),),
+            )
+
+    def test_between_phases(self):
+        # Without any callback, it's checked after parsing
+        with pytest.raises(sass.CompileTimeout) as excinfo:
+            sass.compile(filename='test/a.scss', timeout=0)
+        assert str(excinfo.value) == 'Compile timed out'
+        with pytest.raises(sass.CompileTimeout):
+            sass.compile(string='a { b: c; }', timeout=0)
+
+    def test_compile_many(self):
+        cancel = threading.Event()
+        cancel.set()
+        with tempdir() as tmpdir:
+            jobs = [
+                {'string': 'a { b: c; }', 'output_file': os.path.join(
+                    tmpdir, f'{i}.css',
+                )}
+                for i in range(10)
+            ]
+            with pytest.raises(sass.CompileCancelled):
+                sass.compile_many(jobs, return_exceptions=True, cancel=cancel)
+            with pytest.raises(sass.CompileTimeout):
+                sass.compile_many(jobs, timeout=0)
+            assert os.listdir(tmpdir) == []
+
+    def test_error_past_deadline(self):
+        # A compile which fails on its own isn't reported as stopped just
+        # because it fails after the deadline
+        def slow():
+            time.sleep(0.2)
+            raise ValueError('slow failed')
+
+        with pytest.raises(sass.CompileError) as excinfo:
+            sass.compile(
+                string='a { b: slow(); }', custom_functions={slow},
+                timeout=0.1,
+            )
+        assert not isinstance(excinfo.value, sass.CompileCancelled)
+        assert 'slow failed' in str(excinfo.value)
+        results = sass.compile_many(
+            [{'string': 'a {'}, {'string': 'a { b: slow(); }'}],
+            custom_functions={slow}, return_exceptions=True, timeout=0.1,
+            max_workers=1,
+        )
+        assert [type(result) for result in results] == [sass.CompileError] * 2
+        assert 'slow failed' in str(results[1])
+        with pytest.raises(sass.CompileError) as excinfo:
+            sass.compile_many(
+                [{'string': 'a { b: slow(); }'}], custom_functions={slow},
+                timeout=0.1,
+            )
+        assert not isinstance(excinfo.value, sass.CompileCancelled)
+
+    def test_invalid_arguments(self):
+        with pytest.raises(ValueError):
+            sass.compile(string='a { b: c; }', timeout=-1)
+        with pytest.raises(TypeError):
+            sass.compile(string='a { b: c; }', timeout='1')
+        with pytest.raises(TypeError):
+            sass.compile(string='a { b: c; }', cancel=True)
+
+
+class CompileAsyncTest(unittest.TestCase):
+
+    def test_compile_async(self):
+        async def compile_all():
+            return await asyncio.gather(*(
+                sass.compile_async(string=f'a {{ b: {i}; }}')
+                for i in range(10)
+            ))
+        assert asyncio.run(compile_all()) == [
+            sass.compile(string=f'a {{ b: {i}; }}') for i in range(10)
+        ]
+        with pytest.raises(sass.CompileError):
+            asyncio.run(sass.compile_async(string='a {'))
+        with pytest.raises(TypeError):
+            asyncio.run(sass.compile_async(
+                string='a { b: c; }', cancel=threading.Event(),
+            ))
+
+    def test_async_callbacks(self):
+        async def double(x):
+            await asyncio.sleep(0)
+            return sass.SassNumber(x.value * 2, x.unit)
+
+        async def importer(path):
+            await asyncio.sleep(0)
+            return ((path, f'a {{ b: double({path}px); }}'),)
+        css = asyncio.run(sass.compile_async(
+            string='@import "2";',
+            custom_functions={double},
+            importers=((0, importer),),
+            output_style='compressed',
+        ))
+        assert css == 'a{b:4px}\n'
+        css = asyncio.run(sass.compile_async(
+            string='a { b: twice(3px); }',
+            custom_functions={'twice': double},
+            executor=concurrent.futures.ThreadPoolExecutor(1),
+            output_style='compressed',
+        ))
+        assert css == 'a{b:6px}\n'
+
+    def test_cancel(self):
+        async def slow(x):
+            await asyncio.sleep(60)
+            return x
+        started = time.monotonic()
+        with pytest.raises(asyncio.TimeoutError):
+            asyncio.run(asyncio.wait_for(
+                sass.compile_async(
+                    string='a { b: slow(1); }', custom_functions={slow},
+                ),
+                timeout=0.1,
+            ))
+        assert time.monotonic() - started < 10
+
+
 class CompileDirectoriesTest(unittest.TestCase):
 
     def test_directory_does_not_exist(self):
@@ -1113,6 +1863,301 @@ class CompileDirectoriesTest(unittest.TestCase):
             assert msg.startswith('Error: Invalid CSS after ')
 
 
+class CompileManyTest(unittest.TestCase):
+
+    def test_results_in_order(self):
+        jobs = [
+            {'string': f'.a-{i} {{ width: {i}px; }}'} for i in range(50)
+        ]
+        jobs.insert(10, {'filename': 'test/a.scss'})
+        for max_workers in (1, 4, 100):
+            results = sass.compile_many(jobs, max_workers=max_workers)
+            assert results[10] == A_EXPECTED_CSS
+            del results[10]
+            assert results == [
+                f'.a-{i} {{\n  width: {i}px; }}\n' for i in range(50)
+            ]
+
+    def test_empty(self):
+        assert sass.compile_many([]) == []
+
+    def test_bytes_like(self):
+        results = sass.compile_many([
+            {'string': b'a { b: c; }'},
+            {'string': bytearray(b'a { b: c; }')},
+            {'string': memoryview(b'a { b: c; }')},
+        ])
+        assert results == ['a {\n  b: c; }\n'] * 3
+
+    def test_shared_options(self):
+        results = sass.compile_many(
+            [
+                {'filename': 'test/h.sass'},
+                {'string': 'a\n\tb\n\t\tcolor: blue;'},
+            ],
+            output_style='compressed',
+            indented=True,
+        )
+        assert results == ['a b{color:blue}\n'] * 2
+
+    def test_custom_functions(self):
+        results = sass.compile_many(
+            [{'string': f'a {{ b: identity({i}); }}'} for i in range(40)],
+            max_workers=4,
+            custom_functions={identity},
+            output_style='compressed',
+        )
+        assert results == [f'a{{b:{i}}}\n' for i in range(40)]
+
+    def test_error(self):
+        jobs = [
+            {'string': 'a { b: c; }'},
+            {'string': 'a {'},
+            {'string': 'a { b: returns_error(); }'},
+        ]
+        with pytest.raises(sass.CompileError) as excinfo:
+            sass.compile_many(jobs, custom_functions={returns_error})
+        msg, = excinfo.value.args
+        assert msg.startswith('Error: Invalid CSS after ')
+        results = sass.compile_many(
+            jobs, return_exceptions=True, custom_functions={returns_error},
+        )
+        assert results[0] == 'a {\n  b: c; }\n'
+        assert isinstance(results[1], sass.CompileError)
+        assert isinstance(results[2], sass.CompileError)
+        assert 'This is an error' in str(results[2])
+
+    def test_output_file(self):
+        with tempdir() as tmpdir:
+            jobs = [
+                {
+                    'string': f'.a-{i} {{ width: {i}px; }}',
+                    'output_file': os.path.join(tmpdir, f'{i}.css'),
+                }
+                for i in range(10)
+            ]
+            jobs.insert(5, {'string': 'a {', 'output_file': 'error.css'})
+            jobs.append({'string': 'a { b: c; }'})
+            with pytest.raises(sass.CompileError):
+                sass.compile_many(jobs)
+            # Written up to the first error
+            assert sorted(os.listdir(tmpdir)) == [f'{i}.css' for i in range(5)]
+            results = sass.compile_many(jobs, return_exceptions=True)
+            assert results[:5] == results[6:-1] == [None] * 5
+            assert isinstance(results[5], sass.CompileError)
+            assert results[-1] == 'a {\n  b: c; }\n'
+            for i in range(10):
+                with open(os.path.join(tmpdir, f'{i}.css')) as f:
+                    assert f.read() == f'.a-{i} {{\n  width: {i}px; }}\n'
+
+    @pytest.mark.skipif(
+        not hasattr(concurrent.futures, 'InterpreterPoolExecutor'),
+        reason='requires InterpreterPoolExecutor',
+    )
+    def test_interpreters(self):
+        jobs = [{'string': f'a {{ b: identity({i}); }}'} for i in range(40)]
+        jobs.append({'string': 'a { b: returns_error(); }'})
+        results = sass.compile_many(
+            jobs, max_workers=4, return_exceptions=True, interpreters=True,
+            custom_functions={identity, returns_error},
+            output_style='compressed',
+        )
+        assert results[:-1] == [f'a{{b:{i}}}\n' for i in range(40)]
+        assert isinstance(results[-1], sass.CompileError)
+        with pytest.raises(sass.CompileError):
+            sass.compile_many(
+                jobs, interpreters=True,
+                custom_functions={identity, returns_error},
+            )
+
+    @pytest.mark.skipif(
+        hasattr(concurrent.futures, 'InterpreterPoolExecutor'),
+        reason='InterpreterPoolExecutor is available',
+    )
+    def test_interpreters_unavailable(self):
+        with pytest.raises(RuntimeError):
+            sass.compile_many([{'string': 'a { b: c; }'}], interpreters=True)
+
+    def test_invalid_jobs(self):
+        with pytest.raises(TypeError):
+            sass.compile_many(['test/a.scss'])
+        with pytest.raises(TypeError):
+            sass.compile_many([{'string': 'a{b:c}', 'filename': 'a.scss'}])
+        with pytest.raises(TypeError):
+            sass.compile_many([{'dirname': ('test', 'out')}])
+        with pytest.raises(TypeError):
+            sass.compile_many([{'string': 1234}])
+        with pytest.raises(OSError):
+            sass.compile_many([{'filename': 'i_dont_exist_lol.scss'}])
+        with pytest.raises(ValueError):
+            sass.compile_many([], max_workers=0)
+
+    def test_disallows_arbitrary_arguments(self):
+        with pytest.raises(TypeError) as excinfo:
+            sass.compile_many([], source_map_filename='a.map')
+        msg, = excinfo.value.args
+        assert msg == (
+            "compile_many() got unexpected keyword argument(s) "
+            "'source_map_filename'"
+        )
+
+
+def test_subinterpreters():
+    try:
+        import _interpreters as interpreters  # Python 3.13+
+    except ImportError:
+        interpreters = pytest.importorskip('_xxsubinterpreters')
+    code = f'''
+import sys
+sys.path[:] = {sys.path!r}
+import sass
+
+def twice(x):
+    return sass.SassNumber(x.value * 2, x.unit)
+
+css = 'a {{\\n  b: 4px; }}\\n'
+assert sass.compile(
+    string='a {{ b: twice(2px); }}', custom_functions={{twice}},
+) == css
+assert sass.compile_many(
+    [{{'string': 'a {{ b: twice(2px); }}'}}] * 8, max_workers=4,
+    custom_functions={{twice}},
+) == [css] * 8
+'''
+    interps = [interpreters.create() for _ in range(2)]
+    try:
+        for interp in interps:
+            # _interpreters returns an exception instead of raising it
+            assert interpreters.run_string(interp, code) is None
+    finally:
+        for interp in interps:
+            interpreters.destroy(interp)
+    # The main interpreter's module is left intact
+    assert sass.compile(
+        string='a { b: identity(2px); }', custom_functions={identity},
+    ) == 'a {\n  b: 2px; }\n'
+
+
+class ProcessPoolCompilerTest(unittest.TestCase):
+
+    def test_compile(self):
+        with sass.ProcessPoolCompiler(
+            max_workers=2, custom_functions={identity},
+            output_style='compressed',
+        ) as compiler:
+            assert compiler.compile(
+                string='a { b: identity(2px); }',
+            ) == 'a{b:2px}\n'
+            assert compiler.compile_many(
+                [{'string': f'a {{ b: {i}; }}'} for i in range(20)],
+            ) == [f'a{{b:{i}}}\n' for i in range(20)]
+            with pytest.raises(sass.CompileError):
+                compiler.compile(string='a {')
+            with tempdir() as tmpdir:
+                output_file = os.path.join(tmpdir, 'a.css')
+                assert compiler.compile(
+                    string='a { b: c; }', output_file=output_file,
+                ) is None
+                with open(output_file) as f:
+                    assert f.read() == 'a{b:c}\n'
+
+    def test_crash(self):
+        jobs = [{'string': f'a {{ b: {i}; }}'} for i in range(20)]
+        jobs[7] = {'string': 'a { b: crashes(); }'}
+        with sass.ProcessPoolCompiler(
+            max_workers=2, custom_functions={crashes},
+        ) as compiler:
+            results = compiler.compile_many(jobs, return_exceptions=True)
+            assert isinstance(results[7], sass.CompileCrashed)
+            assert all(
+                isinstance(result, str)
+                for i, result in enumerate(results) if i != 7
+            )
+            with pytest.raises(sass.CompileCrashed):
+                compiler.compile(**jobs[7])
+            # The crashed workers are replaced
+            assert compiler.compile(string='a { b: c; }') == 'a {\n  b: c; }\n'
+
+    def test_timeout(self):
+        endless = '$i: 0; @while $i >= 0 { $i: $i + 1; }'
+        with sass.ProcessPoolCompiler(max_workers=2) as compiler:
+            started = time.monotonic()
+            with pytest.raises(sass.CompileTimeout):
+                compiler.compile(string=endless, timeout=0.2)
+            results = compiler.compile_many(
+                [{'string': endless}, {'string': 'a { b: c; }'}],
+                timeout=0.2, return_exceptions=True,
+            )
+            assert isinstance(results[0], sass.CompileTimeout)
+            assert results[1] == 'a {\n  b: c; }\n'
+            assert time.monotonic() - started < 10
+            # The killed workers are replaced
+            assert compiler.compile(string='a { b: c; }') == 'a {\n  b: c; }\n'
+
+    def test_max_jobs_per_worker(self):
+        with sass.ProcessPoolCompiler(
+            max_workers=1, max_jobs_per_worker=2, custom_functions={pid},
+        ) as compiler:
+            pids = {
+                compiler.compile(string='a { b: pid(); }') for _ in range(4)
+            }
+        assert len(pids) == 2
+
+    @pytest.mark.skipif(
+        sys.platform == 'win32', reason='os.kill() terminates on Windows',
+    )
+    def test_close(self):
+        endless = '$i: 0; @while $i >= 0 { $i: $i + 1; }'
+        with sass.ProcessPoolCompiler(
+            max_workers=1, custom_functions={pid},
+        ) as compiler:
+            pids = [compiler.compile(string='a { b: pid(); }')]
+            # The killed worker is replaced
+            with pytest.raises(sass.CompileTimeout):
+                compiler.compile(string=endless, timeout=0.2)
+            pids.append(compiler.compile(string='a { b: pid(); }'))
+        assert pids[0] != pids[1]
+        # Both the killed worker and the one stopped by close() are gone
+        for css in pids:
+            with pytest.raises(ProcessLookupError):
+                os.kill(int(css.split()[-2].rstrip(';')), 0)
+
+    @pytest.mark.skipif(
+        sys.platform != 'linux', reason='RLIMIT_AS is enforced on Linux',
+    )
+    def test_max_memory_bytes(self):
+        # Its string doubles 40 times, up to a terabyte
+        bomb = '$s: x; @for $i from 1 through 40 { $s: $s + $s; } a { b: $s; }'
+        with sass.ProcessPoolCompiler(
+            max_workers=1, max_memory_bytes=256 * 1024 * 1024,
+            # A fresh interpreter rather than a fork of this large process
+            mp_context=multiprocessing.get_context('spawn'),
+        ) as compiler:
+            results = compiler.compile_many(
+                [{'string': bomb}, {'string': 'a { b: c; }'}],
+                return_exceptions=True,
+            )
+            assert isinstance(results[0], sass.CompileLimitExceeded)
+            assert results[1] == 'a {\n  b: c; }\n'
+            with pytest.raises(sass.CompileLimitExceeded):
+                compiler.compile(string=bomb)
+            assert compiler.compile(string='a { b: c; }') == 'a {\n  b: c; }\n'
+
+    def test_invalid_arguments(self):
+        with pytest.raises(TypeError):
+            sass.ProcessPoolCompiler(custom_functions={'f': lambda: None})
+        with pytest.raises(TypeError):
+            sass.ProcessPoolCompiler(source_map_filename='a.map')
+        with pytest.raises(ValueError):
+            sass.ProcessPoolCompiler(max_workers=0)
+        with pytest.raises(ValueError):
+            sass.ProcessPoolCompiler(max_jobs_per_worker=0)
+        with pytest.raises(ValueError):
+            sass.ProcessPoolCompiler(max_memory_bytes=0)
+        with pytest.raises(TypeError):
+            sass.ProcessPoolCompiler(max_memory_bytes='1G')
+
+
 class SassFunctionTest(unittest.TestCase):
 
     def test_from_lambda(self):
@@ -1198,6 +2243,53 @@ class SassTypesTest(unittest.TestCase):
         err = sass.SassError(b'error msg')
         assert type(err.msg) is str, type(err.msg)
 
+    def test_sass_list_assertions(self):
+        with pytest.raises(AssertionError):
+            sass.SassList(('foo',), ',')
+        with pytest.raises(AssertionError):
+            sass.SassList(('foo',), sass.SASS_SEPARATOR_SPACE, bracketed=1)
+
+    def test_namedtuple_interface(self):
+        num = sass.SassNumber(unit='px', value=1)
+        assert num == (1.0, 'px')
+        assert repr(num) == "SassNumber(value=1.0, unit='px')"
+        assert num._fields == ('value', 'unit')
+        assert num._asdict() == {'value': 1.0, 'unit': 'px'}
+        assert num._replace(unit='em') == sass.SassNumber(1, 'em')
+        assert sass.SassColor._make([1, 2, 3, 1]) == (1, 2, 3, 1)
+        assert repr(sass.SASS_SEPARATOR_SPACE) == 'SASS_SEPARATOR_SPACE()'
+        with pytest.raises(ValueError):
+            num._replace(units='em')
+        with pytest.raises(TypeError):
+            sass.SassNumber._make([1])
+        with pytest.raises(AttributeError):
+            num.value = 2
+
+    def test_pickle(self):
+        values = (
+            sass.SassNumber(1, 'px'),
+            sass.SassColor(1, 2, 3, .5),
+            sass.SassList(('a', 'b'), sass.SASS_SEPARATOR_COMMA, True),
+            sass.SassError('error msg'),
+            sass.SassWarning('warning msg'),
+        )
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            loaded = pickle.loads(pickle.dumps(values, protocol))
+            assert loaded == values
+            assert tuple(map(type, loaded)) == tuple(map(type, values))
+            assert loaded[2].separator is sass.SASS_SEPARATOR_COMMA
+
+    def test_subclass(self):
+        class Length(sass.SassNumber):
+            __slots__ = ()
+
+            def double(self):
+                return self._replace(value=self.value * 2)
+
+        length = Length(3, b'px').double()
+        assert type(length) is Length
+        assert repr(length) == "Length(value=6.0, unit='px')"
+
 
 def raises():
     raise AssertionError('foo')
@@ -1266,6 +2358,20 @@ def returns_map():
     return sass.SassMap([('foo', 'bar')])
 
 
+def crashes():
+    os._exit(1)
+
+
+def pid():
+    return str(os.getpid())
+
+
+def color_importer(color):
+    def importer(path):
+        return ((path, f'a {{ color: {color}; }}'),)
+    return importer
+
+
 def identity(x):
     """This has the side-effect of bubbling any exceptions we failed to process
     in C land
@@ -1608,6 +2714,205 @@ class CustomFunctionsTest(unittest.TestCase):
             'a{content:baz}\n',
         )
 
+    def test_large_map(self):
+        def tokens():
+            return {f'k{i}': sass.SassNumber(i, 'px') for i in range(5000)}
+
+        def total(tokens):
+            assert isinstance(tokens, sass.SassMap)
+            return sass.SassNumber(sum(v.value for v in tokens.values()), 'px')
+
+        self.assertEqual(
+            sass.compile(
+                string='a { b: total(tokens()); c: map-get(tokens(), k42); }',
+                custom_functions={'tokens': tokens, 'total': total},
+                output_style='compressed',
+            ),
+            'a{b:12497500px;c:42px}\n',
+        )
+
+    def test_deeply_nested_list(self):
+        def nest():
+            value = sass.SassMap({'leaf': sass.SassNumber(1, 'px')})
+            for _ in range(2000):
+                value = sass.SassList((value,), sass.SASS_SEPARATOR_SPACE)
+            return value
+
+        def depth(value):
+            n = 0
+            while isinstance(value, sass.SassList):
+                value, = value.items
+                n += 1
+            return sass.SassNumber(n, value['leaf'].unit)
+
+        self.assertEqual(
+            sass.compile(
+                string='a { b: depth(identity(nest())); }',
+                custom_functions={
+                    'nest': nest, 'depth': depth, 'identity': identity,
+                },
+                output_style='compressed',
+            ),
+            'a{b:2000px}\n',
+        )
+
+    def test_lazy_map(self):
+        def lookup(tokens, key):
+            assert isinstance(tokens, sass.SassMapProxy)
+            return tokens[key]
+
+        def nested(tokens):
+            return tokens['n']['x']
+
+        def keys(tokens):
+            return sass.SassList(list(tokens), sass.SASS_SEPARATOR_COMMA)
+
+        self.assertEqual(
+            sass.compile(
+                string='$m: (a: 1px, 2: two, n: (x: deep));'
+                       'a { b: lookup($m, a); c: lookup($m, 2);'
+                       '    d: nested($m); e: keys($m);'
+                       '    f: map-get(identity($m), a); }',
+                custom_functions={
+                    sass.SassFunction.from_named_function(f, lazy=True)
+                    for f in (lookup, nested, keys)
+                } | {sass.SassFunction('identity', ('$x',), identity, True)},
+                output_style='compressed',
+            ),
+            'a{b:1px;c:two;d:deep;e:a,2,n;f:1px}\n',
+        )
+        with assert_raises_compile_error(RegexMatcher(r".+KeyError: 'z'")):
+            sass.compile(
+                string='a { b: lookup((a: 1), z); }',
+                custom_functions={
+                    sass.SassFunction.from_named_function(lookup, lazy=True),
+                },
+            )
+
+    def test_lazy_map_outlives_call(self):
+        kept = []
+
+        def keep(tokens):
+            kept.append(tokens)
+            return tokens['a']
+
+        sass.compile(
+            string='a { b: keep((a: 1px, n: (x: y))); }',
+            custom_functions={
+                sass.SassFunction.from_named_function(keep, lazy=True),
+            },
+        )
+        tokens, = kept
+        assert isinstance(tokens, sass.SassMapProxy)
+        assert tokens == sass.SassMap({
+            'a': sass.SassNumber(1, 'px'),
+            'n': sass.SassMap({'x': 'y'}),
+        })
+        assert len(tokens) == 2
+        assert hash(tokens) == hash(sass.SassMap(tokens))
+
+    def test_pure_function(self):
+        calls = []
+
+        @sass.pure
+        def rem(px):
+            calls.append(px)
+            return sass.SassNumber(px.value / 16, 'rem')
+
+        source = 'a { b: rem(16px); c: rem(32px); d: rem(16px); }'
+        compiler = sass.Compiler(
+            custom_functions={rem}, output_style='compressed',
+        )
+        assert compiler.compile(string=source) == 'a{b:1rem;c:2rem;d:1rem}\n'
+        assert compiler.compile(string=source) == 'a{b:1rem;c:2rem;d:1rem}\n'
+        assert len(calls) == 2
+        cache = compiler.function_cache
+        assert (cache.hits, cache.misses, len(cache)) == (4, 2, 2)
+        cache.clear()
+        assert (cache.hits, cache.misses, len(cache)) == (0, 0, 0)
+
+    def test_pure_function_shared_cache(self):
+        calls = []
+
+        def double(x):
+            calls.append(x)
+            if x.unit == 'em':
+                return sass.SassError('no em')
+            return sass.SassNumber(x.value * 2, x.unit)
+
+        cache = sass.FunctionCache(maxsize=1)
+        for _ in range(2):
+            assert sass.compile(
+                string='a { b: double(1px); c: double(1px); }',
+                custom_functions={
+                    sass.SassFunction.from_named_function(double, pure=True),
+                },
+                function_cache=cache,
+                output_style='compressed',
+            ) == 'a{b:2px;c:2px}\n'
+        assert len(calls) == 2  # SassFunction objects aren't the same
+        assert (cache.hits, cache.misses, len(cache)) == (2, 2, 1)
+        with pytest.raises(sass.CompileError):
+            sass.compile(
+                string='a { b: double(1em); }',
+                custom_functions=[sass.SassFunction('double', ('$x',), double,
+                                                    pure=True)],
+                function_cache=cache,
+            )
+        assert len(cache) == 1  # errors aren't cached
+        assert pickle.loads(pickle.dumps(cache)).maxsize == 1
+        with pytest.raises(TypeError):
+            sass.compile(string='a { b: c; }', function_cache={})
+        with pytest.raises(ValueError):
+            sass.FunctionCache(-1)
+
+    def test_profile_functions(self):
+        def slow(x):
+            time.sleep(0.01)
+            return x
+
+        result = sass.compile(
+            string='a { b: slow(1px); c: slow(2px); d: fast(3px); }',
+            custom_functions={slow, sass.SassFunction('fast', ('$x',), str)},
+            profile_functions=True,
+            output_type='result',
+        )
+        profiles = result.function_profiles
+        assert sorted(profiles) == ['fast', 'slow']
+        assert profiles['fast'].calls == 1
+        profile = profiles['slow']
+        assert profile.calls == 2
+        assert profile.call_time >= profile.max_time / 2 >= 0.005
+        assert profile.total_time >= (
+            profile.arguments_time + profile.call_time + profile.result_time
+        )
+        assert sass.compile(
+            string='a { b: c; }', output_type='result',
+        ).function_profiles is None
+        with pytest.raises(TypeError):
+            sass.compile(string='a { b: c; }', profile_functions=1)
+
+    def test_compiler_profile_functions(self):
+        def fail(x):
+            raise ValueError(x)
+
+        compiler = sass.Compiler(
+            custom_functions={
+                'double': lambda x: sass.SassNumber(x.value * 2, x.unit),
+                'fail': fail,
+            },
+            profile_functions=True,
+        )
+        assert compiler.function_profiles['double'].calls == 0
+        compiler.compile(string='a { b: double(1px); }')
+        compiler.compile_many([{'string': 'a { b: double(1px); }'}] * 3)
+        with pytest.raises(sass.CompileError):
+            compiler.compile(string='a { b: fail(1px); }')
+        profiles = compiler.function_profiles
+        assert profiles['double'].calls == 4
+        assert profiles['fail'].calls == 1
+        assert sass.Compiler().function_profiles is None
+
 
 def test_stack_trace_formatting():
     try:
@@ -1683,6 +2988,328 @@ def test_import_css_string(tmpdir):
     assert out == 'body {\n  color: green; }\n'
 
 
+def test_compile_string_filename_hint(tmpdir):
+    tmpdir.join('src', 'lib', '_colors.scss').ensure().write('$c: red;')
+    source = "@import 'lib/colors';\na { b: $c; }\n"
+    hint = tmpdir.join('src', 'main.scss').strpath
+    assert not os.path.exists(hint)
+    with pytest.raises(sass.CompileError):
+        sass.compile(string=source)
+    assert sass.compile(string=source, filename_hint=hint) == (
+        'a {\n  b: red; }\n'
+    )
+    sass.check(string=source, filename_hint=hint)
+    with tmpdir.as_cwd():
+        css, source_map = sass.compile(
+            string=source, filename_hint='src/main.scss',
+            source_map_filename='main.css.map',
+            output_filename_hint='main.css',
+        )
+    assert css.endswith('/*# sourceMappingURL=main.css.map */')
+    assert json.loads(source_map)['sources'] == [
+        'src/main.scss', 'src/lib/_colors.scss',
+    ]
+    with pytest.raises(sass.CompileError) as excinfo:
+        sass.compile(string='a {', filename_hint=hint)
+    # libsass refers to it relative to the current working directory
+    assert os.path.relpath(hint) in str(excinfo.value)
+    result = sass.compile(
+        string=source, filename_hint=hint, output_type='result',
+    )
+    assert result.included_files == (
+        tmpdir.join('src', 'lib', '_colors.scss').strpath,
+    )
+    # Files modified just now aren't cached
+    colors = tmpdir.join('src', 'lib', '_colors.scss').strpath
+    os.utime(colors, (time.time() - 10,) * 2)
+    compile_cache = sass.CompileCache()
+    other_hint = tmpdir.join('src', 'other.scss').strpath
+    for filename_hint in hint, hint, other_hint:
+        sass.compile(
+            string=source, filename_hint=filename_hint,
+            compile_cache=compile_cache,
+        )
+    assert (compile_cache.hits, compile_cache.misses) == (1, 2)
+    with pytest.raises(TypeError):
+        sass.compile(filename='test/a.scss', filename_hint=hint)
+    with pytest.raises(TypeError):
+        sass.compile(string=source, filename_hint=b'main.scss')
+
+
+def test_compile_string_filename_hint_indented(tmpdir):
+    source = 'a\n  b: c\n'
+    hint = tmpdir.join('main.sass').strpath
+    # Its extension tells the syntax as that of a file does
+    assert sass.compile(string=source, filename_hint=hint) == (
+        'a {\n  b: c; }\n'
+    )
+    assert sass.compile(
+        string=source, filename_hint=hint, compile_cache=sass.CompileCache(),
+    ) == 'a {\n  b: c; }\n'
+    sass.check(string=source, filename_hint=hint)
+    with pytest.raises(sass.CompileError):
+        sass.compile(string=source, filename_hint=hint, indented=False)
+    with pytest.raises(sass.CompileError):
+        sass.compile(
+            string=source, filename_hint=tmpdir.join('main.scss').strpath,
+        )
+    assert sass.compile(
+        string=source, filename_hint=tmpdir.join('main.scss').strpath,
+        indented=True,
+    ) == 'a {\n  b: c; }\n'
+
+
+def test_disk_compile_cache_checkouts(tmpdir):
+    directory = tmpdir.join('cache').strpath
+    checkouts = tmpdir.join('one'), tmpdir.join('two', 'deeper')
+    for checkout in checkouts:
+        checkout.join('lib', '_b.scss').ensure().write('b { c: d; }')
+        checkout.join('main.scss').write('@import "b";')
+        # Files modified just now aren't cached yet
+        for path in 'lib/_b.scss', 'main.scss':
+            os.utime(checkout.join(path).strpath, (time.time() - 60,) * 2)
+    results = []
+    for checkout in checkouts:
+        # Another process, as far as the cache is concerned
+        cache = sass.DiskCompileCache(directory)
+        with checkout.as_cwd():
+            for kwargs in (
+                {'filename': 'main.scss'},
+                {'string': '@import "b";', 'filename_hint': 'main.scss'},
+            ):
+                result = sass.compile(
+                    include_paths=['lib'], compile_cache=cache,
+                    output_type='result', **kwargs
+                )
+                assert result.css == 'b {\n  c: d; }\n'
+                results.append(result)
+        results.append((cache.hits, cache.misses))
+    # The same sources in another directory hit the entries
+    assert results[2] == (0, 2)
+    assert results[5] == (2, 0)
+    with checkouts[1].as_cwd():
+        assert results[3].included_files == sass.compile(
+            filename='main.scss', include_paths=['lib'], output_type='result',
+        ).included_files
+    assert results[3].included_files[0] == checkouts[1].join('main.scss')
+    # Unless they differ
+    checkouts[1].join('lib', '_b.scss').write('b { c: e; }')
+    os.utime(
+        checkouts[1].join('lib', '_b.scss').strpath, (time.time() - 60,) * 2,
+    )
+    cache = sass.DiskCompileCache(directory)
+    with checkouts[1].as_cwd():
+        assert sass.compile(
+            filename='main.scss', include_paths=['lib'], compile_cache=cache,
+        ) == 'b {\n  c: e; }\n'
+    assert (cache.hits, cache.misses) == (0, 1)
+
+
 def test_custom_import_extensions_warning():
     with pytest.warns(FutureWarning):
         sass.compile(string='a{b: c}', custom_import_extensions=['.css'])
+
+
+def test_compile_output_file(tmpdir):
+    expected = 'a b {\n  color: blue; }\n'
+    out_file = tmpdir.join('out.css')
+    for output_file in out_file.strpath, pathlib.Path(out_file.strpath):
+        out_file.write('/* to be overwritten */' * 10)
+        assert sass.compile(
+            string='a { b { color: blue; } }', output_file=output_file,
+        ) is None
+        assert out_file.read() == expected
+    with open(out_file.strpath, 'wb') as f:
+        f.write(b'/* head */\n')
+        sass.compile(string='a { b { color: blue; } }', output_file=f)
+        sass.compile(string='a { b { color: blue; } }', output_file=f.fileno())
+    assert out_file.read() == '/* head */\n' + expected * 2
+    for f in io.BytesIO(), io.StringIO():
+        sass.compile(string='a { b { color: blue; } }', output_file=f)
+        assert f.getvalue() in (expected, expected.encode())
+    # A failed compile leaves the previous output alone
+    with pytest.raises(sass.CompileError):
+        sass.compile(string='a {', output_file=out_file.strpath)
+    assert out_file.read() == '/* head */\n' + expected * 2
+    with pytest.raises(OSError):
+        sass.compile(
+            string='a { b: c; }',
+            output_file=tmpdir.join('no', 'such', 'dir.css').strpath,
+        )
+    with pytest.raises(TypeError):
+        sass.compile(string='a { b: c; }', output_file=object())
+
+
+def test_compile_source_map_file(tmpdir):
+    out_file = tmpdir.join('a.scss.css')
+    map_file = tmpdir.join('a.scss.css.map')
+    css = sass.compile(
+        filename='test/a.scss',
+        source_map_filename='a.scss.css.map',
+        source_map_file=map_file.strpath,
+    )
+    assert css == A_EXPECTED_CSS_WITH_MAP
+    assert sass.compile(
+        filename='test/a.scss',
+        source_map_filename='a.scss.css.map',
+        output_file=out_file.strpath,
+        source_map_file=map_file.strpath,
+    ) is None
+    assert out_file.read() == A_EXPECTED_CSS_WITH_MAP
+    assert json.loads(map_file.read()) == json.loads(
+        sass.compile(
+            filename='test/a.scss', source_map_filename='a.scss.css.map',
+        )[1],
+    )
+    source_map = sass.compile(
+        filename='test/a.scss',
+        source_map_filename='a.scss.css.map',
+        output_file=out_file.strpath,
+    )
+    assert json.loads(source_map) == json.loads(map_file.read())
+    with pytest.raises(sass.CompileError):
+        sass.compile(filename='test/a.scss', source_map_file=map_file.strpath)
+
+
+class ConcurrentCompileTest(unittest.TestCase):
+
+    workers = 8
+
+    def _run_threads(self, target, count=64):
+        with concurrent.futures.ThreadPoolExecutor(self.workers) as executor:
+            return list(executor.map(target, range(count)))
+
+    def test_compile_string_threads(self):
+        def compile_one(i):
+            return sass.compile(
+                string=f'.a-{i} {{ width: {i}px + 1px; }}',
+                output_style='compressed',
+            )
+
+        results = self._run_threads(compile_one)
+        assert results == [
+            f'.a-{i}{{width:{i + 1}px}}\n' for i in range(64)
+        ]
+
+    def test_compile_filename_threads(self):
+        results = self._run_threads(
+            lambda _: sass.compile(filename='test/a.scss'),
+        )
+        assert results == [A_EXPECTED_CSS] * 64
+
+    def test_custom_functions_threads(self):
+        def thread_name():
+            return threading.current_thread().name
+
+        def compile_one(i):
+            return thread_name(), sass.compile(
+                string=f'a {{ content: identity({i}); b: name(); }}',
+                custom_functions={
+                    sass.SassFunction('identity', ('$x',), identity),
+                    sass.SassFunction('name', (), thread_name),
+                },
+                output_style='compressed',
+            )
+
+        for i, (name, css) in enumerate(self._run_threads(compile_one)):
+            assert css == f'a{{content:{i};b:{name}}}\n'
+
+    def test_custom_function_errors_threads(self):
+        def compile_one(i):
+            try:
+                sass.compile(
+                    string=f'a {{ content: raises_{i % 2}(); }}',
+                    custom_functions={
+                        'raises_0': raises,
+                        'raises_1': returns_error,
+                    },
+                )
+            except sass.CompileError as e:
+                return str(e)
+            raise AssertionError('expected to raise CompileError')
+
+        for i, msg in enumerate(self._run_threads(compile_one)):
+            if i % 2:
+                assert 'This is an error' in msg
+            else:
+                assert 'AssertionError: foo' in msg
+
+    def test_importers_threads(self):
+        def compile_one(i):
+            def importer(path):
+                return ((path, f'.{path} {{ width: {i}px; }}'),)
+
+            return sass.compile(
+                string='@import "x"; @import "y";',
+                importers=((0, importer),),
+                output_style='compressed',
+            )
+
+        results = self._run_threads(compile_one)
+        assert results == [
+            f'.x{{width:{i}px}}.y{{width:{i}px}}\n' for i in range(64)
+        ]
+
+    def test_shared_functions_threads(self):
+        # Stresses callbacks sharing functions, importers and a compiler,
+        # which run at the same time on the free-threaded build
+        functions = {
+            sass.SassFunction('identity', ('$x',), identity),
+            sass.SassFunction('dict', (), returns_py_dict),
+            sass.SassFunction('map', (), returns_map),
+        }
+        compiler = sass.Compiler(
+            custom_functions=functions,
+            importers=((0, lambda path: ((path, f'.{path} {{ a: b; }}'),)),),
+            output_style='compressed',
+        )
+
+        def compile_one(i):
+            string = (
+                f'@import "x{i}";'
+                f'a {{ b: identity({i}); c: map-get(dict(), foo); '
+                f'd: length(map()); }}'
+            )
+            if i % 2:
+                return compiler.compile(string=string)
+            css, = compiler.compile_many([{'string': string}], max_workers=1)
+            return css
+
+        results = self._run_threads(compile_one, count=512)
+        assert results == [
+            f'.x{i}{{a:b}}a{{b:{i};c:bar;d:1}}\n' for i in range(512)
+        ]
+
+    def test_gil_released_while_compiling(self):
+        ticks = []
+        in_compile = []
+        done = threading.Event()
+
+        def heartbeat():
+            while not done.is_set():
+                ticks.append(None)
+                time.sleep(0.001)
+
+        def mark():
+            in_compile.append(len(ticks))
+            return None
+
+        thread = threading.Thread(target=heartbeat)
+        thread.start()
+        try:
+            sass.compile(
+                string=(
+                    'a { b: mark(); }\n'
+                    '@for $i from 1 through 20000 {\n'
+                    '    .a-#{$i} { width: $i * 1px; }\n'
+                    '}\n'
+                    'c { d: mark(); }\n'
+                ),
+                custom_functions={'mark': mark},
+            )
+        finally:
+            done.set()
+            thread.join()
+        start, end = in_compile
+        # the heartbeat thread could run while libsass was busy
+        assert end - start > 10
@@ -8,6 +8,7 @@ import re
 import warnings
 
 from sass import compile
+from sass import compile_many
 
 __all__ = 'SUFFIXES', 'SUFFIX_PATTERN', 'Manifest', 'build_directory'
 
@@ -25,6 +26,7 @@ SUFFIX_PATTERN = re.compile(
 def build_directory(
     sass_path, css_path, output_style='nested',
     _root_sass=None, _root_css=None, strip_extension=False,
+    compile_cache=None,
 ):
     """Compiles all Sass/SCSS files in ``path`` to CSS.
 
@@ -37,17 +39,48 @@ def build_directory(
                          choose one of: ``'nested'`` (default), ``'expanded'``,
                          ``'compact'``, ``'compressed'``
     :type output_style: :class:`str`
+    :param compile_cache: an optional cache to answer the compiles of
+                          unchanged files from, e.g. a
+                          :class:`sass.DiskCompileCache` shared by CI runs
+    :type compile_cache: :class:`sass.CompileCache`,
+                         :class:`sass.DiskCompileCache`
     :returns: a dictionary of source filenames to compiled CSS filenames
     :rtype: :class:`collections.abc.Mapping`
 
     .. versionadded:: 0.6.0
        The ``output_style`` parameter.
 
+    .. versionadded:: 0.24.0
+       The ``compile_cache`` parameter.
+
     """
     if _root_sass is None or _root_css is None:
         _root_sass = sass_path
         _root_css = css_path
-    result = {}
+    targets = list(_find_build_targets(sass_path, css_path, strip_extension))
+    # Files are compiled in parallel, but written in order and up to the
+    # first error, as if they were compiled one by one
+    compile_many(
+        [
+            {'filename': sass_fullname, 'output_file': css_fullname}
+            for sass_fullname, css_fullname in targets
+        ],
+        output_style=output_style,
+        include_paths=[_root_sass],
+        compile_cache=compile_cache,
+    )
+    return {
+        os.path.relpath(sass_fullname, _root_sass):
+        os.path.relpath(css_fullname, _root_css)
+        for sass_fullname, css_fullname in targets
+    }
+
+
+def _find_build_targets(sass_path, css_path, strip_extension):
+    """Finds Sass/SCSS files to compile in ``sass_path``, and makes
+    directories to store compiled CSS files on the way.  Yields pairs of
+    (sass, css) paths.
+    """
     if not os.path.isdir(css_path):
         os.mkdir(css_path)
     for name in os.listdir(sass_path):
@@ -59,28 +92,12 @@ def build_directory(
             if strip_extension:
                 name, _ = os.path.splitext(name)
             css_fullname = os.path.join(css_path, name) + '.css'
-            css = compile(
-                filename=sass_fullname,
-                output_style=output_style,
-                include_paths=[_root_sass],
-            )
-            with open(
-                css_fullname, 'w', encoding='utf-8', newline='',
-            ) as css_file:
-                css_file.write(css)
-            result[os.path.relpath(sass_fullname, _root_sass)] = \
-                os.path.relpath(css_fullname, _root_css)
+            yield sass_fullname, css_fullname
         elif os.path.isdir(sass_fullname):
             css_fullname = os.path.join(css_path, name)
-            subresult = build_directory(
-                sass_fullname, css_fullname,
-                output_style=output_style,
-                _root_sass=_root_sass,
-                _root_css=_root_css,
-                strip_extension=strip_extension,
+            yield from _find_build_targets(
+                sass_fullname, css_fullname, strip_extension,
             )
-            result.update(subresult)
-    return result
 
 
 class Manifest:
@@ -218,7 +235,7 @@ class Manifest:
         else:
             return filename
 
-    def build(self, package_dir, output_style='nested'):
+    def build(self, package_dir, output_style='nested', compile_cache=None):
         """Builds the Sass/SCSS files in the specified :attr:`sass_path`.
         It finds :attr:`sass_path` and locates :attr:`css_path`
         as relative to the given ``package_dir``.
@@ -229,12 +246,19 @@ class Manifest:
                              choose one of: ``'nested'`` (default),
                              ``'expanded'``, ``'compact'``, ``'compressed'``
         :type output_style: :class:`str`
+        :param compile_cache: an optional cache to answer the compiles of
+                              unchanged files from
+        :type compile_cache: :class:`sass.CompileCache`,
+                             :class:`sass.DiskCompileCache`
         :returns: the set of compiled CSS filenames
         :rtype: :class:`frozenset`
 
         .. versionadded:: 0.6.0
            The ``output_style`` parameter.
 
+        .. versionadded:: 0.24.0
+           The ``compile_cache`` parameter.
+
         """
         sass_path = os.path.join(package_dir, self.sass_path)
         css_path = os.path.join(package_dir, self.css_path)
@@ -242,13 +266,17 @@ class Manifest:
             sass_path, css_path,
             output_style=output_style,
             strip_extension=self.strip_extension,
+            compile_cache=compile_cache,
         ).values()
         return frozenset(
             os.path.join(self.css_path, filename)
             for filename in css_files
         )
 
-    def build_one(self, package_dir, filename, source_map=False):
+    def build_one(
+        self, package_dir, filename, source_map=False, keep_css=False,
+        timeout=None,
+    ):
         """Builds one Sass/SCSS file.
 
         :param package_dir: the path of package directory
@@ -260,39 +288,55 @@ class Manifest:
                            followed by :file:`.map` suffix.
                            default is :const:`False`
         :type source_map: :class:`bool`
-        :returns: the filename of compiled CSS
-        :rtype: :class:`str`, :class:`basestring`
+        :param keep_css: whether to return the compiled CSS as well, so
+                         that it doesn't have to be read back from the
+                         written file.  default is :const:`False`
+        :type keep_css: :class:`bool`
+        :param timeout: optional number of seconds the compile may take
+        :type timeout: :class:`float`
+        :returns: the filename of compiled CSS, or a pair of it and the
+                  compiled CSS as :class:`bytes` if ``keep_css`` is set
+        :rtype: :class:`str`, :class:`basestring`, :class:`tuple`
 
         .. versionadded:: 0.4.0
            Added optional ``source_map`` parameter.
 
+        .. versionadded:: 0.24.0
+           Added optional ``keep_css`` and ``timeout`` parameters.
+
         """
         sass_filename, css_filename = self.resolve_filename(
             package_dir, filename,
         )
         root_path = os.path.join(package_dir, self.sass_path)
         css_path = os.path.join(package_dir, self.css_path, css_filename)
+        kwargs = {'timeout': timeout}
         if source_map:
             source_map_path = css_filename + '.map'
-            css, source_map = compile(
-                filename=sass_filename,
-                include_paths=[root_path],
+            kwargs.update(
                 source_map_filename=source_map_path,  # FIXME
+                source_map_file=source_map_path,
                 output_filename_hint=css_path,
             )
-        else:
-            css = compile(filename=sass_filename, include_paths=[root_path])
-            source_map_path = None
-            source_map = None
         css_folder = os.path.dirname(css_path)
         if not os.path.exists(css_folder):
             os.makedirs(css_folder)
-        with open(css_path, 'w', encoding='utf-8', newline='') as f:
-            f.write(css)
-        if source_map:
-            # Source maps are JSON, and JSON has to be UTF-8 encoded
-            with open(
-                source_map_path, 'w', encoding='utf-8', newline='',
-            ) as f:
-                f.write(source_map)
+        # libsass already encodes both in UTF-8, which JSON source maps
+        # have to be anyway, so they are written as they are
+        if keep_css:
+            css = compile(
+                filename=sass_filename,
+                include_paths=[root_path],
+                output_type='bytes',
+                **kwargs
+            )
+            with open(css_path, 'wb') as f:
+                f.write(css)
+            return css_filename, css
+        compile(
+            filename=sass_filename,
+            include_paths=[root_path],
+            output_file=css_path,
+            **kwargs
+        )
         return css_filename
@@ -66,6 +66,11 @@ The option can also be a mapping of package names to manifest dictionaries::
 .. versionadded:: 0.6.0
    Added ``--output-style``/``-s`` option to :class:`build_sass` command.
 
+.. versionadded:: 0.24.0
+   Added ``--cache-dir`` option to :class:`build_sass` command, which keeps
+   a :class:`sass.DiskCompileCache` so that unchanged files aren't compiled
+   again, e.g. by later CI runs.
+
 """
 import functools
 import os.path
@@ -77,6 +82,7 @@ from setuptools import Command
 from setuptools.command.sdist import sdist
 
 from .builder import Manifest
+from sass import DiskCompileCache
 from sass import OUTPUT_STYLES
 
 __all__ = 'build_sass', 'validate_manifests'
@@ -108,11 +114,17 @@ class build_sass(Command):
             'Coding style of the compiled result.  Choose one of ' +
             ', '.join(OUTPUT_STYLES),
         ),
+        (
+            'cache-dir=', None,
+            'Directory to cache compiled CSS in, which may be shared by '
+            'many builds',
+        ),
     ]
 
     def initialize_options(self):
         self.package_dir = None
         self.output_style = 'nested'
+        self.cache_dir = None
 
     def finalize_options(self):
         self.package_dir = {}
@@ -127,12 +139,16 @@ class build_sass(Command):
         self.distribution.sass_manifests = manifests
         package_data = self.distribution.package_data
         data_files = self.distribution.data_files or []
+        compile_cache = None
+        if self.cache_dir:
+            compile_cache = DiskCompileCache(self.cache_dir)
         for package_name, manifest in manifests.items():
             package_dir = self.get_package_dir(package_name)
             distutils.log.info("building '%s' sass", package_name)
             css_files = manifest.build(
                 package_dir,
                 output_style=self.output_style,
+                compile_cache=compile_cache,
             )
             map(distutils.log.info, css_files)
             package_data.setdefault(package_name, []).extend(css_files)
@@ -4,7 +4,6 @@
 """
 import collections.abc
 import logging
-import os.path
 
 from pkg_resources import resource_filename
 
@@ -75,6 +74,15 @@ class SassMiddleware:
                         the same format to :file:`setup.py` script's
                         ``package_dir`` option
     :type package_dir: :class:`collections.abc.Mapping`
+    :param timeout: optional number of seconds a compile may take.  a Sass
+                    file which takes longer is responded as it fails to
+                    compile, with :exc:`sass.CompileTimeout`.  it's
+                    checked only when libsass calls back into Python, so
+                    it doesn't protect the request workers from runaway
+                    sources like an endless ``@while`` loop.  compile
+                    untrusted sources on :class:`sass.ProcessPoolCompiler`
+                    instead.  see also :func:`sass.compile()`
+    :type timeout: :class:`float`
 
     .. versionchanged:: 0.4.0
        It creates also source map files with filenames followed by
@@ -84,11 +92,14 @@ class SassMiddleware:
        It logs syntax errors if exist during compilation to
        ``sassutils.wsgi.SassMiddleware`` logger with level ``ERROR``.
 
+    .. versionadded:: 0.24.0
+       Added ``timeout`` parameter.
+
     """
 
     def __init__(
         self, app, manifests, package_dir={},
-        error_status='200 OK',
+        error_status='200 OK', timeout=None,
     ):
         if not callable(app):
             raise TypeError(
@@ -103,6 +114,7 @@ class SassMiddleware:
                 repr(package_dir),
             )
         self.error_status = error_status
+        self.timeout = timeout
         self.package_dir = dict(package_dir)
         for package_name in self.manifests:
             if package_name in self.package_dir:
@@ -130,10 +142,12 @@ class SassMiddleware:
                     package_dir, css_filename,
                 )
                 try:
-                    result = manifest.build_one(
+                    _, css = manifest.build_one(
                         package_dir,
                         sass_filename,
                         source_map=True,
+                        keep_css=True,
+                        timeout=self.timeout,
                     )
                 except OSError:
                     break
@@ -154,16 +168,9 @@ class SassMiddleware:
                         b'; user-select: text; }',
                     ]
 
-                def read_file(path):
-                    with open(path, 'rb') as in_:
-                        while 1:
-                            chunk = in_.read(4096)
-                            if chunk:
-                                yield chunk
-                            else:
-                                break
+                # Serve what was just compiled instead of reading it back
                 start_response('200 OK', [('Content-Type', 'text/css')])
-                return read_file(os.path.join(package_dir, result))
+                return [css]
         return self.app(environ, start_response)
 
     @staticmethod
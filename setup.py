@@ -129,9 +129,13 @@ else:
 
 # Py_LIMITED_API does not work for pypy
 # https://foss.heptapod.net/pypy/pypy/issues/3173
-if not hasattr(sys, 'pypy_version_info'):
+# nor for the free-threaded build of CPython
+free_threaded = bool(distutils.sysconfig.get_config_var('Py_GIL_DISABLED'))
+if not hasattr(sys, 'pypy_version_info') and not free_threaded:
     py_limited_api = True
-    define_macros = [('Py_LIMITED_API', None)]
+    # The same version bdist_wheel tags the wheel with; _sass.c needs at
+    # least 3.4 for PyType_GetSlot()
+    define_macros = [('Py_LIMITED_API', f'0x03{sys.version_info[1]:02x}0000')]
 else:
     py_limited_api = False
     define_macros = []
@@ -184,7 +188,7 @@ class upload_doc(distutils.cmd.Command):
 
 cmdclass = {'upload_doc': upload_doc}
 
-if sys.version_info >= (3,) and platform.python_implementation() == 'CPython':
+if py_limited_api:
     try:
         import wheel.bdist_wheel
     except ImportError: